@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import json
+import logging
+import os
+import sys
+import time
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium import Scanarium, ScanariumError
+from scanarium.scanner_qr import decode_qr_codes
+from scanarium.scanner_qr_decoders import DECODERS
+del sys.path[0]
+
+logger = logging.getLogger(__name__)
+
+LABELS_FILE = 'labels.json'
+
+
+# Reads the images of the corpus. Returns a list of (file name, image,
+# expected data) tuples.
+def load_corpus(scanarium, corpus_dir):
+    with open(os.path.join(corpus_dir, LABELS_FILE), 'r') as f:
+        labels = json.load(f)
+
+    # Reading images through the image source, so images get loaded just like
+    # they would for scanning.
+    scanarium.set_config('scan', 'calibration_xml_file', '')
+    scanarium.set_config('scan', 'max_brightness', '')
+    ret = []
+    for file in sorted(labels):
+        scanarium.set_config('scan', 'source',
+                             'image:' + os.path.join(corpus_dir, file))
+        ret.append((file, scanarium.get_image(), sorted(labels[file])))
+    return ret
+
+
+def decode(scanarium, image, decoder_name):
+    try:
+        (codes, _) = decode_qr_codes(scanarium, image, [decoder_name])
+    except ScanariumError as e:
+        if e.code != 'SE_SCAN_NO_QR_CODE':
+            raise
+        codes = []
+    return sorted(code.data.decode('ascii', errors='replace')
+                  for code in codes)
+
+
+def get_percentile(sorted_values, percentile):
+    idx = min(int(len(sorted_values) * percentile / 100),
+              len(sorted_values) - 1)
+    return sorted_values[idx]
+
+
+def benchmark_decoder(scanarium, corpus, decoder_name, repetitions):
+    durations = []
+    decoded = 0
+    missed = []
+    for (file, image, expected) in corpus:
+        for repetition in range(repetitions):
+            start = time.time()
+            data = decode(scanarium, image, decoder_name)
+            durations.append(time.time() - start)
+        if data == expected:
+            decoded += 1
+        else:
+            missed.append(file)
+
+    durations.sort()
+    return {
+        'images': len(corpus),
+        'decoded': decoded,
+        'decode_rate': decoded / len(corpus),
+        'mean_ms': sum(durations) / len(durations) * 1000,
+        'p95_ms': get_percentile(durations, 95) * 1000,
+        'missed': missed,
+    }
+
+
+def benchmark(scanarium, corpus_dir, decoder_names, repetitions):
+    corpus = load_corpus(scanarium, corpus_dir)
+    if not corpus:
+        raise ScanariumError('SE_BENCHMARK_EMPTY_CORPUS',
+                             'The corpus "{corpus}" does not label any image',
+                             {'corpus': corpus_dir})
+
+    ret = {}
+    for decoder_name in decoder_names:
+        logger.info(f'Benchmarking QR decoder "{decoder_name}"')
+        try:
+            ret[decoder_name] = benchmark_decoder(
+                scanarium, corpus, decoder_name, repetitions)
+        except ScanariumError as e:
+            if e.code != 'SE_QR_DECODER_UNAVAILABLE':
+                raise
+            ret[decoder_name] = {'error': e.message}
+    return ret
+
+
+def register_arguments(scanarium, parser):
+    parser.add_argument('--decoder', action='append', dest='decoders',
+                        choices=list(DECODERS),
+                        help='Benchmark only this decoder. This option can '
+                        'be given multiple times. Default: all decoders')
+    parser.add_argument('--repetitions', type=int, default=3,
+                        help='Number of times to decode each image')
+    parser.add_argument('CORPUS',
+                        help='Directory holding the images and a '
+                        f'`{LABELS_FILE}` that maps each image\'s file name '
+                        'to the list of the data of its QR codes')
+
+
+if __name__ == "__main__":
+    scanarium = Scanarium()
+    args = scanarium.handle_arguments(
+        'Benchmarks decode rate and latency of QR decoders on a labeled '
+        'corpus of images', register_arguments)
+    scanarium.call_guarded(benchmark, args.CORPUS,
+                           args.decoders or list(DECODERS), args.repetitions)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium import Scanarium, ScanariumError
+del sys.path[0]
+
+logger = logging.getLogger(__name__)
+
+
+# Reads the images of the corpus. Returns a list of (file name, image) pairs.
+def load_corpus(scanarium, corpus_dir):
+    # Reading images through the image source, so images get loaded just like
+    # they would for scanning.
+    scanarium.set_config('scan', 'calibration_xml_file', '')
+    scanarium.set_config('scan', 'max_brightness', '')
+    ret = []
+    for file in sorted(os.listdir(corpus_dir)):
+        scanarium.set_config('scan', 'source',
+                             'image:' + os.path.join(corpus_dir, file))
+        try:
+            ret.append((file, scanarium.get_image()))
+        except ScanariumError as e:
+            logger.warning(f'Skipping "{file}": {e}')
+    return ret
+
+
+def get_percentile(sorted_values, percentile):
+    idx = min(int(len(sorted_values) * percentile / 100),
+              len(sorted_values) - 1)
+    return sorted_values[idx]
+
+
+# Returns the biggest distance between corresponding corners
+def get_deviation(points, reference_points):
+    points = np.array(sorted(points.tolist()))
+    reference_points = np.array(sorted(reference_points.tolist()))
+    return float(np.linalg.norm(points - reference_points, axis=1).max())
+
+
+def benchmark_setting(scanarium, corpus, pyramid_heights, repetitions,
+                      reference):
+    scanarium.set_config('scan', 'rectification_pyramid_heights',
+                         pyramid_heights)
+    durations = []
+    found = {}
+    for (file, image) in corpus:
+        for repetition in range(repetitions):
+            start = time.time()
+            try:
+                points = scanarium.rectify_to_biggest_rect(
+                    image, yield_only_points=True)
+            except ScanariumError:
+                points = None
+            durations.append(time.time() - start)
+        if points is not None:
+            found[file] = points
+
+    deviations = [get_deviation(points, reference[file])
+                  for (file, points) in found.items() if file in reference]
+    durations.sort()
+    return (found, {
+        'images': len(corpus),
+        'found': len(found),
+        'mean_ms': sum(durations) / len(durations) * 1000,
+        'p95_ms': get_percentile(durations, 95) * 1000,
+        'max_corner_deviation': max(deviations, default=None),
+    })
+
+
+def benchmark(scanarium, corpus_dir, pyramid_heights_list, repetitions):
+    corpus = load_corpus(scanarium, corpus_dir)
+    if not corpus:
+        raise ScanariumError('SE_BENCHMARK_EMPTY_CORPUS',
+                             'The corpus "{corpus}" holds no readable images',
+                             {'corpus': corpus_dir})
+
+    # Corners found without pyramid levels are the reference for the
+    # deviation of corners.
+    ret = {}
+    reference = None
+    for pyramid_heights in [''] + pyramid_heights_list:
+        logger.info(f'Benchmarking pyramid heights "{pyramid_heights}"')
+        (found, ret[pyramid_heights]) = benchmark_setting(
+            scanarium, corpus, pyramid_heights, repetitions, reference or {})
+        if reference is None:
+            reference = found
+    return ret
+
+
+def register_arguments(scanarium, parser):
+    parser.add_argument('--pyramid-heights', action='append', default=[],
+                        metavar='HEIGHTS',
+                        help='Comma separated list of pyramid heights to '
+                        'benchmark (See `scan.rectification_pyramid_heights`'
+                        '). This option can be given multiple times. Finding '
+                        'contours without pyramid gets always benchmarked.')
+    parser.add_argument('--repetitions', type=int, default=3,
+                        help='Number of times to rectify each image')
+    parser.add_argument('CORPUS', help='Directory holding the images')
+
+
+if __name__ == "__main__":
+    scanarium = Scanarium()
+    args = scanarium.handle_arguments(
+        'Benchmarks finding the sheet for rectification with different '
+        'pyramid heights', register_arguments)
+    scanarium.call_guarded(benchmark, args.CORPUS, args.pyramid_heights,
+                           args.repetitions)
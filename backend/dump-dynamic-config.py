@@ -16,8 +16,37 @@ del sys.path[0]
 
 logger = logging.getLogger(__name__)
 
+WHITELISTED_CGI_FIELDS = {'file': 1, 'version': 2}
 
-def dump(scanarium, file):
+
+def get_version(stat):
+    return '%x-%x' % (stat.st_mtime_ns, stat.st_size)
+
+
+# Returns the dumped file as a `{'version': ..., 'modified': ...}` dict. If
+# the file's version differs from `version`, the dict additionally holds the
+# file's unparsed JSON as `content`.
+#
+# Files only change by getting replaced (See `Dumper.dump_text`), so
+# modification time and size make for a cheap version.
+def dump_conditional(local_file, version):
+    with open(local_file, 'rb') as f:
+        current_version = get_version(os.fstat(f.fileno()))
+        ret = {
+            'version': current_version,
+            'modified': current_version != version,
+        }
+        if ret['modified']:
+            ret['content'] = f.read().decode('utf-8')
+    return ret
+
+
+# Dumps the dynamic config `file`.
+#
+# If `version` is empty, the parsed file gets returned. Otherwise, the result
+# of `dump_conditional`. This allows polling clients to skip transferring and
+# parsing unchanged files.
+def dump(scanarium, file, version=''):
     local_file = None
     if file == 'dynamic/command-log.json':
         local_file = os.path.join(
@@ -39,6 +68,8 @@ def dump(scanarium, file):
                              'Dynamic config "{file}" is not available',
                              {'file': file})
     try:
+        if version:
+            return dump_conditional(local_file, version)
         with open(local_file, 'r') as f:
             return json.load(f)
     except Exception:
@@ -49,6 +80,10 @@ def dump(scanarium, file):
 
 def register_arguments(scanarium, parser):
     parser.add_argument('FILE', help='Path of the file to dump')
+    parser.add_argument('VERSION', nargs='?', default='',
+                        help='If not empty, the version of FILE that the '
+                        'caller already has. The file\'s content is then '
+                        'only dumped if its version differs.')
 
 
 if __name__ == "__main__":
@@ -56,6 +91,6 @@ if __name__ == "__main__":
     args = scanarium.handle_arguments(
         'Dumps a config file',
         register_arguments,
-        whitelisted_cgi_fields={'file': 1})
+        whitelisted_cgi_fields=WHITELISTED_CGI_FIELDS)
 
-    scanarium.call_guarded(dump, args.FILE)
+    scanarium.call_guarded(dump, args.FILE, args.VERSION)
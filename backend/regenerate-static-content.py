@@ -4,6 +4,7 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 
 import copy
+import hashlib
 import os
 import json
 import locale
@@ -11,6 +12,7 @@ import logging
 import re
 import shutil
 import sys
+import threading
 import xml.etree.ElementTree as ET
 import qrcode
 
@@ -20,6 +22,11 @@ import numpy as np
 SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, SCANARIUM_DIR_ABS)
 from scanarium import Scanarium, ScanariumError
+from scanarium.BuildCache import BuildCache
+from scanarium.Compressor import Compressor
+from scanarium.InkscapeShell import InkscapeShell
+from scanarium.JavaScriptBundler import JavaScriptBundler
+from scanarium.JobRunner import JobRunner
 del sys.path[0]
 
 logger = logging.getLogger(__name__)
@@ -68,6 +75,32 @@ SVG_VARIANTS = [key for key in SVG_VARIANT_SETTINGS.keys() if key]
 
 LATEST_DECORATION_VERSION = None
 
+# Files we generate directly in Python (as opposed to through external
+# programs) depend on this script, so we use it as source for them.
+GENERATOR_FILE = os.path.abspath(__file__)
+
+BUILD_CACHE = None
+
+SVG_TREES = {}
+SVG_TREES_LOCK = threading.Lock()
+
+QR_PATHS = {}
+QR_PATHS_LOCK = threading.Lock()
+
+SCRIPT_TAG_PATTERN = re.compile(
+    r'^[ \t]*<script src="(javascript/[^"]*)"></script>[ \t]*\n', re.MULTILINE)
+
+BUNDLE_HEADER = '\n'.join([
+    '// This file is part of Scanarium https://scanarium.com/ and licensed '
+    'under the',
+    '// GNU Affero General Public License v3.0 (See LICENSE.md)',
+    '// SPDX-License-Identifier: AGPL-3.0-only',
+    '//',
+    '// Generated by regenerate-static-content from the files in '
+    '`../javascript`.',
+    '// Do not edit.',
+])
+
 
 def get_latest_decoration_version(scanarium):
     global LATEST_DECORATION_VERSION
@@ -85,14 +118,103 @@ def get_latest_decoration_version(scanarium):
     return LATEST_DECORATION_VERSION
 
 
+INKSCAPE_SHELLS = []
+INKSCAPE_SHELLS_LOCK = threading.Lock()
+INKSCAPE_SHELLS_LOCAL = threading.local()
+
+
+def close_inkscape_shells():
+    with INKSCAPE_SHELLS_LOCK:
+        while INKSCAPE_SHELLS:
+            INKSCAPE_SHELLS.pop().close()
+
+
+def get_inkscape_shell(scanarium):
+    # Shells are not thread-safe, so each job thread gets its own shell. As
+    # job threads get reused, each shell serves many jobs.
+    shell = getattr(INKSCAPE_SHELLS_LOCAL, 'shell', None)
+    if shell is None:
+        timeout = scanarium.get_config('general', 'external_program_timeout',
+                                       kind='int')
+        shell = InkscapeShell(
+            [scanarium.get_config('programs', 'inkscape')], timeout)
+        INKSCAPE_SHELLS_LOCAL.shell = shell
+        with INKSCAPE_SHELLS_LOCK:
+            if not INKSCAPE_SHELLS:
+                scanarium.register_for_cleanup(close_inkscape_shells)
+            INKSCAPE_SHELLS.append(shell)
+    return shell
+
+
+def get_export_file_mtimes(arguments):
+    ret = {}
+    for argument in arguments:
+        match = re.match('^--export-(png|pdf)=(.*)$', argument)
+        if match:
+            file = match.group(2)
+            ret[file] = os.stat(file).st_mtime_ns \
+                if os.path.exists(file) else None
+    return ret
+
+
+def run_inkscape_shell(scanarium, arguments):
+    # Inkscape's shell mode does not report failures, so we check that all
+    # requested exports got (re)written.
+    mtimes_before = get_export_file_mtimes(arguments)
+    ret = get_inkscape_shell(scanarium).run(arguments)
+    mtimes_after = get_export_file_mtimes(arguments)
+    for file, mtime_before in mtimes_before.items():
+        mtime_after = mtimes_after[file]
+        if mtime_after is None or mtime_after == mtime_before:
+            raise ScanariumError(
+                'SE_RETURN_VALUE', 'The command "{command}" did not return 0',
+                {'command': str(arguments)},
+                private_parameters=ret)
+    return ret
+
+
 def run_inkscape(scanarium, arguments):
-    command = [
-        scanarium.get_config('programs', 'inkscape'),
-        '--without-gui',
-        '--export-text-to-path',
-    ]
-    command += arguments
-    return scanarium.run(command)
+    arguments = ['--export-text-to-path'] + arguments
+    backend = scanarium.get_config('cgi:regenerate-static-content',
+                                   'inkscape_backend')
+    if backend == 'shell':
+        ret = run_inkscape_shell(scanarium, arguments)
+    elif backend == 'process':
+        command = [
+            scanarium.get_config('programs', 'inkscape'),
+            '--without-gui',
+        ]
+        command += arguments
+        ret = scanarium.run(command)
+    else:
+        raise ScanariumError(
+            'SE_REGENERATE_UNKNOWN_INKSCAPE_BACKEND',
+            'Unknown Inkscape backend "{backend}"', {'backend': backend})
+    return ret
+
+
+def file_needs_update(target, sources, force, extra=None):
+    return BUILD_CACHE.needs_update(target, sources, extra, force)
+
+
+def mark_updated(target):
+    BUILD_CACHE.mark_updated(target)
+
+
+def get_tool_version(program):
+    return BUILD_CACHE.get_tool_version(program)
+
+
+def generate_thumbnail(scanarium, dir, file, force, level=[]):
+    source = os.path.join(dir, file)
+    target = os.path.join(dir, file.rsplit('.', 1)[0] + '-thumb.jpg')
+    extra = {
+        'level': level,
+        'convert': get_tool_version('convert'),
+    }
+    if file_needs_update(target, [source], force, extra):
+        scanarium.generate_thumbnail(dir, file, force=True, level=level)
+        mark_updated(target)
 
 
 def assert_directory(dir):
@@ -203,6 +325,8 @@ def generate_adapted_mask_source(scanarium, tree, target, adapt_stroke_width):
         return ';'.join([adapt_style_element(style_element)
                          for style_element in style.split(';')])
 
+    own_svg_children(tree, lambda child: child.get('id') == 'Mask' or
+                     child.find('.//*[@id="Mask"]') is not None)
     for element in tree.findall('.//*[@id="Mask"]//'):
         style = element.get('style')
         if style:
@@ -220,7 +344,17 @@ def regenerate_mask_variant(
         dir, f'{name}-mask-{variant_name}', 'png', decoration_version)
     adapted_source = target[:-4] + '.svg'
 
-    if scanarium.file_needs_update(adapted_source, sources, force):
+    filter_sources, filter_extra = get_svg_filter_inputs(scanarium, 'fallback')
+    extra = {
+        'filter': filter_extra,
+        'adapt_stroke_width': adapt_stroke_width,
+        'stroke_offset': scanarium.get_config('mask', 'stroke_offset'),
+        'stroke_color': scanarium.get_config('mask', 'stroke_color',
+                                             allow_empty=True),
+    }
+    if file_needs_update(adapted_source,
+                         sources + filter_sources + [GENERATOR_FILE], force,
+                         extra):
         variant = ''
         localizer = scanarium.get_localizer('fallback')
         show_only_variant(tree, variant)
@@ -229,9 +363,14 @@ def regenerate_mask_variant(
                         decoration_version, '../..')
         generate_adapted_mask_source(scanarium, tree, adapted_source,
                                      adapt_stroke_width)
+        mark_updated(adapted_source)
 
-    if scanarium.file_needs_update(target, [adapted_source], force):
-        dpi = scanarium.get_config('mask', 'dpi', kind='int')
+    dpi = scanarium.get_config('mask', 'dpi', kind='int')
+    extra = {
+        'dpi': dpi,
+        'inkscape': get_tool_version('inkscape'),
+    }
+    if file_needs_update(target, [adapted_source], force, extra):
         contour_area = get_svg_export_area_param_contour_inner(
             scanarium, adapted_source)
         inkscape_args = [
@@ -244,6 +383,7 @@ def regenerate_mask_variant(
             adapted_source,
         ]
         run_inkscape(scanarium, inkscape_args)
+        mark_updated(target)
     return target
 
 
@@ -261,19 +401,36 @@ def crop(file):
         }
 
 
-def regenerate_mask(scanarium, dir, scene, name, decoration_version, force):
-    unadapted_mask_png = regenerate_mask_variant(
+def regenerate_mask_json(scanarium, runner, unadapted_mask_job,
+                         effective_mask_job, force):
+    unadapted_mask_png = runner.get_result(unadapted_mask_job)
+    effective_mask_png = runner.get_result(effective_mask_job)
+
+    effective_mask_json = effective_mask_png.rsplit('.', 1)[0] + '.json'
+    if file_needs_update(effective_mask_json,
+                         [unadapted_mask_png, GENERATOR_FILE], force):
+        scanarium.dump_json(effective_mask_json, crop(unadapted_mask_png))
+        mark_updated(effective_mask_json)
+
+
+def regenerate_mask(scanarium, runner, dir, scene, name, decoration_version,
+                    force):
+    unadapted_mask_job = runner.add(
+        ('mask', dir, decoration_version, 'unadapted'),
+        regenerate_mask_variant,
         scanarium, dir, scene, name, decoration_version, force,
         variant_name='unadapted', adapt_stroke_width=False)
 
-    effective_mask_png = regenerate_mask_variant(
+    effective_mask_job = runner.add(
+        ('mask', dir, decoration_version, 'effective'),
+        regenerate_mask_variant,
         scanarium, dir, scene, name, decoration_version, force,
         variant_name='effective', adapt_stroke_width=True)
 
-    effective_mask_json = effective_mask_png.rsplit('.', 1)[0] + '.json'
-    if scanarium.file_needs_update(
-            effective_mask_json, [unadapted_mask_png], force):
-        scanarium.dump_json(effective_mask_json, crop(unadapted_mask_png))
+    runner.add(('mask-json', dir, decoration_version), regenerate_mask_json,
+               scanarium, runner, unadapted_mask_job, effective_mask_job,
+               force,
+               dependencies=[unadapted_mask_job, effective_mask_job])
 
 
 def read_keywords(dir, language):
@@ -325,11 +482,17 @@ def get_enriched_metadata(scanarium, metadata={}):
     return ret
 
 
-def embed_metadata(scanarium, target, metadata):
+def get_embedded_metadata(scanarium, metadata):
+    ret = None
     if scanarium.get_config('cgi:regenerate-static-content',
                             'embed_metadata', kind='boolean'):
-        enriched_metadata = get_enriched_metadata(scanarium, metadata)
+        ret = get_enriched_metadata(scanarium, metadata)
+    return ret
+
 
+def embed_metadata(scanarium, target, metadata):
+    enriched_metadata = get_embedded_metadata(scanarium, metadata)
+    if enriched_metadata is not None:
         scanarium.embed_metadata(target, enriched_metadata)
 
 
@@ -354,7 +517,30 @@ def generate_pdf(scanarium, dir, file, force, metadata={}):
         # `convert` and colleagues can figure out the expected file format
         if format in ['pdf', 'png']:
             source = svg_source
-            if scanarium.file_needs_update(target, [source], force):
+            program = 'inkscape'
+        else:
+            source = os.path.join(dir, file.rsplit('.', 1)[0] + '.png')
+            program = 'convert'
+            if not scanarium.get_config('cgi:regenerate-static-content',
+                                        'generate_png', kind='boolean'):
+                raise ScanariumError(
+                    'SE_REGENERATE_NO_SOURCE_FOR_TARGET',
+                    'You need to enable '
+                    '`cgi:regenerate-static-content.generate_png` to generate '
+                    'the target file {target_file}.',
+                    {'source_file': source, 'target_file': target})
+        extra = {
+            'dpi': dpi,
+            'quality': quality,
+            program: get_tool_version(program),
+            'metadata': get_embedded_metadata(scanarium, metadata),
+        }
+        if extra['metadata'] is not None:
+            extra['exiftool'] = get_tool_version('exiftool')
+        needs_update = file_needs_update(target, [source], force, extra)
+
+        if format in ['pdf', 'png']:
+            if needs_update:
                 inkscape_args = [
                     '--export-area-page',
                     f'--export-dpi={dpi}',
@@ -369,16 +555,7 @@ def generate_pdf(scanarium, dir, file, force, metadata={}):
             if format == 'pdf':
                 pdf_name = target
         else:
-            source = os.path.join(dir, file.rsplit('.', 1)[0] + '.png')
-            if not scanarium.get_config('cgi:regenerate-static-content',
-                                        'generate_png', kind='boolean'):
-                raise ScanariumError(
-                    'SE_REGENERATE_NO_SOURCE_FOR_TARGET',
-                    'You need to enable '
-                    '`cgi:regenerate-static-content.generate_png` to generate '
-                    'the target file {target_file}.',
-                    {'source_file': source, 'target_file': target})
-            if scanarium.file_needs_update(target, [source], force):
+            if needs_update:
                 command = [
                     scanarium.get_config('programs', 'convert'),
                     source,
@@ -390,9 +567,10 @@ def generate_pdf(scanarium, dir, file, force, metadata={}):
                     target_tmp
                     ]
                 scanarium.run(command)
-        if scanarium.file_needs_update(target, [source], force):
+        if needs_update:
             embed_metadata(scanarium, target_tmp, metadata)
             shutil.move(target_tmp, target)
+            mark_updated(target)
     return pdf_name
 
 
@@ -411,30 +589,38 @@ def register_svg_namespaces():
         ET.register_namespace(k, v)
 
 
-def abbreviate_qr_data(scanarium, data):
-    prefix = ''
+def get_qr_mappings(scanarium):
+    # Yields pairs of prefix and file for the configured QR code mappings.
+    # `file` is None for mappings without a file.
     mapping_specs = scanarium.get_config('qr-code', 'mappings',
                                          allow_empty=True)
     if mapping_specs:
         for mapping_spec in mapping_specs.split(','):
-            if not prefix:
-                mapping_parts = mapping_spec.split('@')
-                prefix_candidate = mapping_parts[0].strip()
-                if len(mapping_parts) == 1:
-                    prefix = prefix_candidate
-                else:
-                    file = mapping_parts[1].strip()
-                    if file.startswith('%CONF_DIR%'):
-                        file = os.path.join(scanarium.get_config_dir_abs(),
-                                            file[11:])
+            mapping_parts = mapping_spec.split('@')
+            prefix = mapping_parts[0].strip()
+            file = None
+            if len(mapping_parts) > 1:
+                file = mapping_parts[1].strip()
+                if file.startswith('%CONF_DIR%'):
+                    file = os.path.join(scanarium.get_config_dir_abs(),
+                                        file[11:])
+            yield (prefix, file)
 
-                    with open(file, 'rt') as f:
-                        code_map = json.load(f)
 
-                    for k, v in code_map.items():
-                        if not prefix and data == v:
-                            prefix = prefix_candidate
-                            data = k
+def abbreviate_qr_data(scanarium, data):
+    prefix = ''
+    for prefix_candidate, file in get_qr_mappings(scanarium):
+        if not prefix:
+            if file is None:
+                prefix = prefix_candidate
+            else:
+                with open(file, 'rt') as f:
+                    code_map = json.load(f)
+
+                for k, v in code_map.items():
+                    if not prefix and data == v:
+                        prefix = prefix_candidate
+                        data = k
 
     if prefix:
         data = prefix + data
@@ -442,29 +628,97 @@ def abbreviate_qr_data(scanarium, data):
     return data
 
 
-def get_qr_path_string(scanarium, x, y, x_unit, y_unit, data):
-    ret = ''
+def get_qr_matrix(scanarium, data):
+    # Computing QR codes is slow, as qrcode tries all mask patterns in pure
+    # Python. So we persist the computed module matrices in the build cache
+    # directory. This also keeps the QR codes stable across qrcode versions.
+    name = hashlib.sha256(data.encode()).hexdigest()
+    matrix_file = os.path.join(scanarium.get_build_cache_dir_abs(),
+                               'qr-codes', name + '.json')
+    try:
+        with open(matrix_file, 'r') as f:
+            cached = json.load(f)
+        if cached['data'] == data:
+            return [[module == '1' for module in row]
+                    for row in cached['matrix']]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    qr = qrcode.QRCode(box_size=1, border=0,
+                       error_correction=qrcode.constants.ERROR_CORRECT_L)
+    qr.add_data(data)
+    matrix = qr.get_matrix()
+    scanarium.dump_json(matrix_file, {
+        'data': data,
+        'matrix': [''.join('1' if module else '0' for module in row)
+                   for row in matrix],
+    })
+    return matrix
+
+
+def get_qr_relative_path_string(matrix, x_unit, y_unit):
+    # Returns the position (in modules) of the first rectangle and a path
+    # string that draws all rectangles relative to that position. So the path
+    # string does not depend on the QR code's position and can get reused.
+    #
+    # Each row's horizontally adjacent dark modules get merged into a single
+    # rectangle. This keeps both the SVG and Inkscape's rendering work small.
+    start = None
+    commands = []
+    cursor_i = 0
+    cursor_j = 0
+    for j, row in enumerate(matrix):
+        i = 0
+        while i < len(row):
+            if row[i]:
+                run_start = i
+                while i < len(row) and row[i]:
+                    i += 1
+                width = (i - run_start) * x_unit
+                if start is None:
+                    start = (run_start, j)
+                else:
+                    commands.append(f'm {((run_start - cursor_i) * x_unit):f} '
+                                    f'{((j - cursor_j) * y_unit):f}')
+                commands.append(f'h {width:f} v {y_unit:f} h {-width:f} z')
+                cursor_i = run_start
+                cursor_j = j
+            else:
+                i += 1
+    return (start, ' '.join(commands))
 
+
+def get_qr_path_string(scanarium, x, y, x_unit, y_unit, data):
     # While qrcode allows to generate an SVG path element through
     # qrcode.image.svg.SvgPathImage, its's interface is not a close match
     # here. Also the unit setting is weird as dimensions get unconditionally
     # divided by 10. And finally, Python's qrcode libraries are not too active
     # these days, so we would not want to tie us too closely to any of
-    # them. So we do the image -> svg transformation manually, as it's simple
+    # them. So we do the matrix -> svg transformation manually, as it's simple
     # enough, gives us more flexibility and untangles us from qrcode
     # internals.
 
     data = abbreviate_qr_data(scanarium, data)
-    data_image = qrcode.make(data, box_size=1, border=0,
-                             error_correction=qrcode.constants.ERROR_CORRECT_L)
-    width = data_image.width
-    height = data_image.height
-    dot = f'h {x_unit:f} v {y_unit:f} h {-x_unit:f} Z'
-    for j in range(0, height):
-        for i in range(0, width):
-            if data_image.getpixel((i, j)) == 0:
-                ret += f'M {(x+i*x_unit):f} {(y-(height-j-1)*y_unit):f} {dot} '
 
+    # The same QR codes get used for all languages, so we reuse the path
+    # strings.
+    key = (data, x_unit, y_unit)
+    with QR_PATHS_LOCK:
+        cached = QR_PATHS.get(key, None)
+    if cached is None:
+        matrix = get_qr_matrix(scanarium, data)
+        cached = (len(matrix),) + get_qr_relative_path_string(
+            matrix, x_unit, y_unit)
+        with QR_PATHS_LOCK:
+            QR_PATHS[key] = cached
+    (height, start, relative_path) = cached
+
+    ret = ''
+    if start is not None:
+        # (x, y) is the position of the bottom-left module.
+        start_x = x + start[0] * x_unit
+        start_y = y - (height - start[1] - 1) * y_unit
+        ret = f'M {start_x:f} {start_y:f} {relative_path}'
     return ret
 
 
@@ -517,6 +771,27 @@ def localize_command_parameter_variant(localizer, command, parameter, variant):
             localized_parameter_with_variant)
 
 
+def get_svg_filter_inputs(scanarium, language):
+    # Returns the sources and extra build cache inputs that `filter_svg_tree`
+    # depends on besides the tree itself.
+    sources = []
+    l10n_file = os.path.join(scanarium.get_localization_dir_abs(),
+                             f'{language}.json')
+    if os.path.isfile(l10n_file):
+        sources.append(l10n_file)
+
+    mappings = []
+    for prefix, file in get_qr_mappings(scanarium):
+        mappings.append(prefix)
+        if file is not None:
+            sources.append(file)
+
+    extra = {
+        'qr_mappings': mappings,
+    }
+    return (sources, extra)
+
+
 def filter_svg_tree(scanarium, tree, command, parameter, variant, localizer,
                     command_label, parameter_label, decoration_version,
                     href_adjustment=None):
@@ -547,7 +822,12 @@ def filter_svg_tree(scanarium, tree, command, parameter, variant, localizer,
             text = localizer.localize(text, template_parameters)
         return text
 
-    for element in tree.iter():
+    style_enforcings = {}
+
+    def filter_element(element):
+        # Returns the filtered text, tail, and attributes of `element` without
+        # modifying `element`.
+        nonlocal style_enforcings
         if element.tag == '{http://www.w3.org/2000/svg}g':
             if element.get('{http://www.inkscape.org/namespaces/inkscape}'
                            'groupmode') == 'layer':
@@ -557,8 +837,9 @@ def filter_svg_tree(scanarium, tree, command, parameter, variant, localizer,
                     .get('layer-settings', {})\
                     .get(layer_name, {})
 
-        element.text = filter_text(element.text)
-        element.tail = filter_text(element.tail)
+        text = filter_text(element.text)
+        tail = filter_text(element.tail)
+        attrib = {}
         for key in element.keys():
             value = filter_text(element.get(key))
             if key == 'style' and value is not None:
@@ -579,8 +860,33 @@ def filter_svg_tree(scanarium, tree, command, parameter, variant, localizer,
                 if value and not value.startswith('/') and '://' not in value \
                         and href_adjustment:
                     value = href_adjustment + '/' + value
+            attrib[key] = value
+        return (text, tail, attrib)
+
+    def needs_change(element, filtered):
+        # qr-pixels get expanded below, so they need changes too.
+        return filtered != (element.text, element.tail, element.attrib) \
+            or 'qr-pixel' in element.attrib
+
+    def apply_filtered(element, filtered):
+        element.text, element.tail, attrib = filtered
+        for key, value in attrib.items():
             element.set(key, value)
 
+    # The root's children may be shared with other trees (See
+    # `copy_svg_tree`). So we only clone those children that need changes.
+    root = tree.getroot()
+    apply_filtered(root, filter_element(root))
+    for index, child in enumerate(list(root)):
+        elements = list(child.iter())
+        filtered = [filter_element(element) for element in elements]
+        if any(needs_change(element, element_filtered)
+               for element, element_filtered in zip(elements, filtered)):
+            child = copy.deepcopy(child)
+            root[index] = child
+            for element, element_filtered in zip(child.iter(), filtered):
+                apply_filtered(element, element_filtered)
+
     for qr_element in list(tree.iter("{http://www.w3.org/2000/svg}rect")):
         qr_pixel = qr_element.attrib.get('qr-pixel', None)
         if qr_pixel is not None:
@@ -633,7 +939,10 @@ def extract_variants(tree):
 
 
 def show_only_variant(tree, variant):
-    for layer in extract_layers(tree):
+    root = tree.getroot()
+    for index, layer in enumerate(list(root)):
+        if layer.tag != '{http://www.w3.org/2000/svg}g':
+            continue
         layer_variant = extract_variant_from_layer(layer)
         if layer_variant in SVG_VARIANTS:
             visible = layer_variant == variant
@@ -643,7 +952,14 @@ def show_only_variant(tree, variant):
                 k, v = setting.split(':', 1)
                 style[k.strip()] = v
             style['display'] = display
-            layer.set('style', ';'.join(':'.join(i) for i in style.items()))
+            style = ';'.join(':'.join(i) for i in style.items())
+            if style != layer.get('style'):
+                # As layers may be shared with other trees, we set the style
+                # on a copy. Only the layer itself changes, so a shallow copy
+                # suffices.
+                layer = shallow_copy_svg_element(layer)
+                layer.set('style', style)
+                root[index] = layer
 
 
 def append_svg_layers(base, addition):
@@ -652,6 +968,46 @@ def append_svg_layers(base, addition):
         root.append(layer)
 
 
+def parse_svg(file):
+    # Parsed trees get cached and are shared across jobs, so they must not get
+    # modified. Use `copy_svg_tree` to get a tree that can get modified.
+    with SVG_TREES_LOCK:
+        tree = SVG_TREES.get(file, None)
+    if tree is None:
+        register_svg_namespaces()
+        tree = ET.parse(file)
+        with SVG_TREES_LOCK:
+            tree = SVG_TREES.setdefault(file, tree)
+    return tree
+
+
+def shallow_copy_svg_element(element):
+    # `copy.copy` would share the attribute dict with `element`, so we copy
+    # manually.
+    ret = ET.Element(element.tag, dict(element.attrib))
+    ret.text = element.text
+    ret.tail = element.tail
+    ret.extend(element)
+    return ret
+
+
+def copy_svg_tree(tree):
+    # Copies only the root element. The root's children are shared between
+    # `tree` and the copy. So they have to get replaced by copies before
+    # modifying them (See `own_svg_children`). This is way cheaper than deep
+    # copies, as typically only few layers get modified.
+    return ET.ElementTree(shallow_copy_svg_element(tree.getroot()))
+
+
+def own_svg_children(tree, predicate):
+    # Replaces the root's children that match `predicate` by deep copies, so
+    # they can get modified without affecting other trees.
+    root = tree.getroot()
+    for index, child in enumerate(list(root)):
+        if predicate(child):
+            root[index] = copy.deepcopy(child)
+
+
 def generate_full_svg_tree(scanarium, dir, parameter, decoration_version):
     undecorated_name = scanarium.get_versioned_filename(
         dir, parameter + '-undecorated', 'svg', decoration_version)
@@ -659,22 +1015,21 @@ def generate_full_svg_tree(scanarium, dir, parameter, decoration_version):
         scanarium.get_config_dir_abs(), 'decoration', 'svg',
         decoration_version)
     sources = [undecorated_name, decoration_name]
-    register_svg_namespaces()
-    tree = ET.parse(undecorated_name)
-    append_svg_layers(tree, ET.parse(decoration_name))
+    tree = copy_svg_tree(parse_svg(undecorated_name))
+    append_svg_layers(tree, parse_svg(decoration_name))
 
     extra_decoration_name = scanarium.get_versioned_filename(
         os.path.join(dir, '..'), 'extra-decoration', 'svg', decoration_version)
     if os.path.isfile(extra_decoration_name):
         sources.append(extra_decoration_name)
-        append_svg_layers(tree, ET.parse(extra_decoration_name))
+        append_svg_layers(tree, parse_svg(extra_decoration_name))
 
     return (tree, sources)
 
 
-def svg_variant_pipeline(scanarium, dir, command, parameter, variant, tree,
-                         sources, is_actor, language, force, command_label,
-                         parameter_label, decoration_version):
+def svg_variant_pipeline(scanarium, dir, command, parameter, variant,
+                         raw_tree, sources, is_actor, language, force,
+                         command_label, parameter_label, decoration_version):
     localizer = scanarium.get_localizer(language)
     (localized_command, _, _, localized_parameter_with_variant) = \
         localize_command_parameter_variant(localizer, command, parameter,
@@ -704,20 +1059,34 @@ def svg_variant_pipeline(scanarium, dir, command, parameter, variant, tree,
         'keywords': keywords,
         }
 
-    if scanarium.file_needs_update(full_svg_name, sources, force):
+    filter_sources, filter_extra = get_svg_filter_inputs(scanarium, language)
+    sources = sources + filter_sources + [GENERATOR_FILE]
+    extra = {
+        'filter': filter_extra,
+        'metadata': get_embedded_metadata(scanarium, metadata),
+        'command_label': command_label,
+        'parameter_label': parameter_label,
+    }
+    if file_needs_update(full_svg_name, sources, force, extra):
+        # `raw_tree` is shared across all languages and variants, so we need
+        # to work on a copy.
+        tree = copy_svg_tree(raw_tree)
         show_only_variant(tree, variant)
         filter_svg_tree(scanarium, tree, command, parameter, variant,
                         localizer, command_label, parameter_label,
                         decoration_version, '../..')
+        own_svg_children(tree, lambda child: child.find(
+            './/{http://creativecommons.org/ns#}Work') is not None)
         embed_metadata(scanarium, tree, metadata)
         tree.write(full_svg_name)
+        mark_updated(full_svg_name)
 
     pdf_name = generate_pdf(scanarium, dir, full_svg_name, force,
                             metadata=metadata)
 
     if is_actor:
-        scanarium.generate_thumbnail(dir, full_svg_name, force,
-                                     level=['90%', '100%'])
+        generate_thumbnail(scanarium, dir, full_svg_name, force,
+                           level=['90%', '100%'])
     return pdf_name
 
 
@@ -738,11 +1107,13 @@ def expand_languages(scanarium, language):
     return languages
 
 
-def regenerate_pdf_actor_books_for_language(scanarium, dir, scene, language,
-                                            pdfs, force):
+def regenerate_pdf_actor_books_for_language(scanarium, runner, dir, scene,
+                                            language, pdf_jobs, force):
     def keyer(pdf_name):
         return os.path.basename(pdf_name).rsplit('.', 1)[0]
 
+    pdfs = [runner.get_result(pdf_job) for pdf_job in pdf_jobs]
+
     localizer = scanarium.get_localizer(language)
     target_dir = os.path.join(os.path.dirname(dir), 'pdfs', language)
     target_file = os.path.join(target_dir, scanarium.to_safe_filename(
@@ -750,22 +1121,29 @@ def regenerate_pdf_actor_books_for_language(scanarium, dir, scene, language,
                 'All {scene_name} coloring pages', {
                     'scene_name': scene})) + '.pdf')
 
-    if scanarium.file_needs_update(target_file, pdfs, force):
+    pdfs.sort(key=keyer)
+    extra = {
+        'pdfunite': get_tool_version('pdfunite'),
+    }
+    if file_needs_update(target_file, pdfs, force, extra):
         os.makedirs(target_dir, exist_ok=True)
-        pdfs.sort(key=keyer)
         command = [scanarium.get_config('programs', 'pdfunite')]
         command += pdfs
         command.append(target_file)
         scanarium.run(command)
+        mark_updated(target_file)
 
 
-def regenerate_pdf_actor_books(scanarium, dir, scene, pdfs_by_language, force):
-    for language, pdfs in pdfs_by_language.items():
-        regenerate_pdf_actor_books_for_language(scanarium, dir, scene,
-                                                language, pdfs, force)
+def regenerate_pdf_actor_books(scanarium, runner, dir, scene,
+                               pdf_jobs_by_language, force):
+    for language, pdf_jobs in pdf_jobs_by_language.items():
+        runner.add(('book', dir, language),
+                   regenerate_pdf_actor_books_for_language,
+                   scanarium, runner, dir, scene, language, pdf_jobs, force,
+                   dependencies=pdf_jobs)
 
 
-def regenerate_masks(scanarium, dir, scene, name, force):
+def regenerate_masks(scanarium, runner, dir, scene, name, force):
     latest_decoration_version = get_latest_decoration_version(scanarium)
     for decoration_version in range(1, latest_decoration_version + 1):
         build_version = decoration_version == latest_decoration_version
@@ -774,12 +1152,13 @@ def regenerate_masks(scanarium, dir, scene, name, force):
                 dir, name + '-undecorated', 'svg', decoration_version)
             build_version = os.path.isfile(undecorated_name)
         if build_version:
-            regenerate_mask(scanarium, dir, scene, name, decoration_version,
-                            force)
+            regenerate_mask(scanarium, runner, dir, scene, name,
+                            decoration_version, force)
 
 
 def regenerate_static_content_command_parameter(
-        scanarium, dir, command, parameter, is_actor, language, force):
+        scanarium, runner, dir, command, parameter, is_actor, language,
+        force):
     command_label = COMMAND_LABEL_SCENE if is_actor else 'command'
     parameter_label = PARAMETER_LABEL_ACTOR if is_actor else 'parameter'
     logging.debug(f'Regenerating content for {command_label} "{command}", '
@@ -792,62 +1171,68 @@ def regenerate_static_content_command_parameter(
         scanarium, dir, parameter, decoration_version)
     variants = extract_variants(raw_tree)
     variants.sort()
-    pdfs_by_language = {}
+    pdf_jobs_by_language = {}
     for language in expand_languages(scanarium, language):
         for variant in variants:
-            variant_pdf_name = svg_variant_pipeline(
+            variant_pdf_job = runner.add(
+                ('pdf', dir, language, variant), svg_variant_pipeline,
                 scanarium, dir, command, parameter, variant,
-                copy.deepcopy(raw_tree), sources, is_actor, language, force,
+                raw_tree, sources, is_actor, language, force,
                 command_label, parameter_label, decoration_version)
-            pdfs_by_language[language] = pdfs_by_language.get(language, []) + \
-                [variant_pdf_name]
+            pdf_jobs_by_language[language] = \
+                pdf_jobs_by_language.get(language, []) + [variant_pdf_job]
 
     if is_actor:
-        regenerate_masks(scanarium, dir, command, parameter, force)
+        regenerate_masks(scanarium, runner, dir, command, parameter, force)
 
-    return variants, pdfs_by_language
+    return variants, pdf_jobs_by_language
 
 
 def regenerate_static_content_command_parameters(
-        scanarium, dir, command, parameter_arg, is_actor, language, force):
+        scanarium, runner, dir, command, parameter_arg, is_actor, language,
+        force):
     parameters = os.listdir(dir) if parameter_arg is None else [parameter_arg]
     parameters.sort()
     command_variants = {}
-    command_pdfs = {}
+    command_pdf_jobs = {}
     for parameter in parameters:
         parameter_dir = os.path.join(dir, parameter)
         if os.path.isdir(parameter_dir):
-            variants, pdfs_by_language = \
+            variants, pdf_jobs_by_language = \
                 regenerate_static_content_command_parameter(
-                    scanarium, parameter_dir, command, parameter, is_actor,
-                    language, force)
+                    scanarium, runner, parameter_dir, command, parameter,
+                    is_actor, language, force)
             if not os.path.exists(os.path.join(parameter_dir, 'hidden')):
                 command_variants[parameter] = variants
-                for pdf_language, pdfs in pdfs_by_language.items():
-                    command_pdfs[pdf_language] = \
-                        command_pdfs.get(pdf_language, []) + pdfs
+                for pdf_language, pdf_jobs in pdf_jobs_by_language.items():
+                    command_pdf_jobs[pdf_language] = \
+                        command_pdf_jobs.get(pdf_language, []) + pdf_jobs
     if is_actor and parameter_arg is None:
         scanarium.dump_json(os.path.join(dir, '..', 'actor-variants.json'),
                             command_variants)
-        regenerate_pdf_actor_books(scanarium, dir, command, command_pdfs,
-                                   force)
+        regenerate_pdf_actor_books(scanarium, runner, dir, command,
+                                   command_pdf_jobs, force)
 
 
 def regenerate_static_scene_content(scanarium, dir, force):
-    scanarium.generate_thumbnail(dir, 'scene-bait.png', force)
+    generate_thumbnail(scanarium, dir, 'scene-bait.png', force)
 
     book_svg_file = os.path.join(scanarium.get_images_dir_abs(), 'book.svg')
     book_png_file = os.path.join(dir, 'scene-book.png')
     bait_png_file = os.path.join(dir, 'scene-bait.png')
     sources = [book_svg_file, bait_png_file]
-    if scanarium.file_needs_update(book_png_file, sources, force):
-        cwd_old = os.getcwd()
-        os.chdir(dir)
+    extra = {
+        'convert': get_tool_version('convert'),
+    }
+    if file_needs_update(book_png_file, sources, force, extra):
+        # The book svg references the bait relative to the current
+        # directory. Changing the directory of the whole process would
+        # interfere with parallel jobs, so we only run `convert` within `dir`.
         scanarium.run([scanarium.get_config('programs', 'convert'),
-                       book_svg_file, book_png_file])
-        os.chdir(cwd_old)
+                       book_svg_file, book_png_file], cwd=dir)
+        mark_updated(book_png_file)
 
-    scanarium.generate_thumbnail(dir, book_png_file, force)
+    generate_thumbnail(scanarium, dir, book_png_file, force)
 
     background_file = os.path.join(dir, 'background')
     background_jpg_file = os.path.join(dir, 'background.jpg')
@@ -855,14 +1240,16 @@ def regenerate_static_scene_content(scanarium, dir, force):
             os.path.join(dir,
                          os.readlink(background_file)) == background_jpg_file:
         background_png_file = os.path.join(dir, 'background.png')
-        if scanarium.file_needs_update(background_jpg_file,
-                                       [background_png_file], force):
+        if file_needs_update(background_jpg_file, [background_png_file],
+                             force, extra):
             scanarium.run([scanarium.get_config('programs', 'convert'),
                            background_png_file, background_jpg_file])
+            mark_updated(background_jpg_file)
 
 
 def regenerate_static_content_commands(
-        scanarium, dir, command_arg, parameter, is_actor, language, force):
+        scanarium, runner, dir, command_arg, parameter, is_actor, language,
+        force):
     scenes = []
     if os.path.isdir(dir):
         commands = os.listdir(dir) if command_arg is None else [command_arg]
@@ -871,14 +1258,15 @@ def regenerate_static_content_commands(
             command_dir = os.path.join(dir, command)
             if os.path.isdir(command_dir):
                 if is_actor:
-                    regenerate_static_scene_content(scanarium, command_dir,
-                                                    force)
+                    runner.add(('scene', command_dir),
+                               regenerate_static_scene_content,
+                               scanarium, command_dir, force)
                     command_dir = os.path.join(command_dir, 'actors')
                     scenes.append(command)
                 if os.path.isdir(command_dir):
                     regenerate_static_content_command_parameters(
-                        scanarium, command_dir, command, parameter, is_actor,
-                        language, force)
+                        scanarium, runner, command_dir, command, parameter,
+                        is_actor, language, force)
         if is_actor and command_arg is None:
             file = os.path.join(scanarium.get_scenes_dir_abs(), 'scenes.json')
             scanarium.dump_json(file, scenes)
@@ -911,7 +1299,10 @@ def regenerate_static_images(scanarium, force):
     book_svg_file = os.path.join(images_dir_abs, 'book.svg')
     book_png_file = os.path.join(images_dir_abs, 'book.png')
 
-    if scanarium.file_needs_update(book_png_file, [book_svg_file], force):
+    extra = {
+        'inkscape': get_tool_version('inkscape'),
+    }
+    if file_needs_update(book_png_file, [book_svg_file], force, extra):
         run_inkscape(scanarium, [
             '--export-png=%s' % (book_png_file),
             '--export-id=Book',
@@ -919,22 +1310,138 @@ def regenerate_static_images(scanarium, force):
             '--export-area-page',
             book_svg_file
         ])
+        mark_updated(book_png_file)
+
+    generate_thumbnail(scanarium, images_dir_abs, book_png_file, force)
+
+
+def precompress_file(compressor, file, encoding, force):
+    target = compressor.get_precompressed_file(file, encoding)
+    if file_needs_update(target, [file], force, {'encoding': encoding}):
+        compressor.precompress_file(file, encoding)
+        mark_updated(target)
+    elif os.stat(target).st_mtime < os.stat(file).st_mtime:
+        # The file got touched without changing. Webservers only send
+        # precompressed files that are not older than their source, so we
+        # touch the target too.
+        os.utime(target)
+
+
+def precompress_frontend(scanarium, runner, force):
+    conf_section = 'cgi:regenerate-static-content'
+    suffixes = scanarium.get_config(conf_section, 'precompress_suffixes',
+                                    kind='list')
+    min_size = scanarium.get_config(conf_section, 'precompress_min_size',
+                                    kind='int')
+    compressor = Compressor()
+
+    # Scenes and localizations are symlinked into the frontend, so we have to
+    # follow links. Hence, precompressed files also end up in the scenes and
+    # localization trees (See `.gitignore`).
+    for dir, dirs, files in os.walk(scanarium.get_frontend_dir_abs(),
+                                    followlinks=True):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            file = os.path.join(dir, name)
+            if name.endswith(suffixes) and os.path.getsize(file) >= min_size:
+                for encoding in compressor.get_encodings():
+                    runner.add(('precompress', file, encoding),
+                               precompress_file, compressor, file, encoding,
+                               force)
+
+
+def write_text_if_changed(scanarium, file, text):
+    try:
+        with open(file, 'r') as f:
+            changed = f.read() != text
+    except OSError:
+        changed = True
+    if changed:
+        scanarium.dump_text(file, text)
+
+
+def regenerate_javascript_bundle(scanarium):
+    logging.debug('Regenerating JavaScript bundle ...')
+    frontend_dir_abs = scanarium.get_frontend_dir_abs()
+    bundles_dir_abs = os.path.join(frontend_dir_abs, 'bundles')
+    with open(os.path.join(frontend_dir_abs, 'index.html'), 'r') as f:
+        index = f.read()
+
+    scripts = SCRIPT_TAG_PATTERN.findall(index)
+    if not scripts:
+        return
+
+    bundler = JavaScriptBundler(BUNDLE_HEADER)
+    for script in scripts:
+        bundler.add_file(os.path.join(frontend_dir_abs, script),
+                         '../' + script)
+    source = bundler.get_source()
+
+    # Bundles are named by their content, so webservers can let browsers
+    # cache them forever.
+    name = hashlib.sha256(source.encode()).hexdigest()[:16]
+    bundle_file = name + '.js'
+    source_map_file = bundle_file + '.map'
+    source += f'//# sourceMappingURL={source_map_file}\n'
+    os.makedirs(bundles_dir_abs, exist_ok=True)
+    write_text_if_changed(
+        scanarium, os.path.join(bundles_dir_abs, bundle_file), source)
+    write_text_if_changed(
+        scanarium, os.path.join(bundles_dir_abs, source_map_file),
+        json.dumps(bundler.get_source_map(bundle_file), indent=2) + '\n')
+
+    for file in os.listdir(bundles_dir_abs):
+        if not file.startswith(bundle_file):
+            os.remove(os.path.join(bundles_dir_abs, file))
+
+    # The bundle replaces the first script tag, the other script tags get
+    # dropped.
+    bundle_tag = f'<script src="bundles/{bundle_file}"></script>\n'
+    bundled_index = SCRIPT_TAG_PATTERN.sub('', index)
+    first_script_start = SCRIPT_TAG_PATTERN.search(index).start()
+    bundled_index = bundled_index[:first_script_start] + bundle_tag + \
+        bundled_index[first_script_start:]
+    write_text_if_changed(
+        scanarium, os.path.join(frontend_dir_abs, 'index-bundled.html'),
+        bundled_index)
+
+
+def regenerate_static_content(scanarium, command, parameter, language, force,
+                              jobs=1, shared_build_cache=None):
+    global BUILD_CACHE
+    BUILD_CACHE = BuildCache(scanarium, scanarium.get_build_cache_dir_abs(),
+                             shared_build_cache)
+
+    if jobs < 1:
+        jobs = os.cpu_count() or 1
+    runner = JobRunner(jobs)
 
-    scanarium.generate_thumbnail(images_dir_abs, book_png_file, force)
-
-
-def regenerate_static_content(scanarium, command, parameter, language, force):
     for d in [
         {'dir': scanarium.get_commands_dir_abs(), 'is_actor': False},
         {'dir': scanarium.get_scenes_dir_abs(), 'is_actor': True},
     ]:
         regenerate_static_content_commands(
-            scanarium, d['dir'], command, parameter, d['is_actor'], language,
-            force)
+            scanarium, runner, d['dir'], command, parameter, d['is_actor'],
+            language, force)
 
     if not command and not parameter:
-        regenerate_language_matrix(scanarium)
-        regenerate_static_images(scanarium, force)
+        runner.add('language-matrix', regenerate_language_matrix, scanarium)
+        runner.add('static-images', regenerate_static_images, scanarium,
+                   force)
+        if scanarium.get_config('cgi:regenerate-static-content',
+                                'bundle_javascript', kind='boolean'):
+            runner.add('javascript-bundle', regenerate_javascript_bundle,
+                       scanarium)
+
+    runner.run()
+
+    if scanarium.get_config('cgi:regenerate-static-content', 'precompress',
+                            kind='boolean'):
+        # Precompressing has to wait for the above jobs, as they generate
+        # some of the files to compress.
+        runner = JobRunner(jobs)
+        precompress_frontend(scanarium, runner, force)
+        runner.run()
 
 
 def register_arguments(scanarium, parser):
@@ -946,6 +1453,25 @@ def register_arguments(scanarium, parser):
                         help='Regenerate all files, even if they are not'
                         'stale',
                         action='store_true')
+    parser.add_argument('--jobs', '-j', metavar='JOBS', type=int,
+                        help='Number of jobs (E.g.: Inkscape exports) to run '
+                        'in parallel. 0 means one job per CPU',
+                        default=scanarium.get_config(
+                            'cgi:regenerate-static-content', 'jobs',
+                            kind='int'))
+    parser.add_argument('--inkscape-backend', choices=['process', 'shell'],
+                        help='How to run Inkscape. `process` starts Inkscape '
+                        'for each export, `shell` keeps Inkscape running in '
+                        'shell mode for all exports of a job',
+                        default=scanarium.get_config(
+                            'cgi:regenerate-static-content',
+                            'inkscape_backend'))
+    parser.add_argument('--shared-build-cache', metavar='DIRECTORY',
+                        help='Directory of a build cache to share generated '
+                        'files with other Scanarium checkouts',
+                        default=scanarium.get_config(
+                            'cgi:regenerate-static-content',
+                            'shared_build_cache', allow_empty=True))
     parser.add_argument('COMMAND', nargs='?',
                         help='Regenerate only the given command/scene')
     parser.add_argument('PARAMETER', nargs='?',
@@ -956,6 +1482,8 @@ if __name__ == "__main__":
     scanarium = Scanarium()
     args = scanarium.handle_arguments('Regenerates all static content',
                                       register_arguments)
+    scanarium.set_config('cgi:regenerate-static-content', 'inkscape_backend',
+                         args.inkscape_backend)
     scanarium.call_guarded(
         regenerate_static_content, args.COMMAND, args.PARAMETER,
-        args.language, args.force)
+        args.language, args.force, args.jobs, args.shared_build_cache)
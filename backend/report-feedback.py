@@ -3,10 +3,11 @@
 # GNU Affero General Public License v3.0 (See LICENSE.md)
 # SPDX-License-Identifier: AGPL-3.0-only
 
-import base64
 import logging
 import os
+import shutil
 import sys
+import tempfile
 
 SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, SCANARIUM_DIR_ABS)
@@ -15,6 +16,13 @@ del sys.path[0]
 
 logger = logging.getLogger(__name__)
 
+WHITELISTED_CGI_FIELDS = {
+    'message': 1,
+    'email': 2,
+    'lastFailedUpload': 3,
+    'userAgent': 4,
+}
+
 
 def report_feedback(scanarium, message, email, lastFailedUpload, userAgent):
     target = scanarium.get_config('cgi:report-feedback', 'target')
@@ -27,8 +35,10 @@ def report_feedback(scanarium, message, email, lastFailedUpload, userAgent):
             scanarium.dump_text(filename_base + '-email.txt', email)
         if lastFailedUpload:
             img_filename = filename_base + '-last-failed-upload'
-            with open(img_filename, 'wb') as f:
-                f.write(base64.standard_b64decode(lastFailedUpload))
+            with tempfile.TemporaryDirectory(
+                    prefix='scanarium-report-feedback-') as dir:
+                shutil.copyfile(scanarium.get_upload_file_name(
+                    lastFailedUpload, dir), img_filename)
             format = scanarium.guess_image_format(img_filename)
             if format:
                 os.rename(img_filename, f'{img_filename}.{format}')
@@ -56,7 +66,6 @@ if __name__ == "__main__":
     args = scanarium.handle_arguments(
         'Reports feedback',
         register_arguments,
-        whitelisted_cgi_fields={
-            'message': 1, 'email': 2, 'lastFailedUpload': 3, 'userAgent': 4})
+        whitelisted_cgi_fields=WHITELISTED_CGI_FIELDS)
     scanarium.call_guarded(report_feedback, args.MESSAGE, args.EMAIL,
                            args.LAST_FAILED_UPLOAD, args.USER_AGENT)
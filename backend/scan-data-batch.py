@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import logging
+import os
+import sys
+import tempfile
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium import Scanarium
+from scanarium import ScanariumError
+from scanarium.JobRunner import JobRunner
+del sys.path[0]
+from scan import scan_image_file
+
+logger = logging.getLogger(__name__)
+
+WHITELISTED_CGI_FIELDS = {'data': '*'}
+
+
+def raise_too_many_images(max_images):
+    raise ScanariumError(
+        'SE_SCAN_BATCH_TOO_MANY_IMAGES',
+        'A batch may hold at most {max_images} images',
+        {'max_images': str(max_images)})
+
+
+def get_image_files(scanarium, data, dir, max_images):
+    # Returns a list that holds for each image to scan either its file, or the
+    # failed `Result` of the upload it should have come from.
+    #
+    # Converting the pages of documents is costly. So each upload gets
+    # converted only up to one page more than the batch has room for, and we
+    # bail out as soon as the batch holds too many images.
+    ret = []
+    for idx, datum in enumerate(data):
+        upload_dir = os.path.join(dir, str(idx))
+        os.mkdir(upload_dir)
+        try:
+            upload_file = scanarium.get_upload_file_name(datum, upload_dir)
+            ret += scanarium.get_page_files(
+                upload_file, upload_dir, max_pages=max_images - len(ret) + 1)
+        except Exception:
+            ret.append(scanarium.get_command_logger().log(
+                exc_info=sys.exc_info()))
+        if len(ret) > max_images:
+            raise_too_many_images(max_images)
+    return ret
+
+
+def scan_data_batch(scanarium, *data):
+    max_images = scanarium.get_config('cgi:scan-data-batch', 'max_images',
+                                      kind='int')
+    jobs = scanarium.get_config('cgi:scan-data-batch', 'jobs', kind='int')
+    if len(data) > max_images:
+        raise_too_many_images(max_images)
+    with tempfile.TemporaryDirectory(
+            prefix='scanarium-scan-data-batch-') as dir:
+        image_files = get_image_files(scanarium, data, dir, max_images)
+
+        # Each image gets scanned with its own Scanarium, as scanning an image
+        # switches the image source. Scanariums get created up front, as
+        # creating them sets up signal handlers, which only works in the main
+        # thread.
+        config = scanarium.dump_config_string()
+        runner = JobRunner(jobs)
+        scanariums = {}
+        for idx, image_file in enumerate(image_files):
+            if isinstance(image_file, str):
+                image_scanarium = Scanarium(config)
+                image_scanarium.defer_reindexing()
+                scanariums[idx] = image_scanarium
+                runner.add(idx, scan_image_file, image_scanarium, image_file)
+        runner.run()
+
+    # Reindexing each scene only once for the whole batch instead of after
+    # each scan.
+    scenes = set()
+    for image_scanarium in scanariums.values():
+        scenes |= image_scanarium.end_deferred_reindexing(reindex=False)
+    for scene in sorted(scenes):
+        scanarium.reindex_actors_for_scene(scene)
+
+    ret = []
+    for idx, image_file in enumerate(image_files):
+        result = runner.get_result(idx) if idx in scanariums else image_file
+        ret.append(result.as_dict())
+    return ret
+
+
+def register_arguments(scanarium, parser):
+    parser.add_argument('DATA', nargs='*', help='The image data to scan')
+
+
+if __name__ == "__main__":
+    scanarium = Scanarium()
+    args = scanarium.handle_arguments(
+        'Scans and processes many images from parameters',
+        register_arguments,
+        whitelisted_cgi_fields=WHITELISTED_CGI_FIELDS)
+    scanarium.call_guarded(scan_data_batch, *args.DATA)
@@ -3,7 +3,6 @@
 # GNU Affero General Public License v3.0 (See LICENSE.md)
 # SPDX-License-Identifier: AGPL-3.0-only
 
-import base64
 import logging
 import os
 import sys
@@ -13,26 +12,18 @@ SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, SCANARIUM_DIR_ABS)
 from scanarium import Scanarium
 del sys.path[0]
-from scan import scan_image
+from scan import scan_image_file
 
 logger = logging.getLogger(__name__)
 
+WHITELISTED_CGI_FIELDS = {'data': 1}
+
 
 def scan_data(scanarium, data):
     with tempfile.TemporaryDirectory(prefix='scanarium-scan-data-') as dir:
-        image_file = os.path.join(dir, 'image')
-        with open(image_file, 'wb') as f:
-            f.write(base64.standard_b64decode(data))
-        # Temporarily switching the image source to the new image for scanning
-        scanarium.set_config('scan', 'source', f'image:{image_file}')
-
-        # As we switched from the configured image source to the passed image,
-        # the calibration data for the configured image source no longer fits,
-        # and we drop it as it may otherwise distort colors/geometry.
-        scanarium.set_config('scan', 'calibration_xml_file', '')
-        scanarium.set_config('scan', 'max_brightness', '')
+        image_file = scanarium.get_upload_file_name(data, dir)
 
-        return scan_image(scanarium)
+        return scan_image_file(scanarium, image_file)
 
 
 def register_arguments(scanarium, parser):
@@ -44,5 +35,5 @@ if __name__ == "__main__":
     args = scanarium.handle_arguments(
         'Scans an processes an image from a parameter',
         register_arguments,
-        whitelisted_cgi_fields={'data': 1})
+        whitelisted_cgi_fields=WHITELISTED_CGI_FIELDS)
     scanarium.call_guarded(scan_data, args.DATA)
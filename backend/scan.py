@@ -19,6 +19,9 @@ logger = logging.getLogger(__name__)
 def scan_image_no_outer_logging(scanarium):
     image = scanarium.get_image()
 
+    # Rejecting hopeless images before the costly extraction tries below.
+    scanarium.check_image_quality(image)
+
     qr_rect = None
     data = None
     iteration = 1
@@ -79,6 +82,20 @@ def scan_image(scanarium):
     return ret
 
 
+# Scans the image file `file` instead of the configured image source.
+def scan_image_file(scanarium, file):
+    # Temporarily switching the image source to the new image for scanning
+    scanarium.set_config('scan', 'source', f'image:{file}')
+
+    # As we switched from the configured image source to the passed image,
+    # the calibration data for the configured image source no longer fits,
+    # and we drop it as it may otherwise distort colors/geometry.
+    scanarium.set_config('scan', 'calibration_xml_file', '')
+    scanarium.set_config('scan', 'max_brightness', '')
+
+    return scan_image(scanarium)
+
+
 def main(scanarium):
     return scan_image(scanarium)
 
@@ -119,11 +119,13 @@ def show_source(scanarium, mark, store_final):
                     try:
                         qr_parsed = parse_qr(scanarium, qr_data)
                         for mask_alpha in [0.6, 0.01]:
-                            masked_image = scanarium.actor_image_pipeline(
-                                original_image, qr_rect, qr_parsed,
-                                visualized_alpha=mask_alpha)
+                            def produce(mask_alpha=mask_alpha):
+                                return scanarium.actor_image_pipeline(
+                                    original_image, qr_rect, qr_parsed,
+                                    visualized_alpha=mask_alpha)
+
                             scanarium.debug_show_image(
-                                f'Masked@{mask_alpha}', masked_image)
+                                f'Masked@{mask_alpha}', produce)
                         last_exception_message = None
 
                     except ScanariumError as e:
@@ -2,7 +2,9 @@
 // GNU Affero General Public License v3.0 (See LICENSE.md)
 // SPDX-License-Identifier: AGPL-3.0-only
 
-var onReadyStateChange = function(cgi, finishedCallback) {
+// `resultCallback` is only used for batch cgis, whose payload is a list of
+// results. It gets called for each of them.
+var onReadyStateChange = function(cgi, finishedCallback, resultCallback) {
   return function() {
     if (this.readyState === XMLHttpRequest.DONE) {
       var capsule = {};
@@ -10,6 +12,13 @@ var onReadyStateChange = function(cgi, finishedCallback) {
       if (this.status == 200) {
         capsule = JSON.parse(this.responseText);
         is_ok = sanitize_boolean(capsule, 'is_ok');
+        if (is_ok && resultCallback) {
+          var results = Array.isArray(capsule.payload) ? capsule.payload : [];
+          results.forEach((result, index) => {
+            var resultMessage = CommandProcessor.process(result);
+            resultCallback(sanitize_boolean(result, 'is_ok'), resultMessage, index, results.length);
+          });
+        }
       } else {
         capsule = {
           'is_ok': false,
@@ -34,6 +43,13 @@ callCgi = function(cgi, data, finishedCallback) {
     onceLoadingIsAllowed(() => xhr.send(data));
 }
 
+callCgiBatch = function(cgi, data, resultCallback, finishedCallback) {
+    var xhr = new XMLHttpRequest();
+    xhr.open('POST', 'cgi-bin/' + cgi, true);
+    xhr.onreadystatechange = onReadyStateChange(cgi, finishedCallback, resultCallback);
+    onceLoadingIsAllowed(() => xhr.send(data));
+}
+
 function isCgiForbidden(cgi) {
     return isCommandForbidden('cgi:' + cgi);
 }
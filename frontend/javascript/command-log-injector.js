@@ -16,7 +16,7 @@ var CommandLogInjector = {
         // if they won't be blocked. (If they are blocked, we'll catch up with
         // log items once the block is gone).
         if (!isLoadingBlocked()) {
-            loadDynamicConfig(dyn_dir + '/command-log.json', CommandLogInjector.injectLogs);
+            loadDynamicConfig(dyn_dir + '/command-log.json', CommandLogInjector.injectLogs, true);
         }
     },
 
@@ -32,6 +32,12 @@ var default_global_config = {
   // If true, make the actor cards in the settings dialog links to pdfs.
   'offer-pdf-downloads': true,
 
+  // If true, uploading many files at once sends them in one request to the
+  // `scan-data-batch` cgi, which has to be allowed in the backend config
+  // (`allow` in the `cgi:scan-data-batch` section). If false, each file gets
+  // sent in a separate request to the `scan-data` cgi.
+  'batch-uploads': false,
+
   // Add a prefix to on-screen messages that shows the used method
   'prefix-messages-with-method': false,
 
@@ -54,10 +54,35 @@ function loadJson(url, callback, method, param, error) {
     onceLoadingIsAllowed(() => xhr.send(param));
 }
 
-function loadDynamicConfig(url, callback) {
+// The last dumped version and parsed content of each dynamic config file when
+// loading through POST. Polling sends the cached version along, so unchanged
+// files neither get transferred nor parsed by the backend, and get parsed
+// only once by the client.
+var dynamicConfigCache = {};
+
+// Loads the dynamic config `url` and calls `callback` with its parsed
+// content. If `skipUnmodified` is true, `callback` does not get called if
+// the file did not change since it was last loaded. Polling consumers that
+// would only redo their work on unchanged content should set it.
+function loadDynamicConfig(url, callback, skipUnmodified) {
+    var file = url;
     var unpack = function(capsule) {
       if (sanitize_boolean(capsule, 'is_ok')) {
-        callback(capsule['payload']);
+        var payload = capsule['payload'];
+        var modified = sanitize_boolean(payload, 'modified');
+        if (modified) {
+          // The content is the file's JSON that gets parsed right below, so
+          // it is not sanitized as string.
+          var content = sanitize_resolve(payload, 'content');
+          dynamicConfigCache[file] = {
+            version: sanitize_string(payload, 'version'),
+            content: JSON.parse((typeof(content) == 'string') ? content : 'null'),
+          };
+        }
+        var cached = dynamicConfigCache[file];
+        if (typeof cached != 'undefined' && (modified || !skipUnmodified)) {
+          callback(cached.content);
+        }
       }
     }
 
@@ -65,9 +90,11 @@ function loadDynamicConfig(url, callback) {
     var data;
 
     if (dynamicConfigMethod == 'POST') {
+      var cached = dynamicConfigCache[file];
       wrappedCallback = unpack;
       data = new FormData();
       data.append('file', url);
+      data.append('version', (typeof cached == 'undefined') ? 'none' : cached.version);
       url = 'cgi-bin/dump-dynamic-config';
     }
 
@@ -97,6 +97,7 @@ var UploadButton = {
   container: null,
   form: null,
   cgi: 'scan-data',
+  batchCgi: 'scan-data-batch',
   uploadListeners: [],
 
   show: function() {
@@ -115,7 +116,12 @@ var UploadButton = {
       fileInput.accept = 'image/*';
 
       fileInput.onchange = function(e) {
-          if (fileInput.files.length > 0) {
+          // Batch uploads have to be enabled explicitly in the config (See
+          // `batch-uploads` in config.js), as servers that only allow
+          // `scan-data` would otherwise reject uploads of more than one file.
+          if (fileInput.files.length > 1 && getConfig('batch-uploads')) {
+              UploadButton.uploadBatch(Array.from(fileInput.files));
+          } else if (fileInput.files.length > 0) {
               var i;
               for (i = 0; i < fileInput.files.length; i++) {
                   UploadButton.addUpload();
@@ -182,6 +188,28 @@ var UploadButton = {
     }
   },
 
+  // Uploads all `files` in a single request.
+  uploadBatch: function(files) {
+      UploadButton.addUpload();
+      var data = new FormData();
+      files.forEach(file => data.append('data', file));
+      MessageManager.addMessage(localize(
+          'Upload of {image_count} images started',
+          {image_count: files.length}
+      ));
+      callCgiBatch(UploadButton.batchCgi, data, function(is_ok, message, index, count) {
+          // Multi-page files yield more results than files. Then, we
+          // cannot tell which file a result belongs to.
+          if (count == files.length) {
+              UploadButton.uploadListeners.forEach(callback => {
+                  callback(files[index], is_ok, message);
+              });
+          }
+      }, function(is_ok, message) {
+          UploadButton.removeUpload()
+      });
+  },
+
   currentUploads: 0,
   addUpload: function() {
       UploadButton.currentUploads += 1;
@@ -0,0 +1,54 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import threading
+
+# Scores below this get dropped, as their variants have not succeeded for a
+# long time.
+MIN_SCORE = 0.01
+
+
+# Orders variants (E.g.: contrasts to try when decoding QR codes) such that
+# recently successful variants come first.
+#
+# Each success adds 1 to the variant's score, while the scores of all
+# variants decay by a factor upon each success. So under stable conditions,
+# the successful variant ends up first, and if conditions change, a different
+# variant takes over after a few successes. Variants without score keep
+# their given order.
+#
+# Variants are tuples of strings and numbers, so the state can get stored as
+# JSON.
+#
+# Instances can be used from many threads.
+class AdaptiveOrder(object):
+    def __init__(self):
+        super(AdaptiveOrder, self).__init__()
+        self._scores = {}
+        self._lock = threading.Lock()
+
+    def order(self, variants):
+        with self._lock:
+            scores = dict(self._scores)
+        return sorted(variants, key=lambda variant: -scores.get(variant, 0))
+
+    def record_success(self, variant, decay):
+        with self._lock:
+            scores = {}
+            for (scored_variant, score) in self._scores.items():
+                score *= decay
+                if score >= MIN_SCORE:
+                    scores[scored_variant] = score
+            scores[variant] = scores.get(variant, 0) + 1
+            self._scores = scores
+
+    def get_state(self):
+        with self._lock:
+            return [[list(variant), score]
+                    for (variant, score) in self._scores.items()]
+
+    def set_state(self, state):
+        scores = {tuple(variant): float(score) for (variant, score) in state}
+        with self._lock:
+            self._scores = scores
@@ -0,0 +1,176 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from .Util import file_needs_update
+
+logger = logging.getLogger(__name__)
+
+VERSION_ARGUMENTS = {
+    'exiftool': ['-ver'],
+    'pdfunite': ['-v'],
+}
+
+
+def hash_string(string):
+    return hashlib.sha256(string.encode()).hexdigest()
+
+
+# Decides whether generated files are stale by hashing their inputs.
+#
+# For each target, the hash of its inputs (the contents of its source files,
+# and extra data like config values or tool versions) gets stored in a
+# manifest in the cache directory once the target got built. A target only
+# needs an update if its current input hash differs from the manifest's. So
+# unlike mtime based checks, touching files (git checkouts, rsync, ...) does
+# not cause rebuilds, while changed config values do.
+#
+# If a shared directory is given, built targets also get stored there by their
+# input hash, and targets get copied from there instead of getting rebuilt.
+# This allows several checkouts (CI runs, containers, ...) to reuse each
+# other's builds.
+#
+# Usage is `needs_update`, then building the target, then `mark_updated`.
+class BuildCache(object):
+    def __init__(self, scanarium, dir, shared_dir=None):
+        super(BuildCache, self).__init__()
+        self._scanarium = scanarium
+        self._dir = dir
+        self._shared_dir = shared_dir
+        self._lock = threading.Lock()
+        self._file_hashes = {}
+        self._tool_versions = {}
+        self._pending = {}
+
+    def get_tool_version(self, program):
+        with self._lock:
+            ret = self._tool_versions.get(program, None)
+        if ret is None:
+            command = [self._scanarium.get_config('programs', program)]
+            command += VERSION_ARGUMENTS.get(program, ['--version'])
+            try:
+                process = self._scanarium.run(command, check=False)
+                ret = (process['stdout'] + process['stderr']).strip()
+            except OSError:
+                # The program is not available. As we then cannot build
+                # targets with it anyway, any stable value will do.
+                ret = ''
+            with self._lock:
+                self._tool_versions[program] = ret
+        return ret
+
+    def _hash_file(self, file):
+        stat = os.stat(file)
+        key = (file, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            ret = self._file_hashes.get(key, None)
+        if ret is None:
+            hasher = hashlib.sha256()
+            with open(file, 'rb') as f:
+                for chunk in iter(lambda: f.read(65536), b''):
+                    hasher.update(chunk)
+            ret = hasher.hexdigest()
+            with self._lock:
+                self._file_hashes[key] = ret
+        return ret
+
+    def _get_input_hash(self, target, sources, extra):
+        inputs = {
+            'target': os.path.basename(target),
+            'sources': [self._hash_file(source) for source in sources],
+            'extra': extra,
+        }
+        return hash_string(json.dumps(inputs, sort_keys=True))
+
+    def _get_manifest_file(self, target):
+        relative_target = os.path.relpath(
+            target, self._scanarium.get_scanarium_dir_abs())
+        name = hash_string(relative_target)
+        return (os.path.join(self._dir, name[:2], name + '.json'),
+                relative_target)
+
+    def _read_input_hash(self, target):
+        manifest_file, _ = self._get_manifest_file(target)
+        try:
+            with open(manifest_file, 'r') as f:
+                return json.load(f)['input_hash']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_input_hash(self, target, input_hash):
+        manifest_file, relative_target = self._get_manifest_file(target)
+        self._scanarium.dump_json(manifest_file, {
+            'target': relative_target,
+            'input_hash': input_hash,
+        })
+
+    def _get_shared_file(self, input_hash):
+        return os.path.join(self._shared_dir, input_hash[:2], input_hash)
+
+    def _copy_atomically(self, source, target):
+        target_dir = os.path.dirname(target)
+        os.makedirs(target_dir, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=target_dir, prefix='.tmp-')
+        os.close(fd)
+        try:
+            shutil.copyfile(source, tmp_file)
+            shutil.copymode(source, tmp_file)
+            os.replace(tmp_file, target)
+        except Exception:
+            os.remove(tmp_file)
+            raise
+
+    def _fetch_shared(self, target, input_hash):
+        ret = False
+        if self._shared_dir:
+            shared_file = self._get_shared_file(input_hash)
+            if os.path.isfile(shared_file):
+                logger.debug(f'Using shared build of {target}')
+                self._copy_atomically(shared_file, target)
+                ret = True
+        return ret
+
+    def _store_shared(self, target, input_hash):
+        if self._shared_dir:
+            shared_file = self._get_shared_file(input_hash)
+            if not os.path.isfile(shared_file):
+                self._copy_atomically(target, shared_file)
+
+    def needs_update(self, target, sources, extra=None, force=False):
+        input_hash = self._get_input_hash(target, sources, extra)
+        with self._lock:
+            self._pending[target] = input_hash
+
+        ret = True
+        if not force:
+            stored_hash = None
+            if os.path.isfile(target):
+                stored_hash = self._read_input_hash(target)
+                if stored_hash is None:
+                    # Target got built before the build cache existed. So we
+                    # fall back to mtimes once to avoid a full rebuild.
+                    ret = file_needs_update(target, sources)
+                else:
+                    ret = stored_hash != input_hash
+            if ret:
+                ret = not self._fetch_shared(target, input_hash)
+            if not ret:
+                with self._lock:
+                    del self._pending[target]
+                if stored_hash != input_hash:
+                    self._write_input_hash(target, input_hash)
+        return ret
+
+    def mark_updated(self, target):
+        with self._lock:
+            input_hash = self._pending.pop(target)
+        self._write_input_hash(target, input_hash)
+        self._store_shared(target, input_hash)
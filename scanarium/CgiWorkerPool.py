@@ -0,0 +1,146 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import concurrent.futures
+import importlib.util
+import logging
+import os
+import sys
+
+from .Environment import get_cgi_arguments
+from .Scanarium import Scanarium
+from .ScanariumError import ScanariumError
+
+logger = logging.getLogger(__name__)
+
+# The cgis that can get served from worker processes, mapped to the name of
+# the function to call within the cgi's script. Only cgis that do not keep
+# state across calls can be listed here.
+IN_PROCESS_CGI_FUNCTIONS = {
+    'dump-dynamic-config': 'dump',
+    'reindex': 'reindex',
+    'report-feedback': 'report_feedback',
+    'scan-data': 'scan_data',
+    'scan-data-batch': 'scan_data_batch',
+}
+
+# Maps cgi names to pairs of function and whitelisted fields. This is only set
+# within worker processes.
+WORKER_CGIS = {}
+
+# The configuration of the pool's Scanarium as string. This is only set within
+# worker processes.
+WORKER_CONFIG = None
+
+
+# Loads the cgis' scripts, unless the worker process has already been
+# initialized. `ProcessPoolExecutor`'s `initializer` would be simpler, but
+# needs Python >=3.7. So each task passes the arguments to initialize with,
+# and the first task of each worker initializes it.
+def _init_worker(backend_dir_abs, cgis, config):
+    global WORKER_CONFIG
+    if WORKER_CONFIG is not None:
+        return
+    WORKER_CONFIG = config
+
+    # Scripts import sibling scripts (E.g.: `scan-data` imports `scan`), so
+    # the backend directory needs to be on the path.
+    sys.path.insert(0, backend_dir_abs)
+    for cgi in cgis:
+        module_name = 'scanarium_cgi_' + cgi.replace('-', '_')
+        spec = importlib.util.spec_from_file_location(
+            module_name, os.path.join(backend_dir_abs, cgi + '.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        WORKER_CGIS[cgi] = (
+            getattr(module, IN_PROCESS_CGI_FUNCTIONS[cgi]),
+            getattr(module, 'WHITELISTED_CGI_FIELDS', {}))
+
+
+def _run_in_worker(init_args, cgi, fields):
+    _init_worker(*init_args)
+    func, whitelisted_fields = WORKER_CGIS[cgi]
+
+    def getlist(name):
+        ret = fields.get(name, [])
+        if not isinstance(ret, list):
+            ret = [ret]
+        return ret
+
+    def getfirst(name, default):
+        values = getlist(name)
+        return values[0] if values else default
+
+    arguments = get_cgi_arguments(getfirst, whitelisted_fields, getlist)
+
+    # A fresh Scanarium per call, as cgis may change configuration (E.g.:
+    # `scan-data` switches the image source). As overrides from the command
+    # line are gone by now, we use the pool's configuration.
+    scanarium = Scanarium(WORKER_CONFIG)
+    return scanarium.call_guarded_cgi(cgi, func, *arguments)
+
+
+def _ping(init_args):
+    _init_worker(*init_args)
+    return True
+
+
+# A pool of worker processes that serve cgi calls without starting a new
+# interpreter for each call.
+#
+# Each worker process loads the cgis' scripts (and thereby their imports, like
+# OpenCV) once at startup. Calls behave like calls through a webserver (E.g.:
+# the cgi's `allow` configuration is honored), and their results are the JSON
+# strings that the cgi scripts would print. Calls use `scanarium`'s
+# configuration.
+class CgiWorkerPool(object):
+    def __init__(self, scanarium, cgis, size):
+        super(CgiWorkerPool, self).__init__()
+        for cgi in cgis:
+            if cgi not in IN_PROCESS_CGI_FUNCTIONS:
+                raise ScanariumError(
+                    'SE_CGI_NOT_IN_PROCESS',
+                    'The cgi "{cgi_name}" cannot get served in-process',
+                    {'cgi_name': cgi})
+        self._backend_dir_abs = scanarium.get_backend_dir_abs()
+        self._config = scanarium.dump_config_string()
+        self._cgis = list(cgis)
+        self._size = max(1, size)
+        self._executor = None
+        self.start()
+
+    def start(self):
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self._size)
+
+        # Starting the workers right away, so the first calls do not have to
+        # wait for the scripts to load.
+        futures = [self._executor.submit(_ping, self._get_init_args())
+                   for i in range(self._size)]
+        for future in futures:
+            future.result()
+
+    def _get_init_args(self):
+        return (self._backend_dir_abs, self._cgis, self._config)
+
+    def restart(self):
+        logger.warning('Restarting cgi worker pool')
+        self.shutdown()
+        self.start()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def serves(self, cgi):
+        return cgi in self._cgis
+
+    # `fields` maps field names to their values (either `str`, or
+    # `UploadedFile` for uploaded files), or to lists of values for fields
+    # that occur more than once. Uploaded files have to exist until the
+    # result is available. Returns a future for the result's JSON string.
+    def submit(self, cgi, fields):
+        return self._executor.submit(_run_in_worker, self._get_init_args(),
+                                     cgi, fields)
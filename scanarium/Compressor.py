@@ -0,0 +1,139 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import collections
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional. Without it, we only offer gzip.
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Maps encodings (as in `Content-Encoding`) to the suffix of precompressed
+# files. Encodings are ordered by preference.
+ENCODING_SUFFIXES = collections.OrderedDict()
+if brotli is not None:
+    ENCODING_SUFFIXES['br'] = '.br'
+ENCODING_SUFFIXES['gzip'] = '.gz'
+
+
+def compress(data, encoding, best=True):
+    if encoding == 'br':
+        ret = brotli.compress(data, quality=11 if best else 5)
+    elif encoding == 'gzip':
+        ret = gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+    else:
+        raise RuntimeError('Unknown encoding "%s"' % (encoding))
+    return ret
+
+
+# Returns the preferred available encoding that the given `Accept-Encoding`
+# header value allows, or None, if the content should get sent unencoded.
+def negotiate_encoding(accept_encoding):
+    qualities = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, parameters = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for parameter in parameters.split(';'):
+            key, _, value = parameter.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+
+    ret = None
+    best_quality = 0.0
+    for encoding in ENCODING_SUFFIXES:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            ret = encoding
+            best_quality = quality
+    return ret
+
+
+# Compresses static files ahead of time, and other content on the fly.
+#
+# Files get precompressed into siblings with the encoding's suffix (E.g.:
+# `foo.js.gz` for `foo.js`), so webservers can send them without compressing
+# again. Content compressed on the fly gets cached in memory, up to
+# `cache_size` bytes of compressed data. Least recently used entries get
+# evicted first.
+class Compressor(object):
+    def __init__(self, cache_size=0):
+        super(Compressor, self).__init__()
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_encodings(self):
+        return list(ENCODING_SUFFIXES)
+
+    def negotiate_encoding(self, accept_encoding):
+        return negotiate_encoding(accept_encoding)
+
+    def get_precompressed_file(self, file, encoding):
+        return file + ENCODING_SUFFIXES[encoding]
+
+    def precompress_file(self, file, encoding):
+        target = self.get_precompressed_file(file, encoding)
+        with open(file, 'rb') as f:
+            data = compress(f.read(), encoding)
+
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(target),
+                                        prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            shutil.copymode(file, tmp_file)
+            os.replace(tmp_file, target)
+        except Exception:
+            os.remove(tmp_file)
+            raise
+
+    # Returns the fresh precompressed sibling of `file` for `encoding`, or
+    # None, if there is no such sibling.
+    def find_precompressed_file(self, file, encoding, mtime):
+        ret = self.get_precompressed_file(file, encoding)
+        try:
+            if os.stat(ret).st_mtime < mtime:
+                # The file changed after it got precompressed.
+                ret = None
+        except OSError:
+            ret = None
+        return ret
+
+    # Compresses `data` on the fly. `key` has to identify `data` (E.g.: file
+    # name, mtime, and size).
+    def compress_cached(self, key, data, encoding):
+        cache_key = (key, encoding)
+        with self._lock:
+            ret = self._cache.get(cache_key, None)
+            if ret is not None:
+                self._cache.move_to_end(cache_key)
+
+        if ret is None:
+            ret = compress(data, encoding, best=False)
+            if len(ret) <= self._cache_size:
+                with self._lock:
+                    if cache_key not in self._cache:
+                        self._cache[cache_key] = ret
+                        self._cached_bytes += len(ret)
+                    while self._cached_bytes > self._cache_size:
+                        _, evicted = self._cache.popitem(last=False)
+                        self._cached_bytes -= len(evicted)
+        return ret
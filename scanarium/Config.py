@@ -2,19 +2,158 @@
 # GNU Affero General Public License v3.0 (See LICENSE.md)
 # SPDX-License-Identifier: AGPL-3.0-only
 
-import configparser
+import io
+import json
+import logging
 import os
 import sys
+import tempfile
 
 from .ScanariumError import ScanariumError
 
+logger = logging.getLogger(__name__)
 
+# Version of the format of cache files. Bump this whenever the format of the
+# cached snapshot changes.
+CACHE_VERSION = 1
+
+BOOLEAN_STATES = {
+    '1': True, 'yes': True, 'true': True, 'on': True,
+    '0': False, 'no': False, 'false': False, 'off': False,
+}
+
+MISSING = object()
+
+
+def parse_boolean(value):
+    try:
+        return BOOLEAN_STATES[value.lower()]
+    except KeyError:
+        raise ValueError('Not a boolean: %s' % value)
+
+
+def parse_list(value):
+    return tuple(item.strip() for item in value.split(',') if item.strip())
+
+
+PARSERS = {
+    'string': str,
+    'boolean': parse_boolean,
+    'int': int,
+    'float': float,
+    'list': parse_list,
+}
+
+
+# Turns a ConfigParser into a snapshot (a dict of sections, each of which is a
+# dict of keys to (interpolated) values).
+def get_snapshot(config):
+    import configparser
+    ret = {}
+    for section in config.sections():
+        values = {}
+        for key in config.options(section):
+            try:
+                value = config.get(section, key)
+            except configparser.InterpolationError:
+                # Not all sections are meant for interpolation (E.g.: the
+                # format of log lines), so we fall back to the raw value.
+                value = config.get(section, key, raw=True)
+            values[key] = value
+        ret[section] = values
+    return ret
+
+
+# The configuration, as read from the config files (and overrides).
+#
+# Configuration gets read on each cgi call, and looked up many times while
+# scanning a frame. So the config files get parsed once into a snapshot of
+# plain dicts, and typed values get converted at most once. To spare cgi
+# calls from parsing the config files, the snapshot gets cached in
+# `scanarium.conf.cache` next to the config files. The cache is keyed by the
+# modification times and sizes of the read files, and skipped silently if the
+# config directory is not writable.
 class Config(object):
-    def __init__(self, config_dir_abs):
+    # If `config_string` is given, the configuration gets read from it (as
+    # returned by `dump_string`) instead of from `config_dir_abs` and the
+    # command line.
+    def __init__(self, config_dir_abs, config_string=None):
         super(Config, self).__init__()
-        self._load_config(config_dir_abs)
+        self._typed = {}
+        if config_string is None:
+            self._load_config(config_dir_abs)
+        else:
+            import configparser
+            config = configparser.ConfigParser()
+            config.read_string(config_string)
+            self._snapshot = get_snapshot(config)
+
+    def _get_cache_key(self, files):
+        ret = [CACHE_VERSION]
+        for file in files:
+            try:
+                stat = os.stat(file)
+                ret.append([os.path.abspath(file), stat.st_mtime_ns,
+                            stat.st_size])
+            except FileNotFoundError:
+                ret.append([os.path.abspath(file), None, None])
+        return ret
+
+    def _read_cache(self, cache_file, key):
+        try:
+            with open(cache_file, 'r') as f:
+                cache = json.load(f)
+            if cache['key'] == key:
+                return cache['snapshot']
+        except Exception:
+            pass
+        return None
+
+    def _write_cache(self, cache_file, key, snapshot):
+        tmp_file = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                    mode='w', dir=os.path.dirname(cache_file),
+                    prefix='.scanarium.conf.cache-', delete=False) as f:
+                tmp_file = f.name
+                json.dump({'key': key, 'snapshot': snapshot}, f)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            logger.debug(f'Could not write config cache "{cache_file}"')
+            if tmp_file is not None and os.path.exists(tmp_file):
+                os.unlink(tmp_file)
 
     def _load_config(self, config_dir_abs):
+        config_files = [
+            os.path.join(config_dir_abs, 'scanarium.conf.defaults'),
+            os.path.join(config_dir_abs, 'scanarium.conf'),
+        ]
+        cache_file = os.path.join(config_dir_abs, 'scanarium.conf.cache')
+        cache_key = None
+        self._snapshot = None
+
+        overriding = len(sys.argv) >= 2 and \
+            sys.argv[1] == '--debug-config-override'
+        if not overriding or \
+                (len(sys.argv) >= 3 and os.path.isfile(sys.argv[2])):
+            # Erroneous overrides get parsed, so they raise the proper error.
+            if overriding:
+                config_files.append(sys.argv[2])
+            cache_key = self._get_cache_key(config_files)
+            self._snapshot = self._read_cache(cache_file, cache_key)
+
+        if self._snapshot is None:
+            self._parse_config(config_dir_abs)
+            if cache_key is not None:
+                self._write_cache(cache_file, cache_key, self._snapshot)
+        elif overriding:
+            # Snapshots with an override file only got cached, if the
+            # override file was allowed and read.
+            del sys.argv[2]
+            del sys.argv[1]
+
+    def _parse_config(self, config_dir_abs):
+        import configparser
         config = configparser.ConfigParser()
 
         config.read(os.path.join(config_dir_abs, 'scanarium.conf.defaults'))
@@ -23,7 +162,7 @@ class Config(object):
         if os.path.isfile(config_file_abs):
             config.read(config_file_abs)
 
-        self._config = config
+        self._snapshot = get_snapshot(config)
 
         if len(sys.argv) >= 2 and sys.argv[1] == '--debug-config-override':
             if self.get('debug',
@@ -35,7 +174,8 @@ class Config(object):
                     override_file = sys.argv[2]
                     if os.path.isfile(override_file):
                         config.read(override_file)
-                        config.read(override_file)
+                        self._snapshot = get_snapshot(config)
+                        self._typed = {}
                         del sys.argv[2]
                         del sys.argv[1]
                     else:
@@ -56,38 +196,63 @@ class Config(object):
                     'but the configuration at `debug.enable_debug_config_'
                     'override_command_line_argument` is not `True`.')
 
+    def _get_typed(self, section, key, kind):
+        typed_key = (section, key, kind)
+        try:
+            return self._typed[typed_key]
+        except KeyError:
+            pass
+
+        try:
+            parser = PARSERS[kind]
+        except KeyError:
+            raise RuntimeError('Unknown config value type "%s"' % (kind))
+
+        value = self._snapshot.get(section, {}).get(key, MISSING)
+        if value is not MISSING and value != '':
+            value = parser(value)
+        self._typed[typed_key] = value
+        return value
+
+    # `kind` is one of `string`, `boolean`, `int`, `float`, or `list` (for
+    # comma separated strings, which get returned as tuple of the stripped,
+    # non-empty items).
     def get(self, section, key, kind='string', allow_empty=False,
             allow_missing=False, default=None):
-        try:
-            if self._config.get(section, key) == '':
-                if allow_empty:
-                    return default
-                else:
-                    raise ScanariumError(
-                        'SE_CONFIG_EMPTY',
-                        'Empty configuration entry at "{key}" in "{section}"',
-                        {'section': section, 'key': key})
-        except (configparser.NoSectionError, configparser.NoOptionError):
+        value = self._get_typed(section, key, kind)
+        if value is MISSING:
             if allow_missing:
                 return default
             raise ScanariumError(
                 'SE_CONFIG_MISSING',
                 'Missing configuration entry at "{key}" in "{section}"',
                 {'section': section, 'key': key})
-        if kind == 'string':
-            func = self._config.get
-        elif kind == 'boolean':
-            func = self._config.getboolean
-        elif kind == 'int':
-            func = self._config.getint
-        elif kind == 'float':
-            func = self._config.getfloat
-        else:
-            raise RuntimeError('Unknown config value type "%s"' % (kind))
-        return func(section, key)
+        if value == '':
+            if allow_empty:
+                return default
+            else:
+                raise ScanariumError(
+                    'SE_CONFIG_EMPTY',
+                    'Empty configuration entry at "{key}" in "{section}"',
+                    {'section': section, 'key': key})
+        return value
 
     def set(self, section, key, value):
-        self._config.set(section, key, value)
+        if not isinstance(value, str):
+            raise TypeError('option values must be strings')
+        if section not in self._snapshot:
+            import configparser
+            raise configparser.NoSectionError(section)
+        self._snapshot[section][key] = value
+        self._typed = {}
 
     def get_keys(self, section):
-        return [pair[0] for pair in self._config.items(section)]
+        return list(self._snapshot[section])
+
+    def dump_string(self):
+        import configparser
+        config = configparser.ConfigParser(interpolation=None)
+        config.read_dict(self._snapshot)
+        with io.StringIO() as f:
+            config.write(f)
+            return f.getvalue()
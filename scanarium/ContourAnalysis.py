@@ -0,0 +1,179 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import math
+
+import cv2
+import numpy as np
+
+from .scanner_util import debug_show_contours, get_cv_major_version
+
+
+# The contours of a prepared (grayscale) image, and the means to find rects
+# among them.
+#
+# Finding edges and contours is the expensive part of finding rects. So the
+# analysis happens once per prepared image, and then answers all queries for
+# rects (E.g.: for the biggest rect, or for the rect around each of many QR
+# codes). Contours too small to be a sheet get dropped right away, and each of
+# the remaining contours gets approximated at most once.
+#
+# Instances can be queried from many threads.
+class ContourAnalysis(object):
+    def __init__(self, scanarium, image):
+        super(ContourAnalysis, self).__init__()
+        self._scanarium = scanarium
+        self._image = image
+        (self._contours, self._hierarchy) = self._find_contours()
+
+        image_area = image.shape[0] * image.shape[1]
+        contour_min_area = image_area / 25
+
+        # Noisy images yield many thousand contours, nearly all of them
+        # tiny. By the isoperimetric inequality, a contour cannot enclose
+        # more than perimeter^2 / (4 pi), and as consecutive points of a
+        # contour are at most sqrt(2) apart, the perimeter is at most
+        # sqrt(2) times the number of points. So contours with too few points
+        # get dropped without computing their area.
+        self._areas = {}
+        for i, contour in enumerate(self._contours):
+            if len(contour) ** 2 / (2 * math.pi) >= contour_min_area:
+                area = cv2.contourArea(contour)
+                if area >= contour_min_area:
+                    self._areas[i] = area
+
+        candidates = list(self._areas)
+        self._candidates = {
+            True: sorted(candidates, key=self._areas.__getitem__,
+                         reverse=True),
+            False: sorted(candidates, key=self._areas.__getitem__),
+        }
+        self._bounding_boxes = {i: cv2.boundingRect(self._contours[i])
+                                for i in candidates}
+        self._approximations = {}
+
+    def _find_contours(self):
+        scanarium = self._scanarium
+        prepared_image = self._image
+
+        canny_blur_size = scanarium.get_config('scan', 'canny_blur_size',
+                                               kind='int')
+        canny_threshold_1 = scanarium.get_config('scan', 'canny_threshold_1',
+                                                 kind='int')
+        canny_threshold_2 = scanarium.get_config('scan', 'canny_threshold_2',
+                                                 kind='int')
+        if canny_blur_size > 1:
+            prepared_image = cv2.blur(
+                prepared_image, (canny_blur_size, canny_blur_size))
+        edges_image = cv2.Canny(prepared_image, canny_threshold_1,
+                                canny_threshold_2)
+        # RETR_EXTERNAL would be quicker, but would drop the inner contours
+        # that rects around QR codes often are. And pruning by RETR_TREE
+        # would not buy much, as contours get filtered by their number of
+        # points and bounding boxes before any costly work anyways. So we
+        # stick with the simpler RETR_LIST.
+        contours_result = cv2.findContours(edges_image, cv2.RETR_LIST,
+                                           cv2.CHAIN_APPROX_NONE)
+
+        if get_cv_major_version() >= 4:
+            contours, hierarchy = contours_result
+        else:
+            # OpenCV <4 used to pass back the image as first element in the
+            # tuple. So we get rid of that to transparently work on OpenCV 3.x
+            _, contours, hierarchy = contours_result
+
+        return (contours, hierarchy)
+
+    def _get_approximation(self, i):
+        ret = self._approximations.get(i)
+        if ret is None:
+            contour = self._contours[i]
+            peri = cv2.arcLength(contour, True)
+            ret = cv2.approxPolyDP(contour, 0.02 * peri, True)
+            self._approximations[i] = ret
+        return ret
+
+    def _debug_show(self, decreasingArea, required_points, ratings):
+        scanarium = self._scanarium
+        if not scanarium.are_debug_images_enabled():
+            return
+
+        debug_show_contours(scanarium, 'All contours', self._image,
+                            self._contours, self._hierarchy,
+                            points=required_points)
+
+        show_contours = scanarium.is_debug_image_shown('Rated contours')
+        show_approximations = scanarium.is_debug_image_shown(
+            'Rated approximations')
+        if show_contours or show_approximations:
+            # Showing contours in the order they would have been checked
+            areas = [self._areas.get(i) or cv2.contourArea(contour)
+                     for i, contour in enumerate(self._contours)]
+            order = sorted(range(len(self._contours)),
+                           key=areas.__getitem__, reverse=decreasingArea)
+            contours = []
+            approximations = []
+            ratings_list = []
+            for i in order:
+                rating = ratings.get(i, 'small')
+                contours.append(self._contours[i])
+                approximations.append(self._approximations.get(i))
+                ratings_list.append(rating)
+                if rating == 'good':
+                    break
+
+            debug_show_contours(scanarium, 'Rated contours', self._image,
+                                contours, self._hierarchy,
+                                ratings=ratings_list, points=required_points)
+            debug_show_contours(scanarium, 'Rated approximations',
+                                self._image, approximations, self._hierarchy,
+                                ratings=ratings_list, points=required_points)
+
+    # Returns the candidates (ordered by area) whose bounding boxes contain
+    # all `required_points`. As contours lie within their bounding box, only
+    # those candidates can contain all required points.
+    def _get_candidates(self, decreasingArea, required_points):
+        candidates = self._candidates[decreasingArea]
+        if required_points and candidates:
+            boxes = np.array([self._bounding_boxes[i] for i in candidates])
+            (left, top) = (boxes[:, 0], boxes[:, 1])
+            right = left + boxes[:, 2]
+            bottom = top + boxes[:, 3]
+            inside = np.ones(len(candidates), dtype=bool)
+            for (x, y) in required_points:
+                inside &= (left <= x) & (x < right) & (top <= y) & (y < bottom)
+            candidates = [i for i, is_inside in zip(candidates, inside)
+                          if is_inside]
+        return candidates
+
+    # Returns the approximation of the first contour (ordered by area) that is
+    # big enough, looks like a rect, and contains all `required_points`, or
+    # None if there is no such contour.
+    def find_rect_points(self, decreasingArea=True, required_points=[]):
+        good_approx = None
+        ratings = {i: 'outside-point'
+                   for i in self._candidates[decreasingArea]}
+        for i in self._get_candidates(decreasingArea, required_points):
+            approx = self._get_approximation(i)
+
+            if len(approx) == 4:
+                # 4 points ... that looks should be turned into a rectangle
+
+                if any(cv2.pointPolygonTest(approx, point, False) < 0
+                       for point in required_points):
+                    # A required point is outside, so we skip this contour.
+                    ratings[i] = 'outside-point'
+                    continue
+
+                # The contour is big enough, looks like a rect, and contains
+                # all required points. That's the contour to continue with.
+                good_approx = approx
+                ratings[i] = 'good'
+                break
+            else:
+                ratings[i] = 'non-rect'
+
+        self._debug_show(decreasingArea, required_points, ratings)
+
+        return good_approx
@@ -0,0 +1,226 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import json
+import logging
+import mmap
+import os
+import select
+import subprocess
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from .ScanariumError import ScanariumError
+
+logger = logging.getLogger(__name__)
+
+HELPER_FILE_ABS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'decoder_helper.py')
+
+
+# A single helper process along with the buffer it writes pixels to.
+class _Decoder(object):
+    def __init__(self, command, timeout, max_pixels, memory_limit,
+                 buffer_dir):
+        super(_Decoder, self).__init__()
+        self._command = command
+        self._timeout = timeout
+        self._buffer_file = tempfile.NamedTemporaryFile(
+            prefix='scanarium-decoder-', dir=buffer_dir)
+        self._buffer_file.truncate(max_pixels * 3)
+        self._buffer = mmap.mmap(self._buffer_file.fileno(), max_pixels * 3)
+
+        full_command = command + [
+            HELPER_FILE_ABS,
+            '--buffer', self._buffer_file.name,
+            '--max-pixels', str(max_pixels),
+            '--memory-limit', str(memory_limit),
+        ]
+        logger.debug(f'Starting decoder helper "{full_command}"')
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(
+            full_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=self._stderr, cwd='/')
+        self._output = b''
+        self.formats = self._read_response()['formats']
+
+    def _raise(self, code, template, parameters):
+        self._stderr.seek(0)
+        stderr = self._stderr.read().decode(errors='replace')
+        self.close(kill=True)
+        raise ScanariumError(code, template, parameters,
+                             private_parameters={'stderr': stderr})
+
+    def _read_response(self):
+        fd = self._process.stdout.fileno()
+        deadline = time.time() + self._timeout
+        while b'\n' not in self._output:
+            remaining = deadline - time.time()
+            readable = []
+            if remaining > 0:
+                readable, _, _ = select.select([fd], [], [], remaining)
+            if not readable:
+                self._raise(
+                    'SE_TIMEOUT', 'The command "{command}" did not finish '
+                    'within {timeout} seconds',
+                    {'command': str(self._command), 'timeout': self._timeout})
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                self._raise(
+                    'SE_RETURN_VALUE', 'The command "{command}" did not '
+                    'return 0', {'command': str(self._command)})
+            self._output += chunk
+
+        line, self._output = self._output.split(b'\n', 1)
+        try:
+            return json.loads(line)
+        except ValueError:
+            self._raise(
+                'SE_RETURN_VALUE', 'The command "{command}" did not '
+                'return 0', {'command': str(self._command)})
+
+    def is_alive(self):
+        return self._process is not None
+
+    def decode(self, request):
+        try:
+            self._process.stdin.write(json.dumps(request).encode() + b'\n')
+            self._process.stdin.flush()
+        except OSError:
+            self._raise(
+                'SE_RETURN_VALUE', 'The command "{command}" did not return 0',
+                {'command': str(self._command)})
+
+        response = self._read_response()
+        if 'error' in response:
+            raise ScanariumError(
+                'SE_DECODER_FAILED', 'Decoding "{file}" failed',
+                {'file': request['file']},
+                private_parameters={'error': response['error']})
+
+        shape = (response['height'], response['width'], 3)
+        image = np.frombuffer(self._buffer, dtype=np.uint8,
+                              count=shape[0] * shape[1] * 3)
+        return (image.reshape(shape).copy(), response['pages'])
+
+    # Stops the helper. Upon `kill`, the helper gets killed right away.
+    # Otherwise, it gets asked to exit, and only killed if it does not exit
+    # within the timeout.
+    def close(self, kill=False):
+        if self._process is not None:
+            process = self._process
+            self._process = None
+            try:
+                if kill:
+                    process.kill()
+                process.stdin.close()
+                process.wait(timeout=self._timeout)
+            except Exception:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+        if self._stderr is not None:
+            self._stderr.close()
+            self._stderr = None
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
+            self._buffer_file.close()
+
+
+# A pool of long-running helper processes that decode untrusted files (E.g.:
+# PDFs or HEICs) to images.
+#
+# Converting such files through external programs means starting a process,
+# re-encoding to JPG, and reading the JPG back for each file. Instead, the
+# helpers stay running and decode files with libraries right away. The decoded
+# pixels get passed through a buffer file that is shared between helper and
+# pool (placed in `/dev/shm` if available), so they neither get re-encoded
+# nor copied through pipes.
+#
+# Like the external programs, helpers are separate processes (started by
+# `command`, which may be a sandboxing wrapper around a Python interpreter),
+# and limited in memory and image size. Helpers that do not answer within
+# `timeout` seconds get killed and replaced by fresh ones.
+#
+# Instances are thread-safe. At most `size` files get decoded in parallel.
+class DecoderPool(object):
+    def __init__(self, command, size, timeout, max_pixels, memory_limit=0,
+                 buffer_dir=None):
+        super(DecoderPool, self).__init__()
+        if buffer_dir is None and os.path.isdir('/dev/shm'):
+            buffer_dir = '/dev/shm'
+        self._command = command
+        self._size = max(1, size)
+        self._timeout = timeout
+        self._max_pixels = max_pixels
+        self._memory_limit = memory_limit
+        self._buffer_dir = buffer_dir
+        self._condition = threading.Condition()
+        self._idle = []
+        self._started = 0
+        self._formats = None
+
+    def _acquire(self):
+        with self._condition:
+            while not self._idle and self._started >= self._size:
+                self._condition.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._started += 1
+
+        try:
+            return _Decoder(self._command, self._timeout, self._max_pixels,
+                            self._memory_limit, self._buffer_dir)
+        except Exception:
+            self._release(None)
+            raise
+
+    def _release(self, decoder):
+        with self._condition:
+            if decoder is not None and decoder.is_alive():
+                self._idle.append(decoder)
+            else:
+                self._started -= 1
+            self._condition.notify()
+
+    def _with_decoder(self, func):
+        decoder = self._acquire()
+        try:
+            with self._condition:
+                self._formats = decoder.formats
+            return func(decoder)
+        finally:
+            self._release(decoder)
+
+    # Returns whether the helpers can decode files of the given format (as
+    # in `guess_image_format`).
+    def supports(self, format):
+        if self._formats is None:
+            self._with_decoder(lambda decoder: None)
+        return format in self._formats
+
+    # Decodes page `page` (counting from 0) of `file_path`. Documents get
+    # rendered at `dpi`. Returns the pair of the decoded BGR image and the
+    # file's number of pages.
+    def decode(self, file_path, format, dpi=None, page=0):
+        request = {
+            'file': os.path.abspath(file_path),
+            'format': format,
+            'dpi': dpi,
+            'page': page,
+        }
+        logger.debug(f'Decoding through helper: "{request}"')
+        return self._with_decoder(lambda decoder: decoder.decode(request))
+
+    def close(self):
+        with self._condition:
+            decoders = self._idle
+            self._idle = []
+            self._started -= len(decoders)
+        for decoder in decoders:
+            decoder.close()
@@ -4,18 +4,21 @@
 
 import argparse
 import base64
-import cgi
 import locale
 import logging
 import os
 import re
+import shutil
 import signal
-import subprocess
 import sys
+import tempfile
 import traceback
+import uuid
 
+from .FormParser import FormParser
 from .ScanariumError import ScanariumError
 from .Result import Result
+from .UploadedFile import UploadedFile
 
 IS_CGI = 'REMOTE_ADDR' in os.environ
 LOG_FORMAT = ('%(asctime)s.%(msecs)03d %(levelname)-5s [%(threadName)s] '
@@ -35,6 +38,32 @@ if IS_CGI:
     sys.argv = sys.argv[0:1]
 
 
+# Maps cgi fields to positional arguments
+#
+# `getfirst` is a function that takes the field name and a default, and
+# returns the field's value (E.g.: `FormParser.getfirst`). `fields` maps the
+# names of the fields to use to their (1-based) argument positions. A position
+# of `*` takes all values of the field (using `getlist`, which takes the field
+# name and returns the list of its values. E.g.: `FormParser.getlist`) and
+# appends them after the other arguments. Values are passed on as they are,
+# so uploaded files stay `UploadedFile`s.
+def get_cgi_arguments(getfirst, fields, getlist=None):
+    arguments = ['']
+    trailing_arguments = []
+    for source, target in fields.items():
+        if target == '*':
+            trailing_arguments += getlist(source)
+            continue
+
+        value = getfirst(source, '')
+
+        if len(arguments) <= target:
+            arguments += [''] * (target - len(arguments) + 1)
+        arguments[target] = value
+
+    return arguments[1:] + trailing_arguments
+
+
 class Environment(object):
     def __init__(self, backend_dir_abs, config, dumper, util):
         super(Environment, self).__init__()
@@ -43,6 +72,7 @@ class Environment(object):
         self._dumper = dumper
         self._util = util
         self._cleanup_functions = set()
+        self._uploads = {}
         self.set_signal_handlers()
         self.reset_method()
 
@@ -56,7 +86,8 @@ class Environment(object):
 
     # `timeout`: Either a number in seconds, or the string `default` to pick
     #   the default timeout from configuration files.
-    def run(self, command, check=True, timeout='default', input=None):
+    def run(self, command, check=True, timeout='default', input=None,
+            cwd=None):
         if timeout == 'default':
             timeout = self._config.get('general', 'external_program_timeout',
                                        kind='int')
@@ -64,9 +95,10 @@ class Environment(object):
         sep = "\" \""
         logger.debug(f'Running external command with check={check}, '
                      f'timeout={timeout}: "{sep.join(command)}"')
+        import subprocess
         try:
             process = subprocess.run(
-                command, check=check, timeout=timeout, input=input,
+                command, check=check, timeout=timeout, input=input, cwd=cwd,
                 stdout=subprocess.PIPE, stderr=subprocess.PIPE,
                 universal_newlines=True)
         except subprocess.TimeoutExpired as e:
@@ -92,8 +124,8 @@ class Environment(object):
             'stderr': process.stderr,
         }
 
-    def _set_display(self):
-        if IS_CGI:
+    def _set_display(self, is_cgi=IS_CGI):
+        if is_cgi:
             display = self._config.get('cgi', 'display', allow_empty=True,
                                        allow_missing=True)
             if display:
@@ -116,9 +148,7 @@ class Environment(object):
             caller = caller[:-3]
         return caller
 
-    def call_guarded(self, func_self, func, *args, check_caller=True,
-                     **kwargs):
-        self.reset_method()
+    def _log_cgi_date(self):
         if self._config.get('log', 'cgi_date', kind='boolean'):
             try:
                 now = self._util.get_now()
@@ -130,33 +160,73 @@ class Environment(object):
                 # Logging failed. There's not much we can do here.
                 pass
 
+    def _log_cgi_result(self, ret):
+        if self._config.get('log', 'cgi_results', kind='boolean'):
+            try:
+                log_filename = self._util.get_log_filename('cgi-result.json')
+                self._dumper.dump_json(log_filename, ret)
+            except Exception:
+                # Logging failed. There's not much we can do here.
+                pass
+
+    def _call_guarded_func(self, func_self, func, caller, check_caller,
+                           is_cgi, args, kwargs):
+        if not re.match(r'^[a-zA-Z-]*$', caller) and check_caller:
+            raise ScanariumError('SE_CGI_NAME_CHARS',
+                                 'Forbidden characters in cgi name')
+
+        os.environ['SCANARIUM_METHOD'] = caller
+
+        if is_cgi:
+            if not self._config.get('cgi:%s' % caller, 'allow', 'boolean'):
+                raise ScanariumError('SE_CGI_FORBIDDEN',
+                                     'Calling script "{script_name}" as '
+                                     'cgi is forbidden',
+                                     {'script_name': caller})
+
+        self._set_display(is_cgi)
+
+        return func(func_self, *args, **kwargs)
+
+    def call_guarded(self, func_self, func, *args, check_caller=True,
+                     **kwargs):
+        self.reset_method()
+        self._log_cgi_date()
+
         exc_info = None
         try:
             caller = self.normalized_caller(-2)
 
-            if not re.match(r'^[a-zA-Z-]*$', caller) and check_caller:
-                raise ScanariumError('SE_CGI_NAME_CHARS',
-                                     'Forbidden characters in cgi name')
-
-            os.environ['SCANARIUM_METHOD'] = caller
+            payload = self._call_guarded_func(
+                func_self, func, caller, check_caller, IS_CGI, args, kwargs)
+        except:  # noqa: E722
+            payload = 'Failed'
+            exc_info = sys.exc_info()
 
-            if IS_CGI:
-                if not self._config.get('cgi:%s' % caller, 'allow', 'boolean'):
-                    raise ScanariumError('SE_CGI_FORBIDDEN',
-                                         'Calling script "{script_name}" as '
-                                         'cgi is forbidden',
-                                         {'script_name': caller})
+        self._result(payload=payload, exc_info=exc_info)
 
-            self._set_display()
+    # Like `call_guarded` for a call as cgi `caller`, but instead of printing
+    # the result and exiting, the result gets returned as JSON string. This
+    # allows long-running processes to serve cgi calls.
+    def call_guarded_cgi(self, func_self, caller, func, *args, **kwargs):
+        self.reset_method()
+        self._log_cgi_date()
 
-            payload = func(func_self, *args, **kwargs)
+        exc_info = None
+        try:
+            payload = self._call_guarded_func(
+                func_self, func, caller, True, True, args, kwargs)
         except:  # noqa: E722
             payload = 'Failed'
             exc_info = sys.exc_info()
 
-        self._result(payload=payload, exc_info=exc_info)
+        ret = self._get_result(payload, exc_info).as_dict()
+        self._log_cgi_result(ret)
+        self.run_cleanup_functions()
+        self.reset_method()
+        return self._dumper.dump_json_string(ret)
 
-    def _result(self, payload={}, exc_info=None):
+    def _get_result(self, payload, exc_info):
         if isinstance(payload, Result):
             if exc_info is None:
                 result = payload
@@ -164,6 +234,10 @@ class Environment(object):
                 result = Result(payload.as_dict(), exc_info)
         else:
             result = Result(payload, exc_info)
+        return result
+
+    def _result(self, payload={}, exc_info=None):
+        result = self._get_result(payload, exc_info)
 
         exit_code = 0
         if IS_CGI:
@@ -181,37 +255,89 @@ class Environment(object):
 
         print(self._dumper.dump_json_string(ret))
 
-        if self._config.get('log', 'cgi_results', kind='boolean'):
-            try:
-                log_filename = self._util.get_log_filename('cgi-result.json')
-                self._dumper.dump_json(log_filename, ret)
-            except Exception:
-                # Logging failed. There's not much we can do here.
-                pass
+        self._log_cgi_result(ret)
 
         self.cleanup(exit_code=exit_code)
 
-    def _inject_cgi_arguments(self, fields):
-        parameters = cgi.FieldStorage()
-
-        arguments = ['']
-        for source, target in fields.items():
-            value = parameters.getfirst(source, '')
-
-            if isinstance(value, bytes):
-                value = base64.standard_b64encode(value).decode()
-
-            if len(arguments) <= target:
-                arguments += [''] * (target - len(arguments) + 1)
-            arguments[target] = value
+    def new_upload_dir(self):
+        ret = tempfile.mkdtemp(prefix='scanarium-upload-')
+        self.register_for_cleanup(
+            lambda: shutil.rmtree(ret, ignore_errors=True))
+        return ret
+
+    # Returns the maximum size in bytes of request bodies for `cgi`. Cgis may
+    # override the generic limit in their own section.
+    def get_max_upload_size(self, cgi):
+        ret = self._config.get(f'cgi:{cgi}', 'max_upload_size', kind='int',
+                               allow_missing=True)
+        if ret is None:
+            ret = self._config.get('cgi', 'max_upload_size', kind='int')
+        return ret
+
+    def _parse_cgi_fields(self):
+        content_length = os.environ.get('CONTENT_LENGTH', '')
+        cgi = os.path.basename(sys.argv[0])
+        if cgi.endswith('.py'):
+            cgi = cgi[:-3]
+        parser = FormParser(
+            os.environ.get('CONTENT_TYPE', ''),
+            int(content_length) if content_length else None,
+            self.get_max_upload_size(cgi),
+            self.new_upload_dir())
+        if os.environ.get('REQUEST_METHOD', 'GET') == 'POST':
+            parser.read_from(sys.stdin.buffer)
+        else:
+            parser.close()
+        parser.add_query(os.environ.get('QUERY_STRING', ''))
+        return parser
 
-        sys.argv += arguments[1:]
+    def _inject_cgi_arguments(self, fields):
+        parser = self._parse_cgi_fields()
+
+        # Uploaded files cannot go through `sys.argv`, so they get passed as
+        # unguessable placeholders that get resolved after argument parsing.
+        for value in get_cgi_arguments(parser.getfirst, fields,
+                                       parser.getlist):
+            if isinstance(value, UploadedFile):
+                placeholder = f'upload:{uuid.uuid4()}'
+                self._uploads[placeholder] = value
+                value = placeholder
+            sys.argv.append(value)
+
+    def _resolve_uploads(self, args):
+        def resolve(value):
+            if isinstance(value, str):
+                value = self._uploads.get(value, value)
+            return value
+
+        for name, value in vars(args).items():
+            if isinstance(value, list):
+                value = [resolve(element) for element in value]
+            else:
+                value = resolve(value)
+            setattr(args, name, value)
+
+    # Returns the name of a file holding the uploaded `data`. `data` is either
+    # an `UploadedFile`, or (when called from the command line) the base64
+    # encoded content, which gets written to a file in `dir`.
+    def get_upload_file_name(self, data, dir):
+        if isinstance(data, UploadedFile):
+            ret = data.path
+        else:
+            ret = os.path.join(dir, 'upload')
+            with open(ret, 'wb') as f:
+                f.write(base64.standard_b64decode(data))
+        return ret
 
     def handle_arguments(self, scanarium, description, register_func=None,
                          whitelisted_cgi_fields={}):
         if IS_CGI:
             try:
                 self._inject_cgi_arguments(whitelisted_cgi_fields)
+            except ScanariumError:
+                # The request itself got rejected (E.g.: as it is too large),
+                # so there is nothing to call and we answer right away.
+                self._result(payload='Failed', exc_info=sys.exc_info())
             except Exception:
                 logging.getLogger().exception('Parsing CGI arguments')
 
@@ -225,13 +351,14 @@ class Environment(object):
             register_func(scanarium, parser)
 
         args = parser.parse_args()
+        self._resolve_uploads(args)
 
         if args.verbose > 0:
             logging.getLogger().setLevel(logging.DEBUG)
 
         return args
 
-    def cleanup(self, signum=0, frame=None, exit_code=143):
+    def run_cleanup_functions(self):
         while len(self._cleanup_functions):
             f = self._cleanup_functions.pop()
             try:
@@ -239,6 +366,9 @@ class Environment(object):
             except Exception:
                 logging.getLogger().exception('Error while cleaning up')
 
+    def cleanup(self, signum=0, frame=None, exit_code=143):
+        self.run_cleanup_functions()
+
         sys.exit(exit_code)
 
     def register_for_cleanup(self, f):
@@ -0,0 +1,213 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import email.parser
+import logging
+import os
+import tempfile
+import urllib.parse
+
+from .ScanariumError import ScanariumError
+from .UploadedFile import UploadedFile
+
+logger = logging.getLogger(__name__)
+
+# Headers of a single part of a multipart body may not exceed this size.
+MAX_PART_HEADER_SIZE = 16384
+
+
+def raise_malformed():
+    raise ScanariumError('SE_UPLOAD_MALFORMED',
+                         'The uploaded form data is malformed')
+
+
+# Parses form data (multipart or URL encoded) while it gets read.
+#
+# Data gets passed in chunks through `feed`, so request bodies never have to
+# be held in memory as a whole. Uploaded files get written to files in
+# `upload_dir` right away and show up as `UploadedFile` values. All other
+# values are `str`. Bodies above `max_size` bytes get rejected. If
+# `content_length` is known, this happens before reading any data.
+class FormParser(object):
+    def __init__(self, content_type, content_length, max_size, upload_dir):
+        super(FormParser, self).__init__()
+        if content_length is not None and content_length > max_size:
+            self._raise_too_large(max_size)
+        self._content_length = content_length
+        self._max_size = max_size
+        self._upload_dir = upload_dir
+        self._size = 0
+        self._fields = []
+        self._buffer = b''
+        self._part = None
+        self._state = 'urlencoded'
+
+        message = email.parser.HeaderParser().parsestr(
+            'Content-Type: ' + (content_type or '') + '\n\n')
+        if message.get_content_type() == 'multipart/form-data':
+            boundary = message.get_param('boundary')
+            if not boundary:
+                raise_malformed()
+            self._delimiter = b'\r\n--' + boundary.encode('latin-1')
+            # The first delimiter needs no preceding line break, so we add
+            # one to be able to look for all delimiters alike.
+            self._buffer = b'\r\n'
+            self._state = 'preamble'
+
+    def _raise_too_large(self, max_size):
+        raise ScanariumError('SE_UPLOAD_TOO_LARGE',
+                             'Uploads may not exceed {max_size} bytes',
+                             {'max_size': str(max_size)})
+
+    def feed(self, data):
+        self._size += len(data)
+        if self._size > self._max_size:
+            self._raise_too_large(self._max_size)
+        if self._content_length is not None \
+                and self._size > self._content_length:
+            raise_malformed()
+
+        self._buffer += data
+        if self._state != 'urlencoded':
+            self._parse_multipart()
+
+    def read_from(self, stream, chunk_size=65536):
+        remaining = self._content_length
+        while remaining is None or remaining > 0:
+            chunk = stream.read(chunk_size if remaining is None
+                                else min(chunk_size, remaining))
+            if not chunk:
+                break
+            self.feed(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+        self.close()
+
+    def close(self):
+        if self._state == 'urlencoded':
+            self.add_query(self._buffer.decode('latin-1'))
+            self._buffer = b''
+        elif self._state != 'end':
+            if self._part is not None and self._part.get('file'):
+                self._part['file'].close()
+            raise_malformed()
+
+    def add_query(self, query):
+        for name, value in urllib.parse.parse_qsl(query,
+                                                  keep_blank_values=True):
+            self._fields.append((name, value))
+
+    def _start_part(self, header_bytes):
+        headers = email.parser.HeaderParser().parsestr(
+            header_bytes.decode('utf-8', 'replace'))
+        name = headers.get_param('name', header='content-disposition')
+        filename = headers.get_filename()
+        part = {
+            'name': name,
+            'charset': headers.get_content_charset('utf-8'),
+        }
+        if name is None:
+            part['file'] = None
+        elif filename is None:
+            part['value'] = b''
+        else:
+            fd, path = tempfile.mkstemp(dir=self._upload_dir,
+                                        prefix='upload-')
+            part['file'] = os.fdopen(fd, 'wb')
+            part['value'] = UploadedFile(path, filename)
+        self._part = part
+
+    def _write_part(self, data):
+        part = self._part
+        if 'file' in part:
+            if part['file'] is not None:
+                part['file'].write(data)
+        else:
+            part['value'] += data
+
+    def _end_part(self):
+        part = self._part
+        self._part = None
+        if part is not None and part['name'] is not None:
+            value = part['value']
+            if 'file' in part:
+                part['file'].close()
+            else:
+                try:
+                    value = value.decode(part['charset'], 'replace')
+                except LookupError:
+                    value = value.decode('utf-8', 'replace')
+            self._fields.append((part['name'], value))
+
+    def _parse_multipart(self):
+        delimiter = self._delimiter
+        while True:
+            if self._state in ['preamble', 'body']:
+                idx = self._buffer.find(delimiter)
+                if idx < 0:
+                    # The buffer's end could be the start of a delimiter, so
+                    # we keep enough data to find it once more data arrives.
+                    keep = len(delimiter) - 1
+                    if self._state == 'body' and len(self._buffer) > keep:
+                        self._write_part(self._buffer[:-keep])
+                    self._buffer = self._buffer[-keep:]
+                    break
+                if self._state == 'body':
+                    self._write_part(self._buffer[:idx])
+                    self._end_part()
+                self._buffer = self._buffer[idx + len(delimiter):]
+                self._state = 'delimiter'
+            elif self._state == 'delimiter':
+                if len(self._buffer) < 2:
+                    break
+                if self._buffer.startswith(b'--'):
+                    self._state = 'end'
+                else:
+                    idx = self._buffer.find(b'\r\n')
+                    if idx < 0:
+                        break
+                    if self._buffer[:idx].strip(b' \t'):
+                        raise_malformed()
+                    self._buffer = self._buffer[idx + 2:]
+                    self._state = 'headers'
+            elif self._state == 'headers':
+                idx = self._buffer.find(b'\r\n\r\n')
+                if idx < 0:
+                    if len(self._buffer) > MAX_PART_HEADER_SIZE:
+                        raise_malformed()
+                    break
+                self._start_part(self._buffer[:idx])
+                self._buffer = self._buffer[idx + 4:]
+                self._state = 'body'
+            else:
+                # Epilogue after the final delimiter, which we ignore.
+                self._buffer = b''
+                break
+
+    # Returns the first value of the field `name`, or `default` if there is
+    # no such field (like `cgi.FieldStorage.getfirst`).
+    def getfirst(self, name, default=None):
+        for field_name, value in self._fields:
+            if field_name == name:
+                return value
+        return default
+
+    # Returns the list of all values of the field `name` (like
+    # `cgi.FieldStorage.getlist`).
+    def getlist(self, name):
+        return [value for field_name, value in self._fields
+                if field_name == name]
+
+    # Returns a dict from field names to their value, or to the list of their
+    # values for fields that occur more than once.
+    def get_fields(self):
+        ret = {}
+        for name, value in self._fields:
+            if name in ret:
+                if not isinstance(ret[name], list):
+                    ret[name] = [ret[name]]
+                ret[name].append(value)
+            else:
+                ret[name] = value
+        return ret
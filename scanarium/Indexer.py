@@ -13,8 +13,33 @@ class Indexer(object):
         super(Indexer, self).__init__()
         self._dynamic_dir = dynamic_dir
         self._dumper = dumper
+        self._deferred_scenes = None
+
+    # Collects scenes to reindex instead of reindexing them right away, until
+    # `end_deferred_reindexing` gets called. This allows to reindex scenes
+    # only once after many scans. Returns False, if reindexing already got
+    # deferred before, and True otherwise.
+    def defer_reindexing(self):
+        ret = self._deferred_scenes is None
+        if ret:
+            self._deferred_scenes = set()
+        return ret
+
+    # Stops deferring reindexing. If `reindex` is True, the scenes that got
+    # deferred are reindexed now. Returns the set of deferred scenes.
+    def end_deferred_reindexing(self, reindex=True):
+        ret = self._deferred_scenes or set()
+        self._deferred_scenes = None
+        if reindex:
+            for scene in sorted(ret):
+                self.reindex_actors_for_scene(scene)
+        return ret
 
     def reindex_actors_for_scene(self, scene):
+        if self._deferred_scenes is not None:
+            self._deferred_scenes.add(scene)
+            return
+
         scene_dir = os.path.join(self._dynamic_dir, 'scenes', scene)
         actors_data = {
             'actors': {},
@@ -0,0 +1,127 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import logging
+import os
+import select
+import shlex
+import subprocess
+import tempfile
+import time
+
+from .ScanariumError import ScanariumError
+
+logger = logging.getLogger(__name__)
+
+PROMPT = b'>'
+
+
+# A long-running Inkscape in `--shell` mode.
+#
+# Starting Inkscape takes seconds, while a single export is typically quick.
+# So instead of starting a fresh Inkscape for each export, we keep a single
+# Inkscape in shell mode running and stream the arguments of each export to
+# it. Each line we send is interpreted like the command line arguments of a
+# separate Inkscape invocation. After each command, Inkscape prints a `>`
+# prompt. Everything before the prompt is the command's output.
+#
+# Instances are not thread-safe. Use one instance per thread.
+class InkscapeShell(object):
+    def __init__(self, command, timeout):
+        super(InkscapeShell, self).__init__()
+        self._command = command
+        self._timeout = timeout
+        self._process = None
+        self._stderr = None
+
+    def _start(self):
+        logger.debug(f'Starting Inkscape shell "{self._command}"')
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(
+            self._command + ['--shell'], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=self._stderr)
+        self._read_until_prompt(self._command)
+
+    def _read_stderr(self):
+        self._stderr.seek(0)
+        ret = self._stderr.read().decode(errors='replace')
+        self._stderr.seek(0)
+        self._stderr.truncate()
+        return ret
+
+    def _read_until_prompt(self, command):
+        fd = self._process.stdout.fileno()
+        deadline = time.time() + self._timeout
+        output = b''
+        while not (output == PROMPT or output.endswith(b'\n' + PROMPT)):
+            remaining = deadline - time.time()
+            readable = []
+            if remaining > 0:
+                readable, _, _ = select.select([fd], [], [], remaining)
+            if not readable:
+                stdout = output.decode(errors='replace')
+                stderr = self._read_stderr()
+                self.close()
+                raise ScanariumError(
+                    'SE_TIMEOUT', 'The command "{command}" did not finish '
+                    'within {timeout} seconds',
+                    {'command': str(command), 'timeout': self._timeout},
+                    private_parameters={
+                        'stdout': stdout,
+                        'stderr': stderr,
+                    })
+
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                stdout = output.decode(errors='replace')
+                stderr = self._read_stderr()
+                self.close()
+                raise ScanariumError(
+                    'SE_RETURN_VALUE', 'The command "{command}" did not '
+                    'return 0',
+                    {'command': str(command)},
+                    private_parameters={
+                        'stdout': stdout,
+                        'stderr': stderr,
+                    })
+            output += chunk
+
+        return output[:-len(PROMPT)].decode(errors='replace')
+
+    def run(self, arguments):
+        if self._process is None:
+            self._start()
+
+        logger.debug(f'Running in Inkscape shell: "{arguments}"')
+        line = ' '.join(shlex.quote(argument) for argument in arguments)
+        try:
+            self._process.stdin.write(line.encode() + b'\n')
+            self._process.stdin.flush()
+        except OSError:
+            self.close()
+            raise ScanariumError(
+                'SE_RETURN_VALUE', 'The command "{command}" did not return 0',
+                {'command': str(arguments)})
+
+        stdout = self._read_until_prompt(arguments)
+        return {
+            'stdout': stdout,
+            'stderr': self._read_stderr(),
+        }
+
+    def close(self):
+        if self._process is not None:
+            process = self._process
+            self._process = None
+            try:
+                process.stdin.write(b'quit\n')
+                process.stdin.close()
+                process.wait(timeout=self._timeout)
+            except Exception:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+        if self._stderr is not None:
+            self._stderr.close()
+            self._stderr = None
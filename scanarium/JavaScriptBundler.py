@@ -0,0 +1,212 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+BASE64_DIGITS = \
+    'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+# Characters and keywords after which a `/` starts a regular expression
+# literal instead of being a division.
+REGEXP_PRECEDING_CHARS = '(,=:[!&|?{};+-*%<>~^'
+REGEXP_PRECEDING_KEYWORDS = re.compile(
+    r'(^|[^\w$])(case|delete|do|else|in|instanceof|new|of|return|throw|'
+    r'typeof|void|yield)\s*$')
+
+
+def encode_vlq(value):
+    # Base64 VLQ as used in source maps
+    ret = ''
+    value = (-value << 1) | 1 if value < 0 else value << 1
+    while True:
+        digit = value & 0x1f
+        value >>= 5
+        if value:
+            digit |= 0x20
+        ret += BASE64_DIGITS[digit]
+        if not value:
+            break
+    return ret
+
+
+# Minifies JavaScript by dropping comments, indentation, and empty lines.
+#
+# Line breaks are kept, so automatic semicolon insertion works as before. This
+# is far from what dedicated minifiers achieve, but safe for all our code and
+# does not need external tools.
+#
+# Returns a list of the remaining lines. Each line is a triple of its text,
+# and the 0-based line and column of its start in `source`.
+def minify(source):
+    ret = []
+    line = ''
+    line_start = None
+    line_in_literal = False
+    # One of `code`, `line-comment`, `block-comment`, `regexp`, or the quote
+    # character of the string or template literal we are in.
+    state = 'code'
+    in_regexp_class = False
+    # The brace depths of the `${...}` placeholders of the template literals
+    # we are in.
+    template_depths = []
+    brace_depth = 0
+    recent_code = ''
+    source_line = 0
+    source_column = 0
+    i = 0
+
+    def end_line():
+        nonlocal line, line_start, line_in_literal
+        ends_in_literal = state not in ['code', 'line-comment',
+                                        'block-comment']
+        text = line if ends_in_literal else line.rstrip()
+        if text or line_in_literal or ends_in_literal:
+            if line_start is None:
+                line_start = (source_line, source_column)
+            ret.append((text, line_start[0], line_start[1]))
+        line = ''
+        line_start = None
+        line_in_literal = ends_in_literal
+
+    def emit(text):
+        nonlocal line, line_start, recent_code
+        if line_start is None:
+            if not line_in_literal and text.isspace():
+                return
+            line_start = (source_line, source_column)
+        line += text
+        recent_code = (recent_code + text)[-16:]
+
+    def starts_regexp():
+        stripped = recent_code.rstrip()
+        return not stripped or stripped[-1] in REGEXP_PRECEDING_CHARS \
+            or REGEXP_PRECEDING_KEYWORDS.search(stripped) is not None
+
+    while i < len(source):
+        char = source[i]
+        next_char = source[i + 1:i + 2]
+        length = 1
+        if state == 'code':
+            if char == '/' and next_char == '/':
+                state = 'line-comment'
+                length = 2
+            elif char == '/' and next_char == '*':
+                state = 'block-comment'
+                length = 2
+            else:
+                if char in '\'"`':
+                    state = char
+                elif char == '/' and starts_regexp():
+                    state = 'regexp'
+                    in_regexp_class = False
+                elif char == '{':
+                    brace_depth += 1
+                elif char == '}':
+                    if template_depths and template_depths[-1] == brace_depth:
+                        template_depths.pop()
+                        state = '`'
+                    else:
+                        brace_depth -= 1
+                if char != '\n':
+                    emit(char)
+        elif state == 'line-comment':
+            if char == '\n':
+                state = 'code'
+        elif state == 'block-comment':
+            if char == '*' and next_char == '/':
+                state = 'code'
+                length = 2
+        else:
+            # Within a string, template, or regular expression literal
+            if char == '\\':
+                emit(char)
+                if next_char != '\n':
+                    emit(next_char)
+                length = 2
+            elif state == '`' and char == '$' and next_char == '{':
+                emit('${')
+                template_depths.append(brace_depth)
+                state = 'code'
+                length = 2
+            elif state == 'regexp' and char == '\n':
+                # Regular expressions cannot span lines, so we guessed wrong
+                # and it was a division after all.
+                state = 'code'
+            else:
+                if state == 'regexp':
+                    if char == '[':
+                        in_regexp_class = True
+                    elif char == ']':
+                        in_regexp_class = False
+                    elif char == '/' and not in_regexp_class:
+                        state = 'code'
+                elif char == state:
+                    state = 'code'
+                if char != '\n':
+                    emit(char)
+
+        newlines = source.count('\n', i, i + length)
+        if newlines:
+            end_line()
+            source_line += newlines
+            source_column = 0
+        else:
+            source_column += length
+        i += length
+
+    end_line()
+    return ret
+
+
+# Concatenates JavaScript files into a single minified bundle with a source
+# map.
+#
+# Files get added in the order in which they have to run. Their `name` is the
+# URL of the unbundled file relative to the bundle, which the source map
+# refers to.
+class JavaScriptBundler(object):
+    def __init__(self, header=''):
+        super(JavaScriptBundler, self).__init__()
+        self._lines = [(line, None, None, None)
+                       for line in header.splitlines()]
+        self._sources = []
+
+    def add_file(self, file, name):
+        with open(file, 'r') as f:
+            self.add_source(f.read(), name)
+
+    def add_source(self, source, name):
+        source_index = len(self._sources)
+        self._sources.append(name)
+        for text, line, column in minify(source):
+            self._lines.append((text, source_index, line, column))
+        # Guarding against files that do not end in a complete statement.
+        self._lines.append((';', None, None, None))
+
+    def get_source(self):
+        return ''.join(line[0] + '\n' for line in self._lines)
+
+    def get_source_map(self, file):
+        mappings = []
+        previous = [0, 0, 0]
+        for _, source_index, line, column in self._lines:
+            segment = ''
+            if source_index is not None:
+                current = [source_index, line, column]
+                segment = encode_vlq(0) + ''.join(
+                    encode_vlq(value - previous_value)
+                    for value, previous_value in zip(current, previous))
+                previous = current
+            mappings.append(segment)
+
+        return {
+            'version': 3,
+            'file': file,
+            'sources': self._sources,
+            'names': [],
+            'mappings': ';'.join(mappings),
+        }
@@ -0,0 +1,103 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import concurrent.futures
+import logging
+
+from .ScanariumError import ScanariumError
+
+logger = logging.getLogger(__name__)
+
+
+# Jobs get added with a key and the keys of the jobs they depend on. As
+# dependencies have to be added before the jobs that depend on them, the order
+# in which jobs got added is a valid serial execution order.
+#
+# If a job fails, jobs depending on it get skipped, while all other jobs still
+# run. Afterwards, the error of the failed job that got added first is raised.
+# So the reported error does not depend on how jobs got scheduled.
+class JobRunner(object):
+    def __init__(self, jobs=1):
+        super(JobRunner, self).__init__()
+        self._jobs = max(1, jobs)
+        self._specs = {}
+        self._order = []
+        self._results = {}
+
+    def add(self, key, func, *args, dependencies=[], **kwargs):
+        if key in self._specs:
+            raise ScanariumError('SE_JOB_DUPLICATE',
+                                 'Job "{job_key}" got added twice',
+                                 {'job_key': str(key)})
+        for dependency in dependencies:
+            if dependency not in self._specs:
+                raise ScanariumError(
+                    'SE_JOB_UNKNOWN_DEPENDENCY',
+                    'Job "{job_key}" depends on unknown job "{dependency}"',
+                    {'job_key': str(key), 'dependency': str(dependency)})
+
+        self._specs[key] = {
+            'func': func,
+            'args': args,
+            'kwargs': kwargs,
+            'dependencies': list(dependencies),
+        }
+        self._order.append(key)
+        return key
+
+    def get_result(self, key):
+        return self._results[key]
+
+    def _run_job(self, key):
+        spec = self._specs[key]
+        return spec['func'](*spec['args'], **spec['kwargs'])
+
+    def _run_serially(self):
+        for key in self._order:
+            if key not in self._results:
+                self._results[key] = self._run_job(key)
+
+    def _run_in_parallel(self):
+        pending = [key for key in self._order if key not in self._results]
+        running = {}
+        failures = {}
+        skipped = set()
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._jobs, thread_name_prefix='job') as executor:
+            while pending or running:
+                for key in list(pending):
+                    dependencies = self._specs[key]['dependencies']
+                    if any(dependency in failures or dependency in skipped
+                           for dependency in dependencies):
+                        skipped.add(key)
+                        pending.remove(key)
+                    elif all(dependency in self._results
+                             for dependency in dependencies):
+                        running[executor.submit(self._run_job, key)] = key
+                        pending.remove(key)
+
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    try:
+                        self._results[key] = future.result()
+                    except Exception as e:
+                        failures[key] = e
+
+        failed_keys = [key for key in self._order if key in failures]
+        for key in failed_keys[1:]:
+            logger.error(f'Job {key} failed as well: {failures[key]}')
+        if skipped:
+            logger.error(f'Skipped {len(skipped)} jobs due to failed '
+                         'dependencies')
+        if failed_keys:
+            raise failures[failed_keys[0]]
+
+    def run(self):
+        if self._jobs == 1:
+            self._run_serially()
+        else:
+            self._run_in_parallel()
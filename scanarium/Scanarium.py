@@ -11,9 +11,10 @@ logger = logging.getLogger(__name__)
 
 
 class Scanarium(object):
-    def __init__(self):
+    def __init__(self, config_string=None):
         super(Scanarium, self).__init__()
-        self._config = scanarium.Config(self.get_config_dir_abs())
+        self._config = scanarium.Config(self.get_config_dir_abs(),
+                                        config_string)
         self._dumper = scanarium.Dumper()
         self._localizer_factory = scanarium.LocalizerFactory(
             self.get_localization_dir_abs(), self._config)
@@ -28,7 +29,7 @@ class Scanarium(object):
             self.get_dynamic_directory(),
             self.get_dynamic_sample_dir_abs(),
             self._indexer, self._command_logger)
-        self._scanner = scanarium.Scanner(self._config, self._command_logger)
+        self._debug_images_enabled = None
 
     def get_config(self, section=None, key=None, kind='string',
                    allow_empty=False, allow_missing=False, default=None):
@@ -37,10 +38,14 @@ class Scanarium(object):
 
     def set_config(self, section, key, value):
         self._config.set(section, key, value)
+        self._debug_images_enabled = None
 
     def get_config_keys(self, section):
         return self._config.get_keys(section)
 
+    def dump_config_string(self):
+        return self._config.dump_string()
+
     def get_scanarium_dir_abs(self):
         return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -77,6 +82,9 @@ class Scanarium(object):
             dir = os.path.join(self.get_scanarium_dir_abs(), dir)
         return dir
 
+    def get_build_cache_dir_abs(self):
+        return self.get_directory_from_config('build_cache')
+
     def get_dynamic_directory(self):
         return self.get_directory_from_config('dynamic')
 
@@ -92,6 +100,12 @@ class Scanarium(object):
     def reindex_actors_for_scene(self, scene):
         self._indexer.reindex_actors_for_scene(scene)
 
+    def defer_reindexing(self):
+        return self._indexer.defer_reindexing()
+
+    def end_deferred_reindexing(self, reindex=True):
+        return self._indexer.end_deferred_reindexing(reindex)
+
     def reset_dynamic_content(self, log=True):
         return self._resetter.reset_dynamic_content(log)
 
@@ -104,17 +118,51 @@ class Scanarium(object):
     def dump_text(self, file, data):
         self._dumper.dump_text(file, data)
 
+    def _get_scanner(self):
+        # The scanner gets created (and imported) upon first use, to avoid
+        # importing the scanning stack (OpenCV, numpy, pyzbar) for calls that
+        # do not scan.
+        try:
+            ret = self._scanner
+        except AttributeError:
+            from .Scanner import Scanner
+            ret = Scanner(self._config, self._command_logger)
+            self._scanner = ret
+
+        return ret
+
+    # Debug images get requested on hot paths, so whether they are enabled at
+    # all gets looked up once and cached until the config changes.
+    def are_debug_images_enabled(self):
+        ret = self._debug_images_enabled
+        if ret is None:
+            ret = self.get_config('general', 'debug', 'boolean') and \
+                not self.get_config('debug', 'hide_images', 'boolean')
+            self._debug_images_enabled = ret
+        return ret
+
+    def is_debug_image_shown(self, title):
+        return self.are_debug_images_enabled() and \
+            not self._get_scanner().is_debug_image_hidden(title)
+
+    # `image` may also be a function returning the image, which gets only
+    # called if the image gets shown. (See `Scanner.debug_show_image`)
     def debug_show_image(self, title, image):
-        self._scanner.debug_show_image(title, image)
+        if self.are_debug_images_enabled():
+            self._get_scanner().debug_show_image(title, image)
 
     def open_camera(self):
-        return self._scanner.open_camera(self)
+        return self._get_scanner().open_camera(self)
 
     def close_camera(self, camera):
-        return self._scanner.close_camera(self, camera)
+        return self._get_scanner().close_camera(self, camera)
 
     def get_image(self, camera=None):
-        return self._scanner.get_image(self, camera)
+        return self._get_scanner().get_image(self, camera)
+
+    def get_page_files(self, file_path, dir, max_pages=None):
+        return self._get_scanner().get_page_files(self, file_path, dir,
+                                                  max_pages)
 
     def get_brightness_factor(self):
         # We cache the image to avoid having to costly reload it for each
@@ -122,46 +170,77 @@ class Scanarium(object):
         try:
             ret = self._brightness_factor
         except AttributeError:
-            ret = self._scanner.get_brightness_factor(self)
+            ret = self._get_scanner().get_brightness_factor(self)
             self._brightness_factor = ret
 
         return ret
 
+    def check_image_quality(self, image):
+        self._get_scanner().check_image_quality(self, image)
+
     def extract_qr(self, image):
-        return self._scanner.extract_qr(self, image)
+        return self._get_scanner().extract_qr(self, image)
+
+    def extract_qrs(self, image):
+        return self._get_scanner().extract_qrs(self, image)
+
+    # The state of the adaptive ordering of variants to decode QR codes. It
+    # is JSON serializable and can get passed to `set_qr_variant_state` to
+    # carry the ordering over to a later process.
+    def get_qr_variant_state(self):
+        return self._get_scanner().get_qr_variant_state()
+
+    def set_qr_variant_state(self, state):
+        self._get_scanner().set_qr_variant_state(state)
 
     def actor_image_pipeline(self, image, qr_rect, qr_parsed,
                              visualized_alpha=None):
-        return self._scanner.actor_image_pipeline(
+        return self._get_scanner().actor_image_pipeline(
             self, image, qr_rect, qr_parsed,
             visualized_alpha=visualized_alpha)
 
     def process_image_with_qr_code(self, image, qr_rect, data,
                                    should_skip_exception=None):
-        return self._scanner.process_image_with_qr_code(
+        return self._get_scanner().process_image_with_qr_code(
             self, image, qr_rect, data, should_skip_exception)
 
+    def process_image_with_qr_codes(self, image, codes,
+                                    should_skip_exception=None):
+        return self._get_scanner().process_image_with_qr_codes(
+            self, image, codes, should_skip_exception)
+
     def rectify_to_biggest_rect(self, image, yield_only_points=False):
-        return self._scanner.rectify_to_biggest_rect(
+        return self._get_scanner().rectify_to_biggest_rect(
             self, image, yield_only_points=yield_only_points)
 
     def rectify_to_qr_parent_rect(self, image, qr_rect,
                                   yield_only_points=False):
-        return self._scanner.rectify_to_qr_parent_rect(
+        return self._get_scanner().rectify_to_qr_parent_rect(
             self, image, qr_rect, yield_only_points=yield_only_points)
 
-    def run(self, command, check=True, timeout='default', input=None):
-        return self._environment.run(command, check, timeout, input)
+    def run(self, command, check=True, timeout='default', input=None,
+            cwd=None):
+        return self._environment.run(command, check, timeout, input, cwd)
 
     def call_guarded(self, func, *args, check_caller=True, **kwargs):
         return self._environment.call_guarded(
             self, func, *args, check_caller=check_caller, **kwargs)
 
+    def call_guarded_cgi(self, caller, func, *args, **kwargs):
+        return self._environment.call_guarded_cgi(
+            self, caller, func, *args, **kwargs)
+
     def handle_arguments(self, description, register_func=None,
                          whitelisted_cgi_fields={}):
         return self._environment.handle_arguments(
             self, description, register_func, whitelisted_cgi_fields)
 
+    def get_upload_file_name(self, data, dir):
+        return self._environment.get_upload_file_name(data, dir)
+
+    def get_max_upload_size(self, cgi):
+        return self._environment.get_max_upload_size(cgi)
+
     def register_for_cleanup(self, f):
         self._environment.register_for_cleanup(f)
 
@@ -9,15 +9,20 @@ import os
 import re
 import sys
 import shutil
+import time
 
 import cv2
 import numpy as np
 
+from .JobRunner import JobRunner
 from .ScanariumError import ScanariumError
-from .scanner_qr import extract_qr, parse_qr
-from .scanner_camera import open_camera, close_camera, get_image
+from .scanner_qr import extract_qr, extract_qrs, parse_qr, \
+    get_qr_variant_state, set_qr_variant_state
+from .scanner_camera import open_camera, close_camera, get_image, \
+    get_page_files
+from .scanner_quality import check_image_quality
 from .scanner_rectification import rectify_to_qr_parent_rect, \
-    rectify_to_biggest_rect
+    rectify_to_biggest_rect, prepare_rectification
 from .scanner_util import scale_image_from_config
 
 
@@ -26,14 +31,39 @@ logger = logging.getLogger(__name__)
 NEXT_RAW_IMAGE_STORE = 0  # Timestamp of when to store the next raw image.
 
 
+def get_image_hide_key(title):
+    ret = re.sub('[^0-9a-z_]+', '_', 'hide_image_' + title.lower())
+    if ret[-1] == '_':
+        ret = ret[:-1]
+    return ret
+
+
+def is_debug_image_hidden(title, config):
+    return config.get('debug', get_image_hide_key(title), 'boolean',
+                      allow_missing=True)
+
+
+# `image` is either the image to show, or a function (without arguments) that
+# returns the image to show. Passing a function allows to skip preparing
+# images that do not get shown.
+#
+# Whether debug images are enabled at all is not checked here, as
+# `Scanarium.debug_show_image` caches that check.
+#
+# If `debug.image_directory` is set, the image gets written into that
+# directory instead of getting shown in a window.
 def debug_show_image(title, image, config):
-    image_hide_key = re.sub('[^0-9a-z_]+', '_', 'hide_image_' + title.lower())
-    if image_hide_key[-1] == '_':
-        image_hide_key = image_hide_key[:-1]
-    if config.get('general', 'debug', 'boolean') and \
-            not config.get('debug', 'hide_images', 'boolean'):
-        if not config.get('debug', image_hide_key, 'boolean',
-                          allow_missing=True):
+    if not is_debug_image_hidden(title, config):
+        if callable(image):
+            image = image()
+        dir_path = config.get('debug', 'image_directory', allow_empty=True)
+        if dir_path is not None:
+            name = get_image_hide_key(title)[len('hide_image_'):]
+            file_path = os.path.join(dir_path,
+                                     '%f-%s.png' % (time.time(), name))
+            os.makedirs(dir_path, exist_ok=True)
+            cv2.imwrite(file_path, image)
+        else:
             cv2.imshow(title, image)
             locale.resetlocale()
 
@@ -247,8 +277,22 @@ def save_image(scanarium, image, scene, actor):
     dynamic_dir = scanarium.get_dynamic_directory()
     image_dir = os.path.join(dynamic_dir, 'scenes', actor_path)
     os.makedirs(image_dir, exist_ok=True)
-    basename = f'{timestamp}.png'
-    tmp_image_file = os.path.join(image_dir, 'tmp-' + basename)
+
+    # Scans of the same actor may get saved in parallel (E.g.: in batch
+    # scans), so we claim the temporary file exclusively to avoid two scans
+    # ending up with the same timestamp.
+    while True:
+        basename = f'{timestamp}.png'
+        tmp_image_file = os.path.join(image_dir, 'tmp-' + basename)
+        if not os.path.exists(os.path.join(image_dir, basename)):
+            try:
+                os.close(os.open(tmp_image_file,
+                                 os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                pass
+        time.sleep(0.001)
+        timestamp = scanarium.get_timestamp_for_filename()
 
     cv2.imwrite(tmp_image_file, image)
     embed_metadata(scanarium, tmp_image_file, basename, scene, actor)
@@ -272,8 +316,9 @@ def save_image(scanarium, image, scene, actor):
 
 
 def actor_image_pipeline(scanarium, image, qr_rect, qr_parsed,
-                         visualized_alpha=None):
-    image = rectify_to_qr_parent_rect(scanarium, image, qr_rect)
+                         visualized_alpha=None, prepared_rectification=None):
+    image = rectify_to_qr_parent_rect(scanarium, image, qr_rect,
+                                      prepared=prepared_rectification)
     image = orient_image(scanarium, image)
     (image, mask_file) = mask(scanarium, image, qr_parsed,
                               visualized_alpha=visualized_alpha)
@@ -288,10 +333,13 @@ def actor_image_pipeline(scanarium, image, qr_rect, qr_parsed,
     return image
 
 
-def process_actor_image_with_qr_code(scanarium, image, qr_rect, qr_parsed):
+def process_actor_image_with_qr_code(scanarium, image, qr_rect, qr_parsed,
+                                     prepared_rectification=None):
     scene = qr_parsed['command']
     actor = qr_parsed['parameter']
-    image = actor_image_pipeline(scanarium, image, qr_rect, qr_parsed)
+    image = actor_image_pipeline(
+        scanarium, image, qr_rect, qr_parsed,
+        prepared_rectification=prepared_rectification)
     flavor = save_image(scanarium, image, scene, actor)
 
     scanarium.reindex_actors_for_scene(scene)
@@ -303,7 +351,8 @@ def process_actor_image_with_qr_code(scanarium, image, qr_rect, qr_parsed):
     }
 
 
-def process_image_with_qr_code_unlogged(scanarium, qr_parsed, image, qr_rect):
+def process_image_with_qr_code_unlogged(scanarium, qr_parsed, image, qr_rect,
+                                        prepared_rectification=None):
     command = qr_parsed['command']
     parameter = qr_parsed['parameter']
     if command == 'debug':
@@ -363,13 +412,15 @@ def process_image_with_qr_code_unlogged(scanarium, qr_parsed, image, qr_rect):
                 'Command "{command}" does not allow a parameter "{parameter}"',
                 {'command': command, 'parameter': parameter})
     else:
-        ret = process_actor_image_with_qr_code(scanarium, image, qr_rect,
-                                               qr_parsed)
+        ret = process_actor_image_with_qr_code(
+            scanarium, image, qr_rect, qr_parsed,
+            prepared_rectification=prepared_rectification)
     return ret
 
 
 def process_image_with_qr_code(scanarium, command_logger, image, qr_rect, data,
-                               should_skip_exception=None):
+                               should_skip_exception=None,
+                               prepared_rectification=None):
     qr_parsed = {
         'command': None,
         'parameter': None,
@@ -380,7 +431,7 @@ def process_image_with_qr_code(scanarium, command_logger, image, qr_rect, data,
         qr_parsed = parse_qr(scanarium, data)
 
         payload = process_image_with_qr_code_unlogged(
-            scanarium, qr_parsed, image, qr_rect)
+            scanarium, qr_parsed, image, qr_rect, prepared_rectification)
     except Exception as e:
         if should_skip_exception is not None and should_skip_exception(e):
             raise ScanariumError('SE_SKIPPED_EXCEPTION',
@@ -391,12 +442,50 @@ def process_image_with_qr_code(scanarium, command_logger, image, qr_rect, data,
                               [qr_parsed['parameter']])
 
 
+# Processes an image that shows many sheets. `codes` is a list of `(qr_rect,
+# data)` pairs (E.g.: as returned by `extract_qrs`). The sheets get processed
+# in parallel, and contours are found only once for all of them. Returns the
+# list of results in the order of `codes`. Results of codes whose exception got
+# skipped are None.
+def process_image_with_qr_codes(scanarium, command_logger, image, codes,
+                                should_skip_exception=None):
+    prepared_rectification = prepare_rectification(scanarium, image)
+
+    def process(qr_rect, data):
+        try:
+            return process_image_with_qr_code(
+                scanarium, command_logger, image, qr_rect, data,
+                should_skip_exception, prepared_rectification)
+        except ScanariumError as e:
+            if e.code == 'SE_SKIPPED_EXCEPTION':
+                return None
+            raise e
+
+    runner = JobRunner(scanarium.get_config('scan', 'multi_sheet_jobs',
+                                            kind='int'))
+    for idx, (qr_rect, data) in enumerate(codes):
+        runner.add(idx, process, qr_rect, data)
+
+    # Reindexing scenes only once after all sheets got processed.
+    started_deferring = scanarium.defer_reindexing()
+    try:
+        runner.run()
+    finally:
+        if started_deferring:
+            scanarium.end_deferred_reindexing()
+
+    return [runner.get_result(idx) for idx in range(len(codes))]
+
+
 class Scanner(object):
     def __init__(self, config, command_logger):
         super(Scanner, self).__init__()
         self._config = config
         self._command_logger = command_logger
 
+    def is_debug_image_hidden(self, title):
+        return is_debug_image_hidden(title, self._config)
+
     def debug_show_image(self, title, image):
         debug_show_image(title, image, self._config)
 
@@ -409,18 +498,39 @@ class Scanner(object):
     def get_image(self, scanarium, camera=None):
         return get_image(scanarium, camera)
 
+    def get_page_files(self, scanarium, file_path, dir, max_pages=None):
+        return get_page_files(scanarium, file_path, dir, max_pages)
+
     def get_brightness_factor(self, scanarium):
         return get_brightness_factor(scanarium)
 
+    def check_image_quality(self, scanarium, image):
+        check_image_quality(scanarium, image)
+
     def extract_qr(self, scanarium, image):
         return extract_qr(scanarium, image)
 
+    def extract_qrs(self, scanarium, image):
+        return extract_qrs(scanarium, image)
+
+    def get_qr_variant_state(self):
+        return get_qr_variant_state()
+
+    def set_qr_variant_state(self, state):
+        set_qr_variant_state(state)
+
     def process_image_with_qr_code(self, scanarium, image, qr_rect, data,
                                    should_skip_exception=None):
         return process_image_with_qr_code(
             scanarium, self._command_logger, image, qr_rect, data,
             should_skip_exception)
 
+    def process_image_with_qr_codes(self, scanarium, image, codes,
+                                    should_skip_exception=None):
+        return process_image_with_qr_codes(
+            scanarium, self._command_logger, image, codes,
+            should_skip_exception)
+
     def actor_image_pipeline(self, scanarium, image, qr_rect, qr_parsed,
                              visualized_alpha=None):
         return actor_image_pipeline(
@@ -0,0 +1,24 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+
+
+# A file that got uploaded through a form and is stored at `path`.
+#
+# `filename` is the file name that the client sent (if any). Only the path
+# gets passed around, so handing uploads to other processes does not copy
+# their data.
+class UploadedFile(object):
+    def __init__(self, path, filename=None):
+        super(UploadedFile, self).__init__()
+        self.path = path
+        self.filename = filename
+
+    def get_size(self):
+        return os.path.getsize(self.path)
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
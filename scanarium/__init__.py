@@ -4,26 +4,25 @@
 
 # flake8: noqa
 
-def allow_non_default_dependencies():
-    import os
-    try:
-        return os.environ['SCANARIUM_SKIP_NON_DEFAULT_DEPENDENCIES'] != 'yes'
-    except KeyError:
-        return True
-
+# Only modules that cgis need get imported here. The scanning stack
+# (Scanner, ContourAnalysis, DecoderPool) takes longer to import than all of
+# the rest of Scanarium, while most cgis never scan. And build-only or
+# server-only modules (AdaptiveOrder, BuildCache, CgiWorkerPool, Compressor,
+# InkscapeShell, JavaScriptBundler, JobRunner) are not needed by cgis at all.
+# Import those from their modules at the point of use instead.
 from .Config import Config
 from .CommandLogger import CommandLogger
 from .Dumper import Dumper
 from .Environment import Environment
 from .FileLock import FileLock
+from .FormParser import FormParser
 from .Indexer import Indexer
 from .MessageFormatter import MessageFormatter
 from .Localizer import Localizer
 from .LocalizerFactory import LocalizerFactory
 from .Resetter import Resetter
 from .Result import Result
-if allow_non_default_dependencies():
-    from .Scanner import Scanner
 from .Scanarium import Scanarium
 from .ScanariumError import ScanariumError
+from .UploadedFile import UploadedFile
 from .Util import Util
@@ -0,0 +1,145 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+# Helper process of `DecoderPool`, which decodes untrusted files.
+#
+# This file is run as a separate (possibly sandboxed) process and does not
+# import anything from Scanarium. It reads one JSON request per line from
+# stdin and answers each with one JSON line on stdout. Decoded pixels (8-bit
+# BGR, row-major) do not go through stdout, but get written into the shared
+# buffer file that the pool passes on the command line.
+#
+# Upon startup, the helper prints the formats it can decode (this depends on
+# the installed libraries) as `{"formats": [...]}`.
+#
+# A request looks like `{"file": "/foo.pdf", "format": "pdf", "dpi": 150,
+# "page": 0}`, and gets answered with `{"height": 1240, "width": 1754,
+# "pages": 3}`, or `{"error": "some message"}` if decoding failed.
+
+import argparse
+import json
+import mmap
+import sys
+
+import numpy as np
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+try:
+    import PIL.Image
+    import pillow_heif
+except ImportError:
+    pillow_heif = None
+
+
+class DecodingError(Exception):
+    pass
+
+
+def check_pixels(height, width, max_pixels):
+    if height * width > max_pixels:
+        raise DecodingError(f'Image of {width}x{height} pixels exceeds '
+                            f'{max_pixels} pixels')
+
+
+def to_bgr(image):
+    if image.mode in ['RGBA', 'LA', 'PA'] or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = PIL.Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = PIL.Image.alpha_composite(background, image)
+    return np.asarray(image.convert('RGB'))[:, :, ::-1]
+
+
+def decode_pdf(file, dpi, page_index, max_pixels):
+    pdf = pypdfium2.PdfDocument(file)
+    try:
+        pages = len(pdf)
+        if not 0 <= page_index < pages:
+            raise DecodingError(f'No page {page_index} in {pages} pages')
+        page = pdf[page_index]
+        scale = dpi / 72
+        width, height = page.get_size()
+        check_pixels(int(height * scale), int(width * scale), max_pixels)
+        image = page.render(scale=scale).to_pil()
+        return (to_bgr(image), pages)
+    finally:
+        pdf.close()
+
+
+def decode_heic(file, dpi, page_index, max_pixels):
+    if page_index != 0:
+        raise DecodingError(f'No page {page_index} in 1 pages')
+    with PIL.Image.open(file) as image:
+        check_pixels(image.height, image.width, max_pixels)
+        return (to_bgr(image), 1)
+
+
+def get_decoders():
+    ret = {}
+    if pypdfium2 is not None:
+        ret['pdf'] = decode_pdf
+    if pillow_heif is not None:
+        pillow_heif.register_heif_opener()
+        ret['heic'] = decode_heic
+    return ret
+
+
+def limit_memory(limit):
+    if limit:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def handle_request(line, decoders, buffer, max_pixels):
+    request = json.loads(line)
+    decoder = decoders.get(request.get('format'))
+    if decoder is None:
+        raise DecodingError(f'Unsupported format {request.get("format")}')
+    image, pages = decoder(request['file'], request.get('dpi') or 150,
+                           request.get('page', 0), max_pixels)
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    check_pixels(image.shape[0], image.shape[1], max_pixels)
+    buffer[:image.nbytes] = image.tobytes()
+    return {
+        'height': image.shape[0],
+        'width': image.shape[1],
+        'pages': pages,
+    }
+
+
+def reply(response):
+    sys.stdout.write(json.dumps(response) + '\n')
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Decodes untrusted files for Scanarium')
+    parser.add_argument('--buffer', required=True,
+                        help='shared buffer file to write pixels to')
+    parser.add_argument('--max-pixels', type=int, required=True,
+                        help='reject images with more pixels than this')
+    parser.add_argument('--memory-limit', type=int, default=0,
+                        help='limit address space to this many bytes')
+    args = parser.parse_args()
+
+    limit_memory(args.memory_limit)
+    decoders = get_decoders()
+    with open(args.buffer, 'r+b') as f:
+        buffer = mmap.mmap(f.fileno(), args.max_pixels * 3)
+
+    reply({'formats': sorted(decoders)})
+    for line in sys.stdin:
+        try:
+            response = handle_request(line, decoders, buffer, args.max_pixels)
+        except Exception as e:
+            response = {'error': f'{type(e).__name__}: {e}'}
+        reply(response)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,15 +2,48 @@
 # GNU Affero General Public License v3.0 (See LICENSE.md)
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import atexit
+import math
 import os
+import re
+import struct
 import tempfile
+import threading
 import time
 import shutil
 
 import cv2
 
+from .DecoderPool import DecoderPool
 from .ScanariumError import ScanariumError
-from .scanner_util import scale_image_from_config
+from .scanner_util import scale_image_from_config, \
+    get_scale_factor_from_config
+
+# Resolution to convert documents (E.g.: PDFs) at, unless the configured raw
+# image size allows for less.
+DEFAULT_DPI = 150
+
+# Maps the factors by which JPGs can get reduced while decoding to the flags
+# to read them with.
+JPG_REDUCTION_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+# Start Of Frame markers of JPGs, which hold the image's dimensions
+JPG_SOF_MARKERS = set(range(0xc0, 0xd0)) - {0xc4, 0xc8, 0xcc}
+
+# Pages of PDFs may not be further into the file than this.
+PDF_MEDIA_BOX_SEARCH_SIZE = 4 * 1024 * 1024
+PDF_MEDIA_BOX_PATTERN = re.compile(
+    rb'/MediaBox\s*\[\s*([-+0-9.]+)\s+([-+0-9.]+)\s+([-+0-9.]+)\s+'
+    rb'([-+0-9.]+)\s*\]')
+
+# The pool for the `decoder` pipeline. It gets created upon first use and is
+# shared by all Scanarium instances of the process.
+DECODER_POOL = None
+DECODER_POOL_LOCK = threading.Lock()
 
 
 def create_error_pipeline():
@@ -182,80 +215,303 @@ def get_raw_image_from_file(scanarium, file_path):
     return image
 
 
+# Returns the JPG's (height, width) as stored in the file (so before applying
+# EXIF orientation), or None, if it cannot be determined.
+def get_jpg_size(file_path):
+    with open(file_path, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            return None
+        while True:
+            byte = f.read(1)
+            if byte != b'\xff':
+                return None
+            marker = f.read(1)
+            while marker == b'\xff':
+                # Fill bytes
+                marker = f.read(1)
+            if not marker:
+                return None
+            marker = marker[0]
+            if marker == 0x01 or 0xd0 <= marker <= 0xd7:
+                # Markers without payload
+                continue
+            length_bytes = f.read(2)
+            if len(length_bytes) < 2:
+                return None
+            length = struct.unpack('>H', length_bytes)[0]
+            if marker in JPG_SOF_MARKERS:
+                data = f.read(5)
+                if len(data) < 5:
+                    return None
+                return struct.unpack('>HH', data[1:5])
+            if marker in [0xd9, 0xda] or length < 2:
+                # End of image, or start of scan before any frame.
+                return None
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+# Reads an image for scanning.
+#
+# JPGs that `scale_image_from_config` would shrink to a fraction of their size
+# already get reduced while decoding, which is far cheaper on memory and time
+# than decoding them at full size.
+def read_image(scanarium, file_path):
+    size = get_jpg_size(file_path)
+    if size is None:
+        return cv2.imread(file_path)
+
+    # EXIF orientation may swap height and width, so we use the factor of
+    # the orientation that needs the bigger image.
+    factor = max(
+        get_scale_factor_from_config(scanarium, size[0], size[1], 'raw'),
+        get_scale_factor_from_config(scanarium, size[1], size[0], 'raw'))
+    reduction = 1
+    for candidate in sorted(JPG_REDUCTION_FLAGS, reverse=True):
+        if factor * candidate <= 1:
+            reduction = candidate
+            break
+    if reduction == 1:
+        return cv2.imread(file_path)
+
+    image = cv2.imread(file_path, JPG_REDUCTION_FLAGS[reduction])
+    if image is not None:
+        # Bringing the image to the size that scaling the full image would
+        # have resulted in.
+        height, width = size
+        if (image.shape[0] > image.shape[1]) != (height > width):
+            height, width = width, height
+        factor = get_scale_factor_from_config(scanarium, height, width, 'raw')
+        scaled_dimension = (int(width * factor), int(height * factor))
+        if (image.shape[1], image.shape[0]) != scaled_dimension:
+            image = cv2.resize(image, scaled_dimension,
+                               interpolation=cv2.INTER_AREA)
+    return image
+
+
+# Returns the (height, width) in points of the pages of a PDF, as far as they
+# can be found.
+def get_pdf_page_sizes(file_path):
+    ret = []
+    with open(file_path, 'rb') as f:
+        data = f.read(PDF_MEDIA_BOX_SEARCH_SIZE)
+    for match in PDF_MEDIA_BOX_PATTERN.finditer(data):
+        try:
+            x0, y0, x1, y1 = [float(value) for value in match.groups()]
+        except ValueError:
+            continue
+        if x1 != x0 and y1 != y0:
+            ret.append((abs(y1 - y0), abs(x1 - x0)))
+    return ret
+
+
+# Returns the resolution to convert `file_path` at.
+#
+# For PDFs, the resolution is the lowest that still yields the image size
+# that the raw image would get scaled to, but at most `DEFAULT_DPI`.
+def get_conversion_dpi(scanarium, file_path):
+    ret = DEFAULT_DPI
+    if scanarium.guess_image_format(file_path) == 'pdf':
+        page_sizes = get_pdf_page_sizes(file_path)
+        if page_sizes:
+            factor = 0
+            for height, width in page_sizes:
+                height = height * DEFAULT_DPI / 72
+                width = width * DEFAULT_DPI / 72
+                # Pages may be rotated, so we go for the orientation that
+                # needs the bigger image.
+                factor = max(
+                    factor,
+                    get_scale_factor_from_config(
+                        scanarium, height, width, 'raw'),
+                    get_scale_factor_from_config(
+                        scanarium, width, height, 'raw'))
+            ret = max(1, min(DEFAULT_DPI, math.ceil(DEFAULT_DPI * factor)))
+    return ret
+
+
+# Runs `func` and turns its errors into pipeline errors.
+def run_conversion(scanarium, func, *args):
+    try:
+        return func(*args)
+    except OSError:
+        if scanarium.get_config('debug', 'fine_grained_errors',
+                                kind='boolean'):
+            raise ScanariumError(
+                'SE_PIPELINE_OS_ERROR',
+                'Server-side image processing failed')
+        else:
+            raise create_error_pipeline()
+
+    except ScanariumError as e:
+        if e.code == 'SE_TIMEOUT':
+            if scanarium.get_config('debug', 'fine_grained_errors',
+                                    kind='boolean'):
+                raise ScanariumError(
+                    'SE_PIPELINE_TIMEOUT',
+                    'Server-side image processing took too long')
+            else:
+                raise create_error_pipeline()
+        elif e.code in ['SE_RETURN_VALUE', 'SE_DECODER_FAILED']:
+            if scanarium.get_config('debug', 'fine_grained_errors',
+                                    kind='boolean'):
+                raise ScanariumError(
+                    'SE_PIPELINE_RETURN_VALUE',
+                    'Server-side image processing failed')
+            else:
+                raise create_error_pipeline()
+        else:
+            raise e
+
+
+def run_conversion_command(scanarium, command):
+    run_conversion(scanarium, scanarium.run, command)
+
+
+def get_decoder_pool(scanarium):
+    global DECODER_POOL
+    with DECODER_POOL_LOCK:
+        if DECODER_POOL is None:
+            DECODER_POOL = DecoderPool(
+                [scanarium.get_config('programs', 'decoder_untrusted')],
+                scanarium.get_config('scan', 'decoder_helpers', kind='int'),
+                scanarium.get_config('general', 'external_program_timeout',
+                                     kind='int'),
+                scanarium.get_config('scan', 'decoder_max_pixels',
+                                     kind='int'),
+                scanarium.get_config('scan', 'decoder_memory_limit',
+                                     kind='int', allow_empty=True) or 0)
+            atexit.register(DECODER_POOL.close)
+        return DECODER_POOL
+
+
+# Decodes page `page` of `file_path` through the decoder pool. Returns the
+# pair of the decoded image and the file's number of pages.
+def decode_file(scanarium, file_path, page=0):
+    format = scanarium.guess_image_format(file_path)
+    pool = get_decoder_pool(scanarium)
+
+    def decode():
+        if not pool.supports(format):
+            raise ScanariumError(
+                'SE_DECODER_UNSUPPORTED_FORMAT',
+                'The decoder cannot read {format} files',
+                {'format': format})
+        dpi = get_conversion_dpi(scanarium, file_path)
+        return pool.decode(file_path, format, dpi=dpi, page=page)
+
+    return run_conversion(scanarium, decode)
+
+
+# Decodes the pages of `file_path` through the decoder pool into PNGs in
+# `dir`. If `max_pages` is not None, at most `max_pages` pages get decoded.
+# Returns the PNGs ordered by page.
+def decode_to_pngs(scanarium, file_path, dir, max_pages=None):
+    ret = []
+    page = 0
+    pages = 1
+    while page < pages and (max_pages is None or page < max_pages):
+        image, pages = decode_file(scanarium, file_path, page)
+        path = os.path.join(dir, 'decoded-%06d.png' % (page))
+        cv2.imwrite(path, image, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        ret.append(path)
+        page += 1
+    return ret
+
+
+# Converts `file_path` to JPGs in `dir` using `pipeline`. If `all_pages` is
+# False, only the first page gets converted. Otherwise, all pages get
+# converted, but at most `max_pages` (if not None). Returns the converted
+# files ordered by page.
+def convert_to_jpgs(scanarium, file_path, pipeline, dir, all_pages=False,
+                    max_pages=None):
+    dpi = get_conversion_dpi(scanarium, file_path)
+    quality = 75
+    converted_path_base = os.path.join(dir, 'converted')
+
+    if pipeline == 'pdftoppm':
+        # Without `-singlefile`, pdftoppm appends the zero-padded page number
+        # to the base name.
+        command = [scanarium.get_config('programs', 'pdftoppm_untrusted'),
+                   '-jpeg']
+        if not all_pages:
+            command += ['-singlefile']
+        elif max_pages is not None:
+            command += ['-l', str(max_pages)]
+        command += ['-r', str(dpi),
+                    '-jpegopt', f'quality={quality}',
+                    file_path,
+                    converted_path_base]
+    elif pipeline == 'convert':
+        command = [scanarium.get_config('programs', 'convert_untrusted'),
+                   '-units', 'pixelsperinch',
+                   '-background', 'white']
+        if all_pages:
+            # `-flatten` would merge all pages into a single image, so we
+            # only drop transparency on each page.
+            pages = ''
+            if max_pages is not None:
+                pages = f'[0-{max_pages - 1}]'
+            command += ['-density', str(dpi),
+                        '-quality', str(quality),
+                        file_path + pages,
+                        '-alpha', 'remove',
+                        converted_path_base + '-%06d.jpg']
+        else:
+            command += ['-flatten',
+                        '-density', str(dpi),
+                        '-quality', str(quality),
+                        file_path + '[0]',  # [0] is first page
+                        converted_path_base + '.jpg']
+    else:
+        raise ScanariumError(
+            'SE_SCAN_UNKNOWN_PIPELINE',
+            'Unknown conversion pipeline \"{pipeline}\"',
+            {'pipeline': pipeline})
+
+    run_conversion_command(scanarium, command)
+
+    return sorted(os.path.join(dir, file) for file in os.listdir(dir)
+                  if file.startswith('converted') and file.endswith('.jpg'))
+
+
 def run_get_raw_image_pipeline(scanarium, file_path, pipeline):
     image = None
-    dpi = 150
-    quality = 75
 
     if pipeline == 'native':
-        image = cv2.imread(file_path)
+        image = read_image(scanarium, file_path)
+    elif pipeline == 'decoder':
+        image, _ = decode_file(scanarium, file_path)
     else:
         with tempfile.TemporaryDirectory(prefix='scanarium-conv-') as dir:
-            converted_path_base = os.path.join(dir, 'converted')
-            converted_path = converted_path_base + '.jpg'
-
-            if pipeline == 'pdftoppm':
-                command = [scanarium.get_config('programs',
-                                                'pdftoppm_untrusted'),
-                           '-jpeg',
-                           '-singlefile',
-                           '-r', str(dpi),
-                           '-jpegopt', f'quality={quality}',
-                           file_path,
-                           converted_path_base]
-            elif pipeline == 'convert':
-                command = [scanarium.get_config('programs',
-                                                'convert_untrusted'),
-                           '-units', 'pixelsperinch',
-                           '-background', 'white',
-                           '-flatten',
-                           '-density', str(dpi),
-                           '-quality', str(quality),
-                           file_path + '[0]',  # [0] is first page
-                           converted_path]
-            else:
-                raise ScanariumError(
-                    'SE_SCAN_UNKNOWN_PIPELINE',
-                    'Unknown conversion pipeline \"{pipeline}\"',
-                    {'pipeline': pipeline})
-
-            try:
-                scanarium.run(command)
-            except OSError:
-                if scanarium.get_config('debug', 'fine_grained_errors',
-                                        kind='boolean'):
-                    raise ScanariumError(
-                        'SE_PIPELINE_OS_ERROR',
-                        'Server-side image processing failed')
-                else:
-                    raise create_error_pipeline()
-
-            except ScanariumError as e:
-                if e.code == 'SE_TIMEOUT':
-                    if scanarium.get_config('debug', 'fine_grained_errors',
-                                            kind='boolean'):
-                        raise ScanariumError(
-                            'SE_PIPELINE_TIMEOUT',
-                            'Server-side image processing took too long')
-                    else:
-                        raise create_error_pipeline()
-                elif e.code == 'SE_RETURN_VALUE':
-                    if scanarium.get_config('debug', 'fine_grained_errors',
-                                            kind='boolean'):
-                        raise ScanariumError(
-                            'SE_PIPELINE_RETURN_VALUE',
-                            'Server-side image processing failed')
-                    else:
-                        raise create_error_pipeline()
-                else:
-                    raise e
-
-            if os.path.isfile(converted_path):
-                image = cv2.imread(converted_path)
+            converted_paths = convert_to_jpgs(scanarium, file_path, pipeline,
+                                              dir)
+            if converted_paths:
+                image = read_image(scanarium, converted_paths[0])
 
     return image
 
 
+# Splits multi-page files (PDFs) into one JPG per page within `dir`. Other
+# files are returned as is. If `max_pages` is not None, at most `max_pages`
+# pages get converted. Returns the list of files to scan.
+def get_page_files(scanarium, file_path, dir, max_pages=None):
+    ret = [file_path]
+    format = scanarium.guess_image_format(file_path)
+    if format == 'pdf' and scanarium.get_config(
+            'scan', 'permit_file_type_pdf', kind='boolean',
+            allow_missing=True):
+        pipeline = scanarium.get_config('scan', 'pipeline_file_type_pdf',
+                                        allow_missing=True, default='convert')
+        if pipeline == 'decoder':
+            log_raw_image(scanarium, format, file_path)
+            ret = decode_to_pngs(scanarium, file_path, dir, max_pages)
+        elif pipeline != 'native':
+            log_raw_image(scanarium, format, file_path)
+            ret = convert_to_jpgs(scanarium, file_path, pipeline, dir,
+                                  all_pages=True, max_pages=max_pages)
+    return ret
+
+
 def log_raw_image(scanarium, format, file_path):
     if scanarium.get_config('log', 'raw_image_files', kind='boolean'):
         try:
@@ -6,10 +6,9 @@ import json
 import os
 import re
 
-from pyzbar import pyzbar
-from collections import namedtuple
-
+from .AdaptiveOrder import AdaptiveOrder
 from .ScanariumError import ScanariumError
+from .scanner_qr_decoders import Rect, get_decoder, get_decoder_names
 from .scanner_util import prepare_image, apply_image_contrast
 
 
@@ -21,33 +20,64 @@ def raise_error_misformed_qr_code(scanarium):
         raise ScanariumError('SE_UNKNOWN_QR_CODE', 'Unknown QR code')
 
 
-def extract_qr(scanarium, image):
+# The order in which to try the variants (pairs of decoder name and contrast)
+# for decoding QR codes. It is shared by all Scanarium instances of the
+# process.
+QR_VARIANT_ORDER = AdaptiveOrder()
+
+
+def get_qr_variant_state():
+    return QR_VARIANT_ORDER.get_state()
+
+
+def set_qr_variant_state(state):
+    QR_VARIANT_ORDER.set_state(state)
+
+
+# Decodes the QR codes in `image` by trying the decoders of the chain (or
+# `decoder_names`, if given) in order. The first decoder that finds QR codes
+# wins. Each decoder tries all contrasts before the next decoder is tried, so
+# cheap decoders should go first and robust ones last. If
+# `scan.qr_variant_decay` is set, recently successful pairs of decoder and
+# contrast get tried first.
+def decode_qr_codes(scanarium, image, decoder_names=None):
     (prepared_image, scale_factor) = prepare_image(scanarium, image)
-    codes_len = 0
-    contrasts = [float(contrast.strip())
-                 for contrast in
-                 scanarium.get_config('scan', 'contrasts').split(',')]
-    for contrast in contrasts:
-        if not codes_len:
-            fully_prepared_image = apply_image_contrast(
-                prepared_image, contrast)
-            codes = pyzbar.decode(fully_prepared_image)
-            codes_len = len(codes)
-
-    if codes_len < 1:
+    codes = []
+    if decoder_names is None:
+        decoder_names = get_decoder_names(scanarium)
+    decoders = {name: get_decoder(name) for name in decoder_names}
+    contrasts = [float(contrast) for contrast in scanarium.get_config(
+        'scan', 'contrasts', kind='list')]
+    variants = [(name, contrast)
+                for name in decoder_names for contrast in contrasts]
+    decay = scanarium.get_config('scan', 'qr_variant_decay', kind='float',
+                                 allow_empty=True)
+    if decay is not None:
+        variants = QR_VARIANT_ORDER.order(variants)
+
+    fully_prepared_images = {}
+    for variant in variants:
+        if not codes:
+            (name, contrast) = variant
+            fully_prepared_image = fully_prepared_images.get(contrast)
+            if fully_prepared_image is None:
+                fully_prepared_image = apply_image_contrast(
+                    prepared_image, contrast)
+                fully_prepared_images[contrast] = fully_prepared_image
+            codes = decoders[name](scanarium, fully_prepared_image)
+            if codes and decay is not None:
+                QR_VARIANT_ORDER.record_success(variant, decay)
+
+    if not codes:
         raise ScanariumError('SE_SCAN_NO_QR_CODE',
                              'Failed to find QR code in image')
 
-    if codes_len > 1:
-        raise ScanariumError(
-            'SE_SCAN_TOO_MANY_QR_CODES',
-            'Expected to find one QR code in image, but found '
-            '{qr_codes_count}',
-            {'qr_codes_count': codes_len})
+    return (codes, scale_factor)
+
 
-    code = codes[0]
+def get_rect_and_data(scanarium, code, scale_factor):
     rect_scaled = code.rect
-    rect = namedtuple('Rect', ['left', 'top', 'width', 'height'])(
+    rect = Rect(
         rect_scaled.left / scale_factor, rect_scaled.top / scale_factor,
         rect_scaled.width / scale_factor, rect_scaled.height / scale_factor)
 
@@ -61,6 +91,41 @@ def extract_qr(scanarium, image):
     return (rect, data)
 
 
+def extract_qr(scanarium, image):
+    (codes, scale_factor) = decode_qr_codes(scanarium, image)
+    codes_len = len(codes)
+
+    if codes_len > 1:
+        raise ScanariumError(
+            'SE_SCAN_TOO_MANY_QR_CODES',
+            'Expected to find one QR code in image, but found '
+            '{qr_codes_count}',
+            {'qr_codes_count': codes_len})
+
+    return get_rect_and_data(scanarium, codes[0], scale_factor)
+
+
+# Like `extract_qr`, but for images that may show many sheets. Returns the
+# list of `(rect, data)` pairs of all well-formed QR codes, ordered top to
+# bottom (and left to right for equal tops). Misformed QR codes are skipped,
+# unless all QR codes are misformed.
+def extract_qrs(scanarium, image):
+    (codes, scale_factor) = decode_qr_codes(scanarium, image)
+    ret = []
+    error = None
+    for code in codes:
+        try:
+            ret.append(get_rect_and_data(scanarium, code, scale_factor))
+        except ScanariumError as e:
+            error = e
+
+    if not ret:
+        raise error
+
+    ret.sort(key=lambda code: (code[0].top, code[0].left))
+    return ret
+
+
 def expand_qr(scanarium, data):
     mapping_specs = scanarium.get_config('qr-code', 'mappings',
                                          allow_empty=True)
@@ -0,0 +1,140 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+# Decoders for QR codes.
+#
+# Each decoder takes a prepared (grayscale) image and returns a list of the
+# decoded QR codes as `Code`s. Decoders that fail to find a QR code return an
+# empty list.
+
+import os
+import threading
+
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from .ScanariumError import ScanariumError
+
+Rect = namedtuple('Rect', ['left', 'top', 'width', 'height'])
+
+# `data` holds the raw bytes of the QR code.
+Code = namedtuple('Code', ['rect', 'data'])
+
+# Detectors of OpenCV are not safe to use from many threads at once, so each
+# thread gets its own detectors.
+DETECTORS = threading.local()
+
+
+def raise_error_unavailable(name, reason):
+    raise ScanariumError(
+        'SE_QR_DECODER_UNAVAILABLE',
+        'QR decoder "{decoder}" is not available ({reason})',
+        {'decoder': name, 'reason': reason})
+
+
+def get_detector(name, factory):
+    ret = getattr(DETECTORS, name, None)
+    if ret is None:
+        ret = factory()
+        setattr(DETECTORS, name, ret)
+    return ret
+
+
+def points_to_code(points, data):
+    points = np.asarray(points).reshape(-1, 2)
+    (left, top) = points.min(axis=0)
+    (right, bottom) = points.max(axis=0)
+    rect = Rect(int(left), int(top), int(right - left), int(bottom - top))
+    return Code(rect, data.encode('utf-8'))
+
+
+def decode_pyzbar(scanarium, image):
+    try:
+        from pyzbar import pyzbar
+    except ImportError as e:
+        raise_error_unavailable('pyzbar', str(e))
+
+    return [Code(Rect(*code.rect), code.data)
+            for code in pyzbar.decode(image)]
+
+
+def decode_opencv_detector(name, factory, image):
+    detector = get_detector(name, factory)
+    (found, datas, points, _) = detector.detectAndDecodeMulti(image)
+    ret = []
+    if found:
+        for (data, code_points) in zip(datas, points):
+            # Empty data denotes QR codes that got detected, but could not
+            # get decoded.
+            if data:
+                ret.append(points_to_code(code_points, data))
+    if not ret:
+        # Detecting many QR codes at once misses single QR codes that
+        # detecting a single QR code finds (E.g.: on rotated sheets).
+        (data, points, _) = detector.detectAndDecode(image)
+        if data:
+            ret.append(points_to_code(points, data))
+    return ret
+
+
+def decode_opencv(scanarium, image):
+    return decode_opencv_detector('opencv', cv2.QRCodeDetector, image)
+
+
+def decode_opencv_aruco(scanarium, image):
+    if not hasattr(cv2, 'QRCodeDetectorAruco'):
+        raise_error_unavailable('opencv-aruco', 'needs OpenCV >= 4.8')
+    return decode_opencv_detector('opencv_aruco', cv2.QRCodeDetectorAruco,
+                                  image)
+
+
+def create_wechat_detector(scanarium):
+    if not hasattr(cv2, 'wechat_qrcode_WeChatQRCode'):
+        raise_error_unavailable('wechat', 'needs opencv-contrib-python')
+
+    model_dir = scanarium.get_config('scan', 'qr_wechat_model_directory',
+                                     allow_empty=True)
+    if model_dir:
+        model_dir = os.path.join(scanarium.get_config_dir_abs(), model_dir)
+        model_files = [os.path.join(model_dir, file) for file in [
+            'detect.prototxt', 'detect.caffemodel',
+            'sr.prototxt', 'sr.caffemodel']]
+        return cv2.wechat_qrcode_WeChatQRCode(*model_files)
+    # Without model files, the WeChat decoder falls back to traditional
+    # detection, but still uses its more robust binarization.
+    return cv2.wechat_qrcode_WeChatQRCode()
+
+
+def decode_wechat(scanarium, image):
+    detector = get_detector('wechat',
+                            lambda: create_wechat_detector(scanarium))
+    (datas, points) = detector.detectAndDecode(image)
+    return [points_to_code(code_points, data)
+            for (data, code_points) in zip(datas, points) if data]
+
+
+DECODERS = {
+    'pyzbar': decode_pyzbar,
+    'opencv': decode_opencv,
+    'opencv-aruco': decode_opencv_aruco,
+    'wechat': decode_wechat,
+}
+
+
+def get_decoder(name):
+    try:
+        return DECODERS[name]
+    except KeyError:
+        raise ScanariumError(
+            'SE_QR_DECODER_UNKNOWN',
+            'Unknown QR decoder "{decoder}". Known decoders are: '
+            '{known_decoders}',
+            {'decoder': name, 'known_decoders': ', '.join(DECODERS)})
+
+
+# Returns the names of the configured chain of decoders.
+def get_decoder_names(scanarium):
+    return scanarium.get_config('scan', 'qr_decoders', kind='list')
@@ -0,0 +1,98 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+# Quick checks whether an image is good enough to scan.
+#
+# Scanning a hopeless image (E.g.: a blurry phone shot, or a photo taken in a
+# dark room) runs through all contrasts, rectification iterations, and QR
+# decoders before failing. The checks here run on a thumbnail within a few
+# milliseconds and reject such images right away with a specific error.
+
+import cv2
+import numpy as np
+
+from .ScanariumError import ScanariumError
+from .scanner_util import scale_image
+
+THUMBNAIL_HEIGHT = 500
+
+
+def get_percentiles(image, percentiles):
+    histogram = cv2.calcHist([image], [0], None, [256], [0, 256]).ravel()
+    cumulative = np.cumsum(histogram) / histogram.sum()
+    return [int(np.searchsorted(cumulative, percentile / 100))
+            for percentile in percentiles]
+
+
+# The variance of the Laplacian, normalized by the dynamic range. Without the
+# normalization, dark or low-contrast images would look blurry.
+def get_sharpness(image, dynamic_range):
+    variance = cv2.Laplacian(image, cv2.CV_64F).var()
+    return variance / (dynamic_range ** 2)
+
+
+# Estimates the fraction of the image that the sheet covers by the biggest
+# bright region.
+def get_sheet_coverage(image):
+    _, thresholded = cv2.threshold(image, 0, 255,
+                                   cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    contours = cv2.findContours(thresholded, cv2.RETR_EXTERNAL,
+                                cv2.CHAIN_APPROX_SIMPLE)[-2]
+    area = max([cv2.contourArea(contour) for contour in contours], default=0)
+    return area / (image.shape[0] * image.shape[1])
+
+
+# Returns a dict of the quality metrics of `image`.
+def get_image_quality(scanarium, image):
+    (thumbnail, _) = scale_image(scanarium, image, 'quality',
+                                 scaled_height=THUMBNAIL_HEIGHT)
+    thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+
+    (dark, bright) = get_percentiles(thumbnail, [1, 99])
+    dynamic_range = bright - dark
+    return {
+        'brightness': bright,
+        'dynamic_range': dynamic_range,
+        'sharpness': get_sharpness(thumbnail, dynamic_range)
+        if dynamic_range else 0,
+        'sheet_coverage': get_sheet_coverage(thumbnail),
+    }
+
+
+# Raises a ScanariumError if `image` is too bad to scan.
+def check_image_quality(scanarium, image):
+    def get_config(key):
+        return scanarium.get_config('scan', f'quality_min_{key}',
+                                    kind='float', allow_empty=True)
+
+    quality = get_image_quality(scanarium, image)
+
+    min_brightness = get_config('brightness')
+    if min_brightness is not None \
+            and quality['brightness'] < min_brightness:
+        raise ScanariumError(
+            'SE_SCAN_IMAGE_TOO_DARK',
+            'The image is too dark. Please add more light')
+
+    min_dynamic_range = get_config('dynamic_range')
+    if min_dynamic_range is not None \
+            and quality['dynamic_range'] < min_dynamic_range:
+        # The image is (nearly) uniform, so there is nothing to decode.
+        raise ScanariumError('SE_SCAN_NO_QR_CODE',
+                             'Failed to find QR code in image')
+
+    min_sharpness = get_config('sharpness')
+    if min_sharpness is not None and quality['sharpness'] < min_sharpness:
+        raise ScanariumError(
+            'SE_SCAN_IMAGE_TOO_BLURRY',
+            'The image is too blurry. Please hold the camera still and '
+            'focus on the sheet')
+
+    min_sheet_coverage = get_config('sheet_coverage')
+    if min_sheet_coverage is not None \
+            and quality['sheet_coverage'] < min_sheet_coverage:
+        raise ScanariumError(
+            'SE_SCAN_SHEET_TOO_SMALL',
+            'The sheet is too small in the image. Please move the camera '
+            'closer to the sheet')
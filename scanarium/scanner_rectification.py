@@ -2,80 +2,33 @@
 # GNU Affero General Public License v3.0 (See LICENSE.md)
 # SPDX-License-Identifier: AGPL-3.0-only
 
-import random
+import math
 
 import cv2
 import numpy as np
 
+from .ContourAnalysis import ContourAnalysis
 from .ScanariumError import ScanariumError
 from .scanner_util import prepare_image, apply_image_contrast
 
 
-def get_cv_major_version():
-    return int(cv2.__version__.split('.', 1)[0])
-
-
 def distance(pointA, pointB):
     return np.linalg.norm([pointA - pointB])
 
 
-def add_text(image, text, x=2, y=5, color=None):
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    fontScale = image.shape[0] / 1000
-
-    position = (int(image.shape[1] * x / 100),
-                int(image.shape[0] * y / 100))
-
-    if color is None:
-        color = (0, 255, 0)
-
-    return cv2.putText(image, text, position, font, fontScale, color)
-
-
-def debug_show_contours(scanarium, name, image, contours, hierarchy,
-                        ratings=None, points=[]):
-    if scanarium.get_config('general', 'debug', 'boolean'):
-        # The contours image should contain the dampened image and allow color
-        contours_image = cv2.cvtColor((image * 0.3).astype('uint8'),
-                                      cv2.COLOR_GRAY2BGR)
-
-        colors = {
-            'small': (0, 0, random.randint(200, 256)),
-            'non-rect': (0, random.randint(100, 140), 255),
-            'outside-point': (0, 255, random.randint(200, 256)),
-            'good': (0, 255, 0),
-            'other': (255, 128, 128)
-            }
-
-        count = len(ratings if ratings else contours)
-        drawn = 0
-        for i in range(count):
-            if ratings:
-                color = colors.get(ratings[i], colors['other'])
-            else:
-                color = (random.randint(0, 256), random.randint(0, 256),
-                         random.randint(0, 256))
-            if contours[i] is not None:
-                cv2.drawContours(contours_image, contours, i, color, 2,
-                                 cv2.LINE_8, hierarchy, 0)
-                drawn += 1
-        add_text(contours_image, f'Drawn contours: {drawn}')
-
-        for point in points:
-            cv2.drawMarker(contours_image, point, colors.get('good'))
-
-        if ratings:
-            y = 5
-            for k, v in sorted(colors.items()):
-                y += 5
-                add_text(contours_image, k, x=2, y=y, color=v)
-
-        scanarium.debug_show_image(name, contours_image)
-
-
-def refine_corners(scanarium, prepared_image, points):
+# Refines the corner `points` (in coordinates of the full resolution `image`)
+# that got found on an image scaled by `scale_factor`.
+#
+# Refinement happens on small windows around each corner cropped from the
+# full resolution image, so corners get as accurate as the full resolution
+# allows, while only few pixels need processing. The search window covers the
+# same part of the sheet as `corner_refinement_size` pixels on the scaled
+# image.
+def refine_corners(scanarium, image, points, scale_factor=1):
     window_size = scanarium.get_config('scan', 'corner_refinement_size', 'int')
+    points = points.reshape(4, 2)
     if window_size > 1:
+        window_size = int(math.ceil(window_size / scale_factor))
         search_window = (window_size, window_size)
 
         iteration_bound = scanarium.get_config(
@@ -85,89 +38,25 @@ def refine_corners(scanarium, prepared_image, points):
         criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_COUNT,
                     iteration_bound, accuracy)
 
-        points = cv2.cornerSubPix(
-            prepared_image, points, search_window, (-1, -1), criteria)
-
-    return points.reshape(4, 2)
-
-
-def find_rect_points(scanarium, image, decreasingArea=True,
-                     required_points=[]):
-    imageArea = image.shape[0] * image.shape[1]
-    contour_min_area = imageArea / 25
-    prepared_image = image
-
-    canny_blur_size = scanarium.get_config('scan', 'canny_blur_size',
-                                           kind='int')
-    canny_threshold_1 = scanarium.get_config('scan', 'canny_threshold_1',
-                                             kind='int')
-    canny_threshold_2 = scanarium.get_config('scan', 'canny_threshold_2',
-                                             kind='int')
-    if canny_blur_size > 1:
-        prepared_image = cv2.blur(
-            prepared_image, (canny_blur_size, canny_blur_size))
-    edges_image = cv2.Canny(prepared_image, canny_threshold_1,
-                            canny_threshold_2)
-    # When looking for contours that contain some QR code, RETR_LIST (below)
-    # might not be most efficient, RETR_TREE might allow to optimize. But
-    # RETR_LIST is simpler to use and quick enough for now.
-    # todo: See if RETR_TREE performs better here.
-    contours_result = cv2.findContours(edges_image, cv2.RETR_LIST,
-                                       cv2.CHAIN_APPROX_NONE)
-
-    if get_cv_major_version() >= 4:
-        contours, hierarchy = contours_result
-    else:
-        # OpenCV <4 used to pass back the image as first element in the tuple.
-        # So we get rid of that to transparently work on OpenCV 3.x
-        _, contours, hierarchy = contours_result
-
-    debug_show_contours(scanarium, 'All contours', image, contours, hierarchy,
-                        points=required_points)
-
-    good_approx = None
-    # With OpenCV 4.2.0 `contours` would be a list and we could use
-    # `contours.sort` directly. But at least since OpenCV 4.5.5, `contours` is
-    # an array and hence lacks a `sort` method. So we resort to `sorted` to
-    # support both OpenCV versions
-    contours = sorted(contours, key=cv2.contourArea, reverse=decreasingArea)
-    ratings = []
-    approximations = []
-    for contour in contours:
-        if cv2.contourArea(contour) < contour_min_area:
-            # Contour too small, so we skip this contour
-            ratings.append('small')
-            approximations.append(None)
-            continue
-
-        peri = cv2.arcLength(contour, True)
-        approx = cv2.approxPolyDP(contour, 0.02 * peri, True)
-        approximations.append(approx)
-
-        if len(approx) == 4:
-            # 4 points ... that looks should be turned into a rectangle
-
-            if any(cv2.pointPolygonTest(approx, point, False) < 0
-                   for point in required_points):
-                # A required point is outside, so we skip this contour.
-                ratings.append('outside-point')
-                continue
-
-            # The contour is big enough, looks like a rect, and contains all
-            # required points. That's the contour to continue with.
-            good_approx = approx
-            ratings.append('good')
-            break
-        else:
-            ratings.append('non-rect')
-
-    debug_show_contours(scanarium, 'Rated contours', image, contours,
-                        hierarchy, ratings=ratings, points=required_points)
-    debug_show_contours(scanarium, 'Rated approximations', image,
-                        approximations, hierarchy, ratings=ratings,
-                        points=required_points)
-
-    return good_approx
+        # cornerSubPix needs a margin of a few pixels around the window.
+        margin = window_size + 3
+        roi_size = 2 * margin + 1
+        refined = []
+        for point in points:
+            center = (int(round(point[0])), int(round(point[1])))
+            # getRectSubPix replicates the border for corners close to the
+            # image's border.
+            roi = cv2.getRectSubPix(image, (roi_size, roi_size), center)
+            if len(roi.shape) == 3:
+                roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+            offset = np.array(center, dtype='float32') - margin
+            roi_point = (point - offset).reshape(1, 1, 2)
+            roi_point = cv2.cornerSubPix(
+                roi, roi_point, search_window, (-1, -1), criteria)
+            refined.append(roi_point.reshape(2) + offset)
+        points = np.array(refined, dtype='float32')
+
+    return points
 
 
 def sort_points_assume_xy_mostly_aligned(points):
@@ -239,29 +128,125 @@ def rectify_by_rect_points(scanarium, image, points):
     return image
 
 
-def rectify(scanarium, image, decreasingArea=True, required_points=[],
-            yield_only_points=False):
-    found_points_scaled_list = []
-    (prepared_image, scale_factor) = prepare_image(scanarium, image)
+# Returns the levels to find contours on for coarse-to-fine detection. Each
+# level is a dict holding the image to find contours on and its scale factor
+# relative to the original image. The levels are ordered from coarsest to
+# finest, and the finest level is `prepared_image` itself.
+def get_pyramid_levels(scanarium, prepared_image, scale_factor):
+    levels = []
+    heights = scanarium.get_config('scan', 'rectification_pyramid_heights',
+                                   kind='list', allow_empty=True, default=())
+    prepared_height = prepared_image.shape[0]
+    for height in sorted(int(height) for height in heights):
+        if height < prepared_height:
+            level_factor = height / prepared_height
+            level_dimension = (
+                int(prepared_image.shape[1] * level_factor), height)
+            levels.append({
+                'image': cv2.resize(prepared_image, level_dimension,
+                                    interpolation=cv2.INTER_AREA),
+                'scale_factor': scale_factor * level_factor,
+                'title': f'Prepared for detection (height: {height}, '
+                'contrast: {contrast})',
+            })
+    levels.append({
+        'image': prepared_image,
+        'scale_factor': scale_factor,
+        'title': 'Prepared for detection (contrast: {contrast})',
+    })
+    return levels
+
+
+# Returns the contour analyses (one per configured contrast) of a pyramid
+# level. Analyses get created upon first use, so finer levels only get
+# analyzed if coarser levels did not suffice.
+def get_level_analyses(scanarium, level):
+    analyses = level.get('analyses')
+    if analyses is None:
+        contrasts = [float(contrast) for contrast in scanarium.get_config(
+            'scan', 'contrasts', kind='list')]
+        analyses = []
+        for contrast in contrasts:
+            fully_prepared_image = apply_image_contrast(level['image'],
+                                                        contrast)
+
+            if scanarium.are_debug_images_enabled():
+                scanarium.debug_show_image(
+                    level['title'].format(contrast=contrast),
+                    fully_prepared_image)
+
+            analyses.append(ContourAnalysis(scanarium, fully_prepared_image))
+        # Concurrent rectifications may analyze a level at the same time.
+        # That is wasteful, but harmless, as they arrive at the same result.
+        level['analyses'] = analyses
+    return analyses
+
+
+# Returns True if the rects found on a coarser pyramid level should rather get
+# checked on a finer level. This is the case if the analyses for the
+# configured contrasts disagree (i.e.: not all of them found a rect, or the
+# found rects differ in area), or if the rect is so small compared to the
+# level that it is barely bigger than the smallest contours that get
+# considered at all (See `ContourAnalysis`). Each of those hints at a rect
+# that is not the sheet, or at a sheet that is too small for the level to
+# find its contour reliably.
+def is_ambiguous(level, analyses, found_points_scaled_list):
+    if len(found_points_scaled_list) < len(analyses):
+        return True
+
+    areas = [cv2.contourArea(points) for points in found_points_scaled_list]
+    if min(areas) < max(areas) * 0.9:
+        return True
+
+    level_area = level['image'].shape[0] * level['image'].shape[1]
+    return min(areas) < level_area * 2 / 25
+
+
+# Prepares `image` for rectification. The result can be passed to `rectify`
+# as `prepared`. This allows to rectify the same image for many QR codes
+# (E.g.: when scanning many sheets at once) without analyzing the contours
+# again.
+#
+# If `scan.rectification_pyramid_heights` is set, contours get searched
+# coarse-to-fine. Finer levels only get analyzed if no suitable rect could be
+# found on the coarser ones, or if the found rects are ambiguous (See
+# `is_ambiguous`).
+def prepare_rectification(scanarium, image):
+    (prepared_image, scale_factor) = prepare_image(
+        scanarium, image, 'rectification')
+
+    return {
+        'levels': get_pyramid_levels(scanarium, prepared_image,
+                                     scale_factor),
+    }
 
-    contrasts = [float(contrast.strip())
-                 for contrast in
-                 scanarium.get_config('scan', 'contrasts').split(',')]
-    for contrast in contrasts:
-        fully_prepared_image = apply_image_contrast(prepared_image, contrast)
 
-        scanarium.debug_show_image(
-            f'Prepared for detection (contrast: {contrast})',
-            fully_prepared_image)
+def rectify(scanarium, image, decreasingArea=True, required_points=[],
+            yield_only_points=False, prepared=None):
+    found_points_scaled_list = []
+    if prepared is None:
+        prepared = prepare_rectification(scanarium, image)
 
-        required_points_scaled = [(int(point[0] * scale_factor),
-                                   int(point[1] * scale_factor)
+    for level in prepared['levels']:
+        level_scale_factor = level['scale_factor']
+        required_points_scaled = [(int(point[0] * level_scale_factor),
+                                   int(point[1] * level_scale_factor)
                                    ) for point in required_points]
-        found_points_scaled = find_rect_points(
-            scanarium, fully_prepared_image, decreasingArea,
-            required_points_scaled)
-        if found_points_scaled is not None:
-            found_points_scaled_list.append(found_points_scaled)
+        analyses = get_level_analyses(scanarium, level)
+        level_found_points_scaled_list = []
+        for analysis in analyses:
+            found_points_scaled = analysis.find_rect_points(
+                decreasingArea, required_points_scaled)
+            if found_points_scaled is not None:
+                level_found_points_scaled_list.append(found_points_scaled)
+
+        if level_found_points_scaled_list:
+            # If finer levels find no rect at all, we fall back to the rects
+            # of this level.
+            found_points_scaled_list = level_found_points_scaled_list
+            scale_factor = level_scale_factor
+            if not is_ambiguous(level, analyses, found_points_scaled_list):
+                break
 
     if not found_points_scaled_list:
         raise ScanariumError(
@@ -274,7 +259,7 @@ def rectify(scanarium, image, decreasingArea=True, required_points=[],
         .astype('float32')
 
     rectify_points = refine_corners(
-        scanarium, prepared_image, best_found_points)
+        scanarium, image, best_found_points, scale_factor)
 
     if yield_only_points:
         ret = rectify_points
@@ -290,7 +275,7 @@ def rectify_to_biggest_rect(scanarium, image, yield_only_points=False):
 
 
 def rectify_to_qr_parent_rect(scanarium, image, qr_rect,
-                              yield_only_points=False):
+                              yield_only_points=False, prepared=None):
     def qr_rect_point(x_factor, y_factor):
         return (qr_rect.left + x_factor * qr_rect.width,
                 qr_rect.top + y_factor * qr_rect.height)
@@ -312,4 +297,4 @@ def rectify_to_qr_parent_rect(scanarium, image, qr_rect,
 
     return rectify(scanarium, image, decreasingArea=False,
                    required_points=required_points,
-                   yield_only_points=yield_only_points)
+                   yield_only_points=yield_only_points, prepared=prepared)
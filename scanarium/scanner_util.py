@@ -2,15 +2,77 @@
 # GNU Affero General Public License v3.0 (See LICENSE.md)
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import random
+
 import cv2
 import numpy as np
 
 
-def scale_image(scanarium, image, description, scaled_height=None,
-                scaled_width=None, trip_height=None, trip_width=None):
-    scaled_image = image
+def get_cv_major_version():
+    return int(cv2.__version__.split('.', 1)[0])
+
+
+def add_text(image, text, x=2, y=5, color=None):
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    fontScale = image.shape[0] / 1000
+
+    position = (int(image.shape[1] * x / 100),
+                int(image.shape[0] * y / 100))
+
+    if color is None:
+        color = (0, 255, 0)
+
+    return cv2.putText(image, text, position, font, fontScale, color)
+
+
+def debug_show_contours(scanarium, name, image, contours, hierarchy,
+                        ratings=None, points=[]):
+    def draw():
+        # The contours image should contain the dampened image and allow color
+        contours_image = cv2.cvtColor((image * 0.3).astype('uint8'),
+                                      cv2.COLOR_GRAY2BGR)
+
+        colors = {
+            'small': (0, 0, random.randint(200, 256)),
+            'non-rect': (0, random.randint(100, 140), 255),
+            'outside-point': (0, 255, random.randint(200, 256)),
+            'good': (0, 255, 0),
+            'other': (255, 128, 128)
+            }
+
+        count = len(ratings if ratings else contours)
+        drawn = 0
+        for i in range(count):
+            if ratings:
+                color = colors.get(ratings[i], colors['other'])
+            else:
+                color = (random.randint(0, 256), random.randint(0, 256),
+                         random.randint(0, 256))
+            if contours[i] is not None:
+                cv2.drawContours(contours_image, contours, i, color, 2,
+                                 cv2.LINE_8, hierarchy, 0)
+                drawn += 1
+        add_text(contours_image, f'Drawn contours: {drawn}')
+
+        for point in points:
+            cv2.drawMarker(contours_image, point, colors.get('good'))
+
+        if ratings:
+            y = 5
+            for k, v in sorted(colors.items()):
+                y += 5
+                add_text(contours_image, k, x=2, y=y, color=v)
 
-    def get_scale_factor(shape, trip, scaled):
+        return contours_image
+
+    scanarium.debug_show_image(name, draw)
+
+
+# Returns the factor by which `scale_image` scales images of the given
+# dimensions.
+def get_scale_factor(height, width, scaled_height=None, scaled_width=None,
+                     trip_height=None, trip_width=None):
+    def get_dimension_factor(shape, trip, scaled):
         factor = 1
         if trip is None:
             trip = scaled
@@ -18,10 +80,19 @@ def scale_image(scanarium, image, description, scaled_height=None,
             factor = scaled / shape
         return factor
 
-    height_factor = get_scale_factor(
-        image.shape[0], trip_height, scaled_height)
-    width_factor = get_scale_factor(image.shape[1], trip_width, scaled_width)
-    scale_factor = min(height_factor, width_factor)
+    height_factor = get_dimension_factor(height, trip_height, scaled_height)
+    width_factor = get_dimension_factor(width, trip_width, scaled_width)
+    return min(height_factor, width_factor)
+
+
+def scale_image(scanarium, image, description, scaled_height=None,
+                scaled_width=None, trip_height=None, trip_width=None):
+    scaled_image = image
+
+    scale_factor = get_scale_factor(
+        image.shape[0], image.shape[1], scaled_height=scaled_height,
+        scaled_width=scaled_width, trip_height=trip_height,
+        trip_width=trip_width)
     if scale_factor != 1:
         scaled_height = int(image.shape[0] * scale_factor)
         scaled_width = int(image.shape[1] * scale_factor)
@@ -53,14 +124,21 @@ def apply_image_contrast(image, contrast=1):
     return image
 
 
-def prepare_image(scanarium, image):
+# If `kind` is given, the image gets scaled as configured for this kind (See
+# `scale_image_from_config`).
+def prepare_image(scanarium, image, kind=None):
     # If the picture is too big (E.g.: from a proper photo camera), edge
     # detection won't work reliably, as the sheet's contour will exhibit too
     # much detail and would get broken down into more than 4 segments. So we
     # scale too big images down. Note though that the scaled image is only
     # used for edge detection. Rectification happens on the original picture.
-    (prepared_image, scale_factor) = scale_image(
-        scanarium, image, 'preparation', scaled_height=1000, trip_height=1300)
+    if kind is None:
+        (prepared_image, scale_factor) = scale_image(
+            scanarium, image, 'preparation', scaled_height=1000,
+            trip_height=1300)
+    else:
+        (prepared_image, scale_factor) = scale_image_from_config(
+            scanarium, image, kind)
 
     prepared_image = cv2.cvtColor(prepared_image, cv2.COLOR_BGR2GRAY)
     prepared_image = correct_image_brightness(scanarium, prepared_image)
@@ -68,14 +146,26 @@ def prepare_image(scanarium, image):
     return (prepared_image, scale_factor)
 
 
-def scale_image_from_config(scanarium, image, kind):
+def get_scale_config(scanarium, kind):
     def get_config(key):
         return scanarium.get_config('scan', f'max_{kind}_{key}',
                                     kind='int', allow_empty=True)
 
+    return {
+        'scaled_height': get_config('height'),
+        'scaled_width': get_config('width'),
+        'trip_height': get_config('height_trip'),
+        'trip_width': get_config('width_trip'),
+    }
+
+
+# Returns the factor by which `scale_image_from_config` scales images of the
+# given dimensions.
+def get_scale_factor_from_config(scanarium, height, width, kind):
+    return get_scale_factor(height, width,
+                            **get_scale_config(scanarium, kind))
+
+
+def scale_image_from_config(scanarium, image, kind):
     return scale_image(scanarium, image, kind,
-                       scaled_height=get_config('height'),
-                       scaled_width=get_config('width'),
-                       trip_height=get_config('height_trip'),
-                       trip_width=get_config('width_trip'),
-                       )
+                       **get_scale_config(scanarium, kind))
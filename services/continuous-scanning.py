@@ -23,8 +23,12 @@ logger = logging.getLogger(__name__)
 STABLE_MOVE_DIMENSION_FACTOR = 0.05
 
 
+# Tracks a QR code across images to decide when it is stable enough to scan.
+#
+# If `persist` is False, state is neither loaded from nor stored to
+# `state_file`.
 class QrState(object):
-    def __init__(self, scanarium, state_file):
+    def __init__(self, scanarium, state_file, persist=True):
         self.scanarium = scanarium
         self.state_file = state_file
 
@@ -40,8 +44,38 @@ class QrState(object):
         self.last_usable_data_stable_start = 0
         self.last_usable_data_scanned = False
 
-        self.load_state()
-        scanarium.register_for_cleanup(self.store_state)
+        if persist:
+            self.load_state()
+            scanarium.register_for_cleanup(self.store_state)
+
+    def set_state(self, loaded):
+        self.last_data = loaded.get('last_data', self.last_data)
+        self.last_data_start = float(loaded.get(
+            'last_data_start', self.last_data_start))
+
+        self.last_usable_data = loaded.get(
+            'last_usable_data', self.last_usable_data)
+        self.last_usable_data_position = [
+            int(e) for e in loaded.get(
+                'last_usable_data_position',
+                self.last_usable_data_position)]
+        self.last_usable_data_stable_start = float(loaded.get(
+            'last_usable_data_stable_start',
+            self.last_usable_data_stable_start))
+        self.last_usable_data_scanned = bool(loaded.get(
+            'last_usable_data_scanned',
+            self.last_usable_data_scanned))
+
+    def get_state(self):
+        return {
+            'last_data': self.last_data,
+            'last_data_start': self.last_data_start,
+            'last_usable_data': self.last_usable_data,
+            'last_usable_data_position': self.last_usable_data_position,
+            'last_usable_data_stable_start':
+                self.last_usable_data_stable_start,
+            'last_usable_data_scanned': self.last_usable_data_scanned,
+        }
 
     def load_state(self):
         if self.state_file:
@@ -50,22 +84,9 @@ class QrState(object):
                 with open(self.state_file) as f:
                     loaded = json.load(f)
 
-                self.last_data = loaded.get('last_data', self.last_data)
-                self.last_data_start = float(loaded.get(
-                    'last_data_start', self.last_data_start))
-
-                self.last_usable_data = loaded.get(
-                    'last_usable_data', self.last_usable_data)
-                self.last_usable_data_position = [
-                    int(e) for e in loaded.get(
-                        'last_usable_data_position',
-                        self.last_usable_data_position)]
-                self.last_usable_data_stable_start = float(loaded.get(
-                    'last_usable_data_stable_start',
-                    self.last_usable_data_stable_start))
-                self.last_usable_data_scanned = bool(loaded.get(
-                    'last_usable_data_scanned',
-                    self.last_usable_data_scanned))
+                self.set_state(loaded)
+                self.scanarium.set_qr_variant_state(
+                    loaded.get('qr_variants', []))
             except Exception:
                 logger.exception(
                     f'Failed to load state file {self.state_file}')
@@ -74,15 +95,10 @@ class QrState(object):
 
     def store_state(self):
         if self.state_file:
-            data = {
-                'last_data': self.last_data,
-                'last_data_start': self.last_data_start,
-                'last_usable_data': self.last_usable_data,
-                'last_usable_data_position': self.last_usable_data_position,
-                'last_usable_data_stable_start':
-                    self.last_usable_data_stable_start,
-                'last_usable_data_scanned': self.last_usable_data_scanned,
-            }
+            data = self.get_state()
+            # The order to decode QR codes in is not tied to the QR code, but
+            # is stored along, so restarts need not adapt again.
+            data['qr_variants'] = self.scanarium.get_qr_variant_state()
             scanarium.dump_json(self.state_file, data)
 
     def is_stable_move(self, new):
@@ -173,6 +189,96 @@ class QrState(object):
         return self.now
 
 
+# Tracks the QR codes of many sheets across images. Each sheet gets tracked by
+# its own `QrState`. As many sheets may show the same QR code, sheets get told
+# apart by the QR code's position.
+class MultiQrState(object):
+    def __init__(self, scanarium, state_file):
+        self.scanarium = scanarium
+        self.state_file = state_file
+
+        self.now = time.time()
+        self.sheets = []
+
+        self.load_state()
+        scanarium.register_for_cleanup(self.store_state)
+
+    def new_sheet(self):
+        return QrState(self.scanarium, None, persist=False)
+
+    def load_state(self):
+        if self.state_file:
+            try:
+                loaded = {}
+                with open(self.state_file) as f:
+                    loaded = json.load(f)
+
+                for sheet_state in loaded.get('sheets', []):
+                    sheet = self.new_sheet()
+                    sheet.set_state(sheet_state)
+                    self.sheets.append(sheet)
+                self.scanarium.set_qr_variant_state(
+                    loaded.get('qr_variants', []))
+            except Exception:
+                logger.exception(
+                    f'Failed to load state file {self.state_file}')
+        else:
+            logger.info('No state file given. Skipping state loading')
+
+    def store_state(self):
+        if self.state_file:
+            data = {
+                'sheets': [sheet.get_state() for sheet in self.sheets],
+                'qr_variants': self.scanarium.get_qr_variant_state(),
+            }
+            scanarium.dump_json(self.state_file, data)
+
+    def find_sheet(self, sheets, rect, data):
+        # The nearest sheet that last showed the same QR code
+        ret = None
+        ret_distance = None
+        for sheet in sheets:
+            position = sheet.last_usable_data_position
+            if sheet.last_usable_data == data and len(position) == 4:
+                distance = abs(position[0] - rect.left) \
+                    + abs(position[1] - rect.top)
+                if ret is None or distance < ret_distance:
+                    ret = sheet
+                    ret_distance = distance
+        return ret
+
+    # Updates the sheets from the `(rect, data)` pairs of an image's QR
+    # codes. Returns the list of `(sheet, rect, data)` for the QR codes.
+    def update(self, codes):
+        self.now = time.time()
+        ret = []
+        unmatched = list(self.sheets)
+        for rect, data in codes:
+            sheet = self.find_sheet(unmatched, rect, data)
+            if sheet is None:
+                sheet = self.new_sheet()
+                self.sheets.append(sheet)
+            else:
+                unmatched.remove(sheet)
+            sheet.update(rect, data)
+            ret.append((sheet, rect, data))
+
+        for sheet in unmatched:
+            sheet.update(None, None)
+
+        # Sheets that are gone for good no longer need tracking
+        self.sheets = [sheet for sheet in self.sheets
+                       if sheet.last_usable_data is not None]
+        return ret
+
+    def get_stable_duration(self):
+        return max([sheet.get_stable_duration() for sheet in self.sheets],
+                   default=0)
+
+    def get_last_update(self):
+        return self.now
+
+
 def scan_forever_with_camera(scanarium, camera, qr_state, image_pause_period):
     alerted_no_approx = False
 
@@ -230,6 +336,60 @@ def scan_forever_with_camera(scanarium, camera, qr_state, image_pause_period):
         time.sleep(image_pause_period)
 
 
+def scan_forever_with_camera_multi_sheet(scanarium, camera, qr_state,
+                                         image_pause_period):
+    alerted_no_approx = False
+
+    def should_skip_exception(e):
+        ret = False
+        if isinstance(e, ScanariumError) \
+                and e.code == 'SE_SCAN_NO_APPROX':
+            ret = qr_state.get_stable_duration() <= 3 or alerted_no_approx
+
+        return ret
+
+    while True:
+        image = scanarium.get_image(camera)
+        try:
+            codes = scanarium.extract_qrs(image)
+        except ScanariumError as e:
+            if e.code in [
+                'SE_SCAN_MISFORMED_QR_CODE',
+                'SE_SCAN_NO_QR_CODE',
+                'SE_UNKNOWN_QR_CODE',
+                    ]:
+                codes = []
+            else:
+                raise e
+
+        sheets = [(sheet, rect, data)
+                  for sheet, rect, data in qr_state.update(codes)
+                  if sheet.should_scan()]
+
+        if sheets:
+            try:
+                logger.debug(f'Processing {len(sheets)} sheets ...')
+                results = scanarium.process_image_with_qr_codes(
+                    image, [(rect, data) for _, rect, data in sheets],
+                    should_skip_exception)
+
+                for (sheet, _, data), result in zip(sheets, results):
+                    if result is None:
+                        pass
+                    elif result.is_ok:
+                        logger.debug(f'Processed sheet "{data}": ok')
+                        sheet.mark_scanned()
+                    elif result.error_code == 'SE_SCAN_NO_APPROX':
+                        logger.info('Failed to find rectangle contour')
+                        alerted_no_approx = True
+            except Exception:
+                logger.exception('Failed to process scanned image')
+        else:
+            alerted_no_approx = False
+
+        time.sleep(image_pause_period)
+
+
 class Watchdog(object):
     def __init__(self, scanarium, qr_state, period, mode, pause_period,
                  initial_pause_period):
@@ -295,13 +455,14 @@ class Watchdog(object):
 
 
 def scan_forever(scanarium, qr_state, image_error_pause_period,
-                 image_pause_period):
+                 image_pause_period, multi_sheet=False):
+    scan_function = scan_forever_with_camera_multi_sheet if multi_sheet \
+        else scan_forever_with_camera
     while True:
         camera = None
         try:
             camera = scanarium.open_camera()
-            scan_forever_with_camera(scanarium, camera, qr_state,
-                                     image_pause_period)
+            scan_function(scanarium, camera, qr_state, image_pause_period)
         except Exception:
             logger.exception('Failed to scan')
             # Something went wrong, like camera being unplugged. So we back off
@@ -356,14 +517,19 @@ def register_arguments(scanarium, parser):
 
 
 def run(scanarium, args):
-    qr_state = QrState(scanarium, args.state_file)
+    multi_sheet = scanarium.get_config('service:continuous-scanning',
+                                       'multi_sheet', kind='boolean')
+    if multi_sheet:
+        qr_state = MultiQrState(scanarium, args.state_file)
+    else:
+        qr_state = QrState(scanarium, args.state_file)
     if args.bailout_period:
         watchdog = Watchdog(
             scanarium, qr_state, args.bailout_period, args.bailout_mode,
             args.bailout_pause_period, args.bailout_initial_pause_period)
         watchdog.start()
     scan_forever(scanarium, qr_state, args.image_error_pause_period,
-                 args.image_pause_period)
+                 args.image_pause_period, multi_sheet)
 
 
 if __name__ == "__main__":
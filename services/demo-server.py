@@ -3,18 +3,29 @@
 # GNU Affero General Public License v3.0 (See LICENSE.md)
 # SPDX-License-Identifier: AGPL-3.0-only
 
+import asyncio
 import concurrent.futures
+import email.utils
 import http
 import http.server
+import io
+import mimetypes
 import os
+import posixpath
+import re
+import shutil
 import socketserver
 import sys
+import tempfile
 import logging
+import urllib.parse
 
 SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 sys.path.insert(0, SCANARIUM_DIR_ABS)
-from scanarium import Scanarium
+from scanarium import FormParser, Scanarium, ScanariumError
+from scanarium.CgiWorkerPool import CgiWorkerPool
+from scanarium.Compressor import Compressor
 del sys.path[0]
 
 scanarium = Scanarium()
@@ -22,6 +33,127 @@ logger = logging.getLogger(__name__)
 
 LOG_REQUESTS = False
 SERVER_VERSION_OVERRIDE = None
+CACHE_IMMUTABLE_PATHS = None
+CACHE_REVALIDATE_PATHS = None
+CACHE_CONTROL_STATIC = 'no-cache'
+CACHE_IMMUTABLE_MAX_AGE = 31536000
+DIRECTORY_INDEX = ['index.html']
+COMPRESSOR = None
+COMPRESSION_SUFFIXES = ()
+COMPRESSION_MAX_SIZE = 0
+CGI_SCRIPT_TIMEOUT = 600
+
+
+def should_log_request(code):
+    log = False
+    if LOG_REQUESTS == 'all':
+        log = True
+    elif LOG_REQUESTS == 'non-200':
+        log = code != 200
+    elif LOG_REQUESTS == 'non-2xx':
+        log = code < 200 or code >= 300
+    elif LOG_REQUESTS == 'none':
+        log = False
+    else:
+        raise RuntimeError('Unknown log setting "%s"' % (LOG_REQUESTS))
+    return log
+
+
+def get_cache_control(path):
+    # `path` is the unquoted path of the request's URL.
+    if path.startswith('/cgi-bin/'):
+        ret = 'no-store'
+    elif CACHE_IMMUTABLE_PATHS is not None \
+            and CACHE_IMMUTABLE_PATHS.search(path):
+        ret = f'public, max-age={CACHE_IMMUTABLE_MAX_AGE}, immutable'
+    elif CACHE_REVALIDATE_PATHS is not None \
+            and CACHE_REVALIDATE_PATHS.search(path):
+        ret = 'no-cache'
+    else:
+        ret = CACHE_CONTROL_STATIC
+    return ret
+
+
+def get_etag(stat, encoding=None):
+    suffix = '' if encoding is None else '-' + encoding
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{suffix}"'
+
+
+# Returns a triple of the encoding to send `file_name` in, the name of the
+# precompressed file to send, and the data to send. If the file should get
+# sent as is, all three are None. Otherwise, one of file name and data is
+# None.
+def get_encoded_content(file_name, stat, accept_encoding):
+    encoding = None
+    encoded_file_name = None
+    data = None
+    if COMPRESSOR is not None:
+        encoding = COMPRESSOR.negotiate_encoding(accept_encoding)
+    if encoding is not None:
+        encoded_file_name = COMPRESSOR.find_precompressed_file(
+            file_name, encoding, stat.st_mtime)
+        if encoded_file_name is None:
+            if file_name.endswith(COMPRESSION_SUFFIXES) \
+                    and stat.st_size <= COMPRESSION_MAX_SIZE:
+                with open(file_name, 'rb') as f:
+                    data = COMPRESSOR.compress_cached(
+                        (file_name, stat.st_mtime_ns, stat.st_size),
+                        f.read(), encoding)
+            else:
+                encoding = None
+    return (encoding, encoded_file_name, data)
+
+
+def find_directory_index(dir):
+    ret = None
+    for name in DIRECTORY_INDEX:
+        file = os.path.join(dir, name)
+        if os.path.isfile(file):
+            ret = file
+            break
+    return ret
+
+
+def get_static_headers(stat, encoding):
+    ret = {
+        'ETag': get_etag(stat, encoding),
+    }
+    if COMPRESSOR is not None:
+        ret['Vary'] = 'Accept-Encoding'
+    return ret
+
+
+def is_not_modified(if_none_match, if_modified_since, etag, mtime):
+    # If-None-Match takes precedence over If-Modified-Since, and compares
+    # ETags weakly (i.e.: ignoring the `W/` prefix).
+    ret = False
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        tags = [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+        ret = etag in tags or '*' in tags
+    elif if_modified_since is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+            ret = int(mtime) <= since.timestamp()
+        except (TypeError, ValueError):
+            pass
+    return ret
+
+
+def alias_path(f):
+    dir = scanarium.get_frontend_dynamic_dir_abs() + os.sep
+    if f.startswith(dir):
+        f = f[len(dir):]
+        f = os.path.join(scanarium.get_dynamic_directory(), f)
+        f = os.path.normpath(f)
+    dir = scanarium.get_frontend_cgi_bin_dir_abs() + os.sep
+    if f.startswith(dir):
+        f = f[len(dir):]
+        f = os.path.join(scanarium.get_backend_dir_abs(), f)
+        if not f.endswith('.py'):
+            f += '.py'
+        f = os.path.normpath(f)
+    return f
 
 
 class RequestHandler(http.server.CGIHTTPRequestHandler):
@@ -35,24 +167,63 @@ class RequestHandler(http.server.CGIHTTPRequestHandler):
         return ret
 
     def log_request(self, code='-', size='-'):
-        log = False
-        if LOG_REQUESTS == 'all':
-            log = True
-        elif LOG_REQUESTS == 'non-200':
-            log = code != 200
-        elif LOG_REQUESTS == 'non-2xx':
-            log = code < 200 or code >= 300
-        elif LOG_REQUESTS == 'none':
-            log = False
-        else:
-            raise RuntimeError('Unknown log setting "%s"' % (LOG_REQUESTS))
-
-        if log:
+        if should_log_request(code):
             super(RequestHandler, self).log_request(code, size)
 
     def send_response(self, code, message=None):
         super(RequestHandler, self).send_response(code, message)
-        self.send_header('Cache-Control', 'no-store')
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        self.send_header('Cache-Control', get_cache_control(path))
+        for name, value in getattr(self, 'static_headers', {}).items():
+            self.send_header(name, value)
+
+    def send_head(self):
+        # Adds conditional requests (through ETag and If-Modified-Since) and
+        # content encoding on top of `SimpleHTTPRequestHandler`. Python <=3.6's
+        # `SimpleHTTPRequestHandler` does not validate If-Modified-Since on
+        # its own, so validation happens here for all regular files.
+        self.static_headers = {}
+        path = self.translate_path(self.path)
+        url_path, _, query = self.path.partition('?')
+        if os.path.isdir(path) and url_path.endswith('/'):
+            index = find_directory_index(path)
+            if index is not None:
+                # Letting `SimpleHTTPRequestHandler` serve the index file
+                # directly.
+                path = index
+                self.path = url_path + os.path.basename(index) + \
+                    ('?' + query if query else '')
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if stat is not None and os.path.stat.S_ISREG(stat.st_mode):
+            encoding, encoded_file_name, data = get_encoded_content(
+                path, stat, self.headers.get('Accept-Encoding'))
+            self.static_headers = get_static_headers(stat, encoding)
+            if is_not_modified(self.headers.get('If-None-Match'),
+                               self.headers.get('If-Modified-Since'),
+                               self.static_headers['ETag'], stat.st_mtime):
+                self.send_response(http.HTTPStatus.NOT_MODIFIED)
+                self.end_headers()
+                return None
+
+            if encoding is not None:
+                if encoded_file_name is not None:
+                    f = open(encoded_file_name, 'rb')
+                    length = os.fstat(f.fileno()).st_size
+                else:
+                    f = io.BytesIO(data)
+                    length = len(data)
+                self.send_response(http.HTTPStatus.OK)
+                self.send_header('Content-Type', self.guess_type(path))
+                self.send_header('Content-Encoding', encoding)
+                self.send_header('Content-Length', str(length))
+                self.send_header('Last-Modified',
+                                 self.date_time_string(stat.st_mtime))
+                self.end_headers()
+                return f
+        return super().send_head()
 
     def run_cgi(self):
         # Shimming in server properties that we seem to be missing on Python
@@ -61,24 +232,12 @@ class RequestHandler(http.server.CGIHTTPRequestHandler):
         # it works, it's good enough for now.
         self.server.server_name = ''
         self.server.server_port = 0
+        self.static_headers = {}
 
         return super().run_cgi()
 
     def translate_path(self, path):
-        f = super().translate_path(path)
-        dir = scanarium.get_frontend_dynamic_dir_abs() + os.sep
-        if f.startswith(dir):
-            f = f[len(dir):]
-            f = os.path.join(scanarium.get_dynamic_directory(), f)
-            f = os.path.normpath(f)
-        dir = scanarium.get_frontend_cgi_bin_dir_abs() + os.sep
-        if f.startswith(dir):
-            f = f[len(dir):]
-            f = os.path.join(scanarium.get_backend_dir_abs(), f)
-            if not f.endswith('.py'):
-                f += '.py'
-            f = os.path.normpath(f)
-        return f
+        return alias_path(super().translate_path(path))
 
 
 class ThreadPoolMixIn(socketserver.ThreadingMixIn):
@@ -93,7 +252,408 @@ class ThreadPoolHTTPServer(ThreadPoolMixIn, http.server.HTTPServer):
     pass
 
 
-def serve_forever(scanarium, port, thread_pool_size):
+class HttpError(Exception):
+    def __init__(self, code):
+        super(HttpError, self).__init__(code)
+        self.code = code
+
+
+# An HTTP/1.1 server on asyncio.
+#
+# Static files get served without blocking through `sendfile`, and support
+# conditional requests. Calls to the cgis that `cgi_pool` serves get
+# dispatched to its worker processes. Other cgis get run as CGI scripts. So
+# neither slow scans nor many parallel page loads block each other.
+class AsyncServer(object):
+    def __init__(self, cgi_pool):
+        super(AsyncServer, self).__init__()
+        self._cgi_pool = cgi_pool
+        self._server_version = SERVER_VERSION_OVERRIDE
+        if self._server_version is None:
+            handler = http.server.BaseHTTPRequestHandler
+            self._server_version = handler.server_version + ' ' + \
+                handler.sys_version
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        client_address = peer[0] if peer else ''
+        try:
+            keep_alive = True
+            while keep_alive:
+                keep_alive = await self.handle_request(
+                    reader, writer, client_address)
+        except (ConnectionError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+
+        request_line = request_line.decode('latin-1').rstrip('\r\n')
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in [b'\r\n', b'\n', b'']:
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        parts = request_line.split(' ')
+        if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+            raise HttpError(http.HTTPStatus.BAD_REQUEST)
+
+        if 'transfer-encoding' in headers:
+            raise HttpError(http.HTTPStatus.LENGTH_REQUIRED)
+        try:
+            content_length = int(headers.get('content-length', '0'))
+        except ValueError:
+            raise HttpError(http.HTTPStatus.BAD_REQUEST)
+        if content_length < 0:
+            raise HttpError(http.HTTPStatus.BAD_REQUEST)
+
+        # The body is left in `reader` for the handlers to read (See
+        # `read_body` and `read_body_chunks`).
+        return {
+            'line': request_line,
+            'method': parts[0],
+            'target': parts[1],
+            'version': parts[2],
+            'headers': headers,
+            'reader': reader,
+            'content_length': content_length,
+            'body_remaining': content_length,
+        }
+
+    async def read_body_chunks(self, request, chunk_size=65536):
+        while request['body_remaining'] > 0:
+            chunk = await request['reader'].read(
+                min(chunk_size, request['body_remaining']))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b'',
+                                                  request['body_remaining'])
+            request['body_remaining'] -= len(chunk)
+            yield chunk
+
+    async def read_body(self, request):
+        body = b''
+        async for chunk in self.read_body_chunks(request):
+            body += chunk
+        return body
+
+    async def handle_request(self, reader, writer, client_address):
+        try:
+            request = await self.read_request(reader)
+        except HttpError as e:
+            request = {
+                'line': '-',
+                'method': 'GET',
+                'version': 'HTTP/1.0',
+                'headers': {},
+            }
+            await self.send_error(writer, request, client_address, e.code)
+            return False
+
+        if request is None:
+            return False
+
+        keep_alive = request['version'] == 'HTTP/1.1' and \
+            request['headers'].get('connection', '').lower() != 'close'
+        request['keep_alive'] = keep_alive
+
+        try:
+            path, _, query = request['target'].partition('?')
+            request['path'] = urllib.parse.unquote(path)
+            request['query'] = query
+            if path.startswith('/cgi-bin/'):
+                await self.handle_cgi(writer, request, client_address)
+            elif request['method'] in ['GET', 'HEAD']:
+                await self.read_body(request)
+                await self.handle_static(writer, request, client_address)
+            else:
+                raise HttpError(http.HTTPStatus.NOT_IMPLEMENTED)
+        except HttpError as e:
+            if request['body_remaining']:
+                # The body has not been read (completely), so the connection
+                # cannot get reused.
+                request['keep_alive'] = False
+            await self.send_error(writer, request, client_address, e.code)
+
+        return request['keep_alive']
+
+    def log_request(self, request, client_address, code, size='-'):
+        if should_log_request(code):
+            sys.stderr.write('%s - - [%s] "%s" %d %s\n' % (
+                client_address,
+                email.utils.formatdate(localtime=True),
+                request['line'], code, size))
+
+    async def send_response(self, writer, request, client_address, code,
+                            headers={}, body=b''):
+        code = http.HTTPStatus(code)
+        lines = [f'HTTP/1.1 {code.value} {code.phrase}']
+        all_headers = {
+            'Server': self._server_version,
+            'Date': email.utils.formatdate(usegmt=True),
+            'Cache-Control': 'no-store',
+            'Content-Length': str(len(body)),
+        }
+        all_headers.update(headers)
+        if not request.get('keep_alive', False):
+            all_headers['Connection'] = 'close'
+        for name, value in all_headers.items():
+            lines.append(f'{name}: {value}')
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        if request['method'] == 'HEAD':
+            body = b''
+        writer.write(head + body)
+        await writer.drain()
+        self.log_request(request, client_address, code.value,
+                         all_headers['Content-Length'])
+
+    async def send_error(self, writer, request, client_address, code):
+        code = http.HTTPStatus(code)
+        body = f'{code.value} {code.phrase}\n'.encode()
+        await self.send_response(writer, request, client_address, code, {
+            'Content-Type': 'text/plain; charset=utf-8',
+        }, body)
+
+    def translate_path(self, path):
+        # Like `http.server.SimpleHTTPRequestHandler.translate_path`, but
+        # relative to the frontend directory.
+        trailing_slash = path.endswith('/')
+        ret = scanarium.get_frontend_dir_abs()
+        for word in posixpath.normpath(path).split('/'):
+            if word and not os.path.dirname(word) \
+                    and word not in [os.curdir, os.pardir]:
+                ret = os.path.join(ret, word)
+        if trailing_slash:
+            ret += '/'
+        return alias_path(ret)
+
+    async def handle_static(self, writer, request, client_address):
+        file_name = self.translate_path(request['path'])
+        if os.path.isdir(file_name):
+            if not request['path'].endswith('/'):
+                location = request['path'] + '/'
+                if request['query']:
+                    location += '?' + request['query']
+                await self.send_response(
+                    writer, request, client_address,
+                    http.HTTPStatus.MOVED_PERMANENTLY,
+                    {'Location': urllib.parse.quote(location, safe='/?=&')})
+                return
+            file_name = find_directory_index(file_name)
+            if file_name is None:
+                raise HttpError(http.HTTPStatus.NOT_FOUND)
+
+        try:
+            file = open(file_name, 'rb')
+        except OSError:
+            raise HttpError(http.HTTPStatus.NOT_FOUND)
+
+        with file:
+            stat = os.fstat(file.fileno())
+            if not os.path.stat.S_ISREG(stat.st_mode):
+                raise HttpError(http.HTTPStatus.NOT_FOUND)
+
+            # Reading and compressing files would block the event loop. So
+            # that happens in the default executor.
+            loop = asyncio.get_event_loop()
+            encoding, encoded_file_name, data = await loop.run_in_executor(
+                None, get_encoded_content, file_name, stat,
+                request['headers'].get('accept-encoding'))
+            headers = get_static_headers(stat, encoding)
+            headers.update({
+                'Cache-Control': get_cache_control(request['path']),
+                'Last-Modified': email.utils.formatdate(stat.st_mtime,
+                                                        usegmt=True),
+            })
+
+            if is_not_modified(request['headers'].get('if-none-match'),
+                               request['headers'].get('if-modified-since'),
+                               headers['ETag'], stat.st_mtime):
+                headers['Content-Length'] = '0'
+                await self.send_response(writer, request, client_address,
+                                         http.HTTPStatus.NOT_MODIFIED,
+                                         headers)
+                return
+
+            content_type = mimetypes.guess_type(file_name)[0] or \
+                'application/octet-stream'
+            headers['Content-Type'] = content_type
+            if encoding is not None:
+                headers['Content-Encoding'] = encoding
+
+            if data is not None:
+                await self.send_response(writer, request, client_address,
+                                         http.HTTPStatus.OK, headers, data)
+            elif encoded_file_name is not None:
+                with open(encoded_file_name, 'rb') as encoded_file:
+                    await self.send_file(writer, request, client_address,
+                                         headers, encoded_file)
+            else:
+                await self.send_file(writer, request, client_address,
+                                     headers, file)
+
+    async def send_file(self, writer, request, client_address, headers,
+                        file):
+        headers['Content-Length'] = str(os.fstat(file.fileno()).st_size)
+        await self.send_response(writer, request, client_address,
+                                 http.HTTPStatus.OK, headers)
+        if request['method'] != 'HEAD':
+            loop = asyncio.get_event_loop()
+            if hasattr(loop, 'sendfile'):
+                await loop.sendfile(writer.transport, file)
+            else:
+                # Python <=3.6 does not have `loop.sendfile`, so we copy the
+                # file in chunks.
+                while True:
+                    chunk = file.read(65536)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+
+    async def parse_fields(self, request, upload_dir, cgi):
+        # Returns the request's form fields as dict from name to value, or to
+        # the list of values for fields that occur more than once. Uploaded
+        # files get streamed to `upload_dir` and are `UploadedFile`s, all
+        # other values are `str`. Like `cgi.FieldStorage`, fields from the
+        # body come before fields from the query.
+        content_type = ''
+        if request['method'] == 'POST':
+            content_type = request['headers'].get('content-type', '')
+        try:
+            parser = FormParser(content_type, request['content_length'],
+                                scanarium.get_max_upload_size(cgi),
+                                upload_dir)
+            if request['method'] == 'POST':
+                # Feeding writes uploaded files to disk, which would block
+                # the event loop. So feeding happens in the default executor.
+                loop = asyncio.get_event_loop()
+                async for chunk in self.read_body_chunks(request):
+                    await loop.run_in_executor(None, parser.feed, chunk)
+            else:
+                await self.read_body(request)
+            parser.close()
+        except ScanariumError as e:
+            if e.code == 'SE_UPLOAD_TOO_LARGE':
+                raise HttpError(http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            raise HttpError(http.HTTPStatus.BAD_REQUEST)
+        parser.add_query(request['query'])
+        return parser.get_fields()
+
+    async def handle_cgi(self, writer, request, client_address):
+        cgi = request['path'][len('/cgi-bin/'):]
+        if cgi.endswith('.py'):
+            cgi = cgi[:-3]
+        if request['method'] not in ['GET', 'HEAD', 'POST']:
+            raise HttpError(http.HTTPStatus.NOT_IMPLEMENTED)
+
+        try:
+            if self._cgi_pool is not None and self._cgi_pool.serves(cgi):
+                await self.handle_cgi_in_process(writer, request,
+                                                 client_address, cgi)
+            else:
+                await self.handle_cgi_script(writer, request, client_address)
+        except (HttpError, ConnectionError, asyncio.IncompleteReadError,
+                asyncio.CancelledError):
+            raise
+        except Exception:
+            # Without a response, clients would wait for the connection to
+            # time out. So unexpected failures get answered with an error.
+            logger.exception(f'Failed to handle cgi "{cgi}"')
+            raise HttpError(http.HTTPStatus.INTERNAL_SERVER_ERROR)
+
+    async def handle_cgi_in_process(self, writer, request, client_address,
+                                    cgi):
+        upload_dir = tempfile.mkdtemp(prefix='scanarium-upload-')
+        try:
+            fields = await self.parse_fields(request, upload_dir, cgi)
+            result = await asyncio.wrap_future(
+                self._cgi_pool.submit(cgi, fields))
+        except concurrent.futures.process.BrokenProcessPool:
+            self._cgi_pool.restart()
+            raise HttpError(http.HTTPStatus.INTERNAL_SERVER_ERROR)
+        finally:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+
+        await self.send_response(writer, request, client_address,
+                                 http.HTTPStatus.OK, {
+                                     'Content-Type': 'application/json',
+                                 }, (result + '\n').encode())
+
+    async def handle_cgi_script(self, writer, request, client_address):
+        script = self.translate_path(request['path'])
+        if not script.startswith(scanarium.get_backend_dir_abs() + os.sep) \
+                or not os.path.isfile(script):
+            raise HttpError(http.HTTPStatus.NOT_FOUND)
+
+        headers = request['headers']
+        env = dict(os.environ)
+        env.update({
+            'GATEWAY_INTERFACE': 'CGI/1.1',
+            'SERVER_SOFTWARE': self._server_version,
+            'SERVER_PROTOCOL': request['version'],
+            'REQUEST_METHOD': request['method'],
+            'SCRIPT_NAME': request['path'],
+            'QUERY_STRING': request['query'],
+            'REMOTE_ADDR': client_address,
+            'CONTENT_TYPE': headers.get('content-type', ''),
+            'CONTENT_LENGTH': str(request['content_length']),
+        })
+        body = await self.read_body(request)
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, script, stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE, env=env)
+        try:
+            output, _ = await asyncio.wait_for(process.communicate(body),
+                                               CGI_SCRIPT_TIMEOUT)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            logger.error(f'Killed cgi script "{script}" after '
+                         f'{CGI_SCRIPT_TIMEOUT} seconds')
+            raise HttpError(http.HTTPStatus.GATEWAY_TIMEOUT)
+
+        code = http.HTTPStatus.OK
+        response_headers = {}
+        head, separator, body = output.partition(b'\n\n')
+        if not separator:
+            raise HttpError(http.HTTPStatus.INTERNAL_SERVER_ERROR)
+        for line in head.decode('latin-1').split('\n'):
+            name, _, value = line.rstrip('\r').partition(':')
+            if name.lower() == 'status':
+                code = int(value.split()[0])
+            elif name:
+                response_headers[name.strip()] = value.strip()
+
+        await self.send_response(writer, request, client_address, code,
+                                 response_headers, body)
+
+
+def print_banner(port):
+    print('-------------------------------------------------------------')
+    print()
+    print('Scanarium demo server listening on port', port)
+    print()
+    print('To use Scanarium, yoint your browser to the following URL:')
+    print()
+    print('  http://localhost:%d/' % (port))
+    print()
+    print('Note that this demo server is not secure. Please consider')
+    print('to instead run it on a proper webserver like Apache HTTPD.')
+    print()
+    print('-------------------------------------------------------------')
+    print()
+    sys.stdout.flush()
+
+
+def serve_forever_threaded(scanarium, port, thread_pool_size):
     # Python <=3.6 does not allow to configure the directory to serve from,
     # but unconditionally servers from the current directory. As Linux Mint
     # Tricia is still on Python 3.6 and we do not want to exclude such users,
@@ -103,24 +663,48 @@ def serve_forever(scanarium, port, thread_pool_size):
     with ThreadPoolHTTPServer(('', port), RequestHandler) as httpd:
         httpd.init_thread_pool(thread_pool_size)
 
-        print('-------------------------------------------------------------')
-        print()
-        print('Scanarium demo server listening on port', port)
-        print()
-        print('To use Scanarium, yoint your browser to the following URL:')
-        print()
-        print('  http://localhost:%d/' % (port))
-        print()
-        print('Note that this demo server is not secure. Please consider')
-        print('to instead run it on a proper webserver like Apache HTTPD.')
-        print()
-        print('-------------------------------------------------------------')
-        print()
-        sys.stdout.flush()
+        print_banner(port)
 
         httpd.serve_forever()
 
 
+async def serve_forever_async_loop(port, cgi_pool):
+    server = AsyncServer(cgi_pool)
+    async_server = await asyncio.start_server(server.handle_connection,
+                                              port=port)
+    try:
+        print_banner(port)
+
+        # Python <=3.6 does not have `Server.serve_forever`, but the server
+        # serves right after starting. So we wait for a future that never
+        # completes.
+        await asyncio.get_event_loop().create_future()
+    finally:
+        async_server.close()
+        await async_server.wait_closed()
+
+
+def serve_forever_async(scanarium, port, in_process_cgis, cgi_pool_size):
+    cgi_pool = None
+    if in_process_cgis:
+        # Creating the pool before the event loop, so worker processes do
+        # not inherit the loop's state.
+        cgi_pool = CgiWorkerPool(scanarium, in_process_cgis, cgi_pool_size)
+        scanarium.register_for_cleanup(cgi_pool.shutdown)
+
+    # `asyncio.run` would be simpler, but needs Python >=3.7.
+    asyncio.get_event_loop().run_until_complete(
+        serve_forever_async_loop(port, cgi_pool))
+
+
+def serve_forever(scanarium, port, mode, thread_pool_size, in_process_cgis,
+                  cgi_pool_size):
+    if mode == 'asyncio':
+        serve_forever_async(scanarium, port, in_process_cgis, cgi_pool_size)
+    else:
+        serve_forever_threaded(scanarium, port, thread_pool_size)
+
+
 def register_arguments(scanarium, parser):
     def get_conf(key, kind='string', allow_empty=False):
         return scanarium.get_config('service:demo-server', key, kind=kind,
@@ -142,9 +726,25 @@ def register_arguments(scanarium, parser):
                         help='Override for response\'s `Server` header field',
                         default=get_conf('server_version_override',
                                          allow_empty=True))
+    parser.add_argument('--mode',
+                        help='How to serve requests. `threaded` serves from a '
+                        'pool of threads and runs cgis as scripts. `asyncio` '
+                        'serves from an event loop and serves the in-process '
+                        'cgis from a pool of worker processes.',
+                        choices=['threaded', 'asyncio'],
+                        default=get_conf('mode'))
     parser.add_argument('--thread-pool-size', metavar='THREADS', type=int,
-                        help='Number of threads to serve requests from',
+                        help='Number of threads to serve requests from in '
+                        '`threaded` mode',
                         default=get_conf('thread_pool_size', kind='int'))
+    parser.add_argument('--in-process-cgis', metavar='CGIS',
+                        help='Comma separated list of cgis to serve from '
+                        'worker processes in `asyncio` mode',
+                        default=get_conf('in_process_cgis', allow_empty=True))
+    parser.add_argument('--cgi-pool-size', metavar='PROCESSES', type=int,
+                        help='Number of worker processes for in-process cgis '
+                        'in `asyncio` mode',
+                        default=get_conf('cgi_pool_size', kind='int'))
 
 
 if __name__ == '__main__':
@@ -154,5 +754,36 @@ if __name__ == '__main__':
     SERVER_VERSION_OVERRIDE = args.server_version_override
     LOG_REQUESTS = args.log_requests
 
+    def get_cache_paths_conf(key):
+        value = scanarium.get_config('service:demo-server', key,
+                                     allow_empty=True)
+        return re.compile(value) if value else None
+
+    CACHE_IMMUTABLE_PATHS = get_cache_paths_conf('cache_immutable_paths')
+    CACHE_REVALIDATE_PATHS = get_cache_paths_conf('cache_revalidate_paths')
+    CACHE_CONTROL_STATIC = scanarium.get_config('service:demo-server',
+                                                'cache_control_static')
+    CACHE_IMMUTABLE_MAX_AGE = scanarium.get_config(
+        'service:demo-server', 'cache_immutable_max_age', kind='int')
+    DIRECTORY_INDEX = scanarium.get_config('service:demo-server',
+                                           'directory_index', kind='list')
+
+    if scanarium.get_config('service:demo-server', 'compression',
+                            kind='boolean'):
+        COMPRESSOR = Compressor(scanarium.get_config(
+            'service:demo-server', 'compression_cache_size', kind='int'))
+        COMPRESSION_SUFFIXES = scanarium.get_config(
+            'service:demo-server', 'compression_suffixes', kind='list')
+        COMPRESSION_MAX_SIZE = scanarium.get_config(
+            'service:demo-server', 'compression_max_size', kind='int')
+
+    CGI_SCRIPT_TIMEOUT = scanarium.get_config(
+        'service:demo-server', 'cgi_script_timeout', kind='int')
+
+    in_process_cgis = [cgi.strip()
+                       for cgi in (args.in_process_cgis or '').split(',')
+                       if cgi.strip()]
+
     scanarium.call_guarded(
-        serve_forever, args.port, args.thread_pool_size, check_caller=False)
+        serve_forever, args.port, args.mode, args.thread_pool_size,
+        in_process_cgis, args.cgi_pool_size, check_caller=False)
@@ -0,0 +1,68 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import json
+import os
+import sys
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium.AdaptiveOrder import AdaptiveOrder
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+VARIANTS = [('foo', 1.0), ('foo', 2.0), ('bar', 1.0)]
+
+
+class AdaptiveOrderTest(BasicTestCase):
+    def test_unscored_keep_order(self):
+        order = AdaptiveOrder()
+
+        self.assertEqual(order.order(VARIANTS), VARIANTS)
+
+    def test_success_moves_to_front(self):
+        order = AdaptiveOrder()
+
+        order.record_success(('bar', 1.0), 0.8)
+
+        self.assertEqual(order.order(VARIANTS),
+                         [('bar', 1.0), ('foo', 1.0), ('foo', 2.0)])
+
+    def test_decay(self):
+        order = AdaptiveOrder()
+        for i in range(10):
+            order.record_success(('foo', 2.0), 0.8)
+
+        # A single success does not yet take over ...
+        order.record_success(('bar', 1.0), 0.8)
+        self.assertEqual(order.order(VARIANTS)[0], ('foo', 2.0))
+
+        # ... but repeated successes do.
+        order.record_success(('bar', 1.0), 0.8)
+        order.record_success(('bar', 1.0), 0.8)
+        self.assertEqual(order.order(VARIANTS),
+                         [('bar', 1.0), ('foo', 2.0), ('foo', 1.0)])
+
+    def test_decayed_scores_get_dropped(self):
+        order = AdaptiveOrder()
+        order.record_success(('foo', 2.0), 0.1)
+        for i in range(3):
+            order.record_success(('bar', 1.0), 0.1)
+
+        self.assertEqual([variant for (variant, score) in order.get_state()],
+                         [['bar', 1.0]])
+
+    def test_state(self):
+        order = AdaptiveOrder()
+        order.record_success(('foo', 2.0), 0.8)
+
+        # State survives JSON round trips
+        state = json.loads(json.dumps(order.get_state()))
+        restored = AdaptiveOrder()
+        restored.set_state(state)
+
+        self.assertEqual(restored.order(VARIANTS),
+                         [('foo', 2.0), ('foo', 1.0), ('bar', 1.0)])
@@ -0,0 +1,128 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import sys
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium.BuildCache import BuildCache
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+
+class BuildCacheTest(BasicTestCase):
+    def new_BuildCache(self, dir, name='cache', shared_dir=None):
+        scanarium = self.new_Scanarium(dir)
+        return BuildCache(scanarium, os.path.join(dir, name), shared_dir)
+
+    def build(self, cache, target, sources, extra=None, contents='built'):
+        ret = cache.needs_update(target, sources, extra)
+        if ret:
+            self.setFile(target, contents)
+            cache.mark_updated(target)
+        return ret
+
+    def test_missing_target(self):
+        with self.prepared_environment() as dir:
+            source = os.path.join(dir, 'source.txt')
+            target = os.path.join(dir, 'target.txt')
+            self.setFile(source, 'foo')
+            cache = self.new_BuildCache(dir)
+
+            self.assertTrue(self.build(cache, target, [source]))
+            self.assertFalse(self.build(cache, target, [source]))
+
+            os.remove(target)
+            self.assertTrue(self.build(cache, target, [source]))
+
+    def test_touched_source(self):
+        with self.prepared_environment() as dir:
+            source = os.path.join(dir, 'source.txt')
+            target = os.path.join(dir, 'target.txt')
+            self.setFile(source, 'foo')
+            cache = self.new_BuildCache(dir)
+            self.assertTrue(self.build(cache, target, [source]))
+
+            self.setFile(source, 'foo', mtime=os.stat(target).st_mtime + 10)
+
+            self.assertFalse(self.build(cache, target, [source]))
+
+    def test_changed_source(self):
+        with self.prepared_environment() as dir:
+            source = os.path.join(dir, 'source.txt')
+            target = os.path.join(dir, 'target.txt')
+            self.setFile(source, 'foo')
+            cache = self.new_BuildCache(dir)
+            self.assertTrue(self.build(cache, target, [source]))
+
+            self.setFile(source, 'bar', mtime=os.stat(target).st_mtime - 10)
+
+            self.assertTrue(self.build(cache, target, [source]))
+            self.assertFalse(self.build(cache, target, [source]))
+
+    def test_changed_extra(self):
+        with self.prepared_environment() as dir:
+            source = os.path.join(dir, 'source.txt')
+            target = os.path.join(dir, 'target.txt')
+            self.setFile(source, 'foo')
+            cache = self.new_BuildCache(dir)
+            self.assertTrue(self.build(cache, target, [source], {'dpi': 1}))
+
+            self.assertTrue(self.build(cache, target, [source], {'dpi': 2}))
+            self.assertFalse(self.build(cache, target, [source], {'dpi': 2}))
+
+    def test_force(self):
+        with self.prepared_environment() as dir:
+            source = os.path.join(dir, 'source.txt')
+            target = os.path.join(dir, 'target.txt')
+            self.setFile(source, 'foo')
+            cache = self.new_BuildCache(dir)
+            self.assertTrue(self.build(cache, target, [source]))
+
+            self.assertTrue(cache.needs_update(target, [source], force=True))
+
+    def test_adopt_target_built_without_cache(self):
+        with self.prepared_environment() as dir:
+            source = os.path.join(dir, 'source.txt')
+            target = os.path.join(dir, 'target.txt')
+            self.setFile(source, 'foo', mtime=100)
+            self.setFile(target, 'built', mtime=200)
+            cache = self.new_BuildCache(dir)
+
+            self.assertFalse(self.build(cache, target, [source]))
+
+            # Once adopted, the target's input hash gets used
+            self.setFile(source, 'foo', mtime=300)
+            self.assertFalse(self.build(cache, target, [source]))
+
+    def test_shared(self):
+        with self.prepared_environment() as dir:
+            shared_dir = os.path.join(dir, 'shared')
+            source = os.path.join(dir, 'source.txt')
+            target_a = os.path.join(dir, 'a', 'target.txt')
+            target_b = os.path.join(dir, 'b', 'target.txt')
+            self.setFile(source, 'foo')
+            cache_a = self.new_BuildCache(dir, 'cache-a', shared_dir)
+            cache_b = self.new_BuildCache(dir, 'cache-b', shared_dir)
+
+            self.assertTrue(self.build(cache_a, target_a, [source],
+                                       contents='built-a'))
+            self.assertFalse(self.build(cache_b, target_b, [source],
+                                        contents='built-b'))
+
+            self.assertFileContents(target_b, 'built-a')
+
+    def test_get_tool_version_arguments(self):
+        test_config = {'programs': {
+            'exiftool': 'echo',
+            'pdfunite': 'echo',
+        }}
+        with self.prepared_environment(test_config=test_config) as dir:
+            cache = self.new_BuildCache(dir)
+
+            self.assertEqual(cache.get_tool_version('exiftool'), '-ver')
+            self.assertEqual(cache.get_tool_version('pdfunite'), '-v')
@@ -0,0 +1,70 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import json
+import os
+import sys
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium.CgiWorkerPool import CgiWorkerPool
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+
+class CgiWorkerPoolTest(BasicTestCase):
+    def new_CgiWorkerPool(self, dir, cgis):
+        scanarium = self.new_Scanarium(dir)
+        pool = CgiWorkerPool(scanarium, cgis, 1)
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    def call(self, pool, cgi, fields={}):
+        return json.loads(pool.submit(cgi, fields).result())
+
+    def test_unsupported_cgi(self):
+        with self.prepared_environment() as dir:
+            with self.assertRaisesScanariumError('SE_CGI_NOT_IN_PROCESS'):
+                self.new_CgiWorkerPool(dir, ['reset-dynamic-content'])
+
+    def test_serves(self):
+        with self.prepared_environment() as dir:
+            pool = self.new_CgiWorkerPool(dir, ['reindex'])
+
+            self.assertTrue(pool.serves('reindex'))
+            self.assertFalse(pool.serves('scan-data'))
+
+    def test_forbidden(self):
+        test_config = {'cgi:reindex': {'allow': 'False'}}
+        with self.prepared_environment(test_config=test_config) as dir:
+            pool = self.new_CgiWorkerPool(dir, ['reindex'])
+
+            result = self.call(pool, 'reindex')
+
+            self.assertFalse(result['is_ok'])
+            self.assertEqual(result['error_code'], 'SE_CGI_FORBIDDEN')
+
+    def test_reindex(self):
+        test_config = {'cgi:reindex': {'allow': 'True'}}
+        with self.prepared_environment(test_config=test_config) as dir:
+            self.setFile([dir, 'dynamic', 'scenes', 'space', 'actors', 'foo',
+                          'bar.png'], mtime=100)
+            pool = self.new_CgiWorkerPool(dir, ['reindex'])
+
+            result = self.call(pool, 'reindex')
+            self.assertTrue(result['is_ok'])
+            self.assertFileJsonContents([dir, 'dynamic', 'scenes', 'space',
+                                         'actors.json'],
+                                        {'actors': {'foo': ['bar']}})
+
+            # Workers serve more than one call
+            self.setFile([dir, 'dynamic', 'scenes', 'space', 'actors', 'foo',
+                          'baz.png'], mtime=200)
+            result = self.call(pool, 'reindex')
+            self.assertTrue(result['is_ok'])
+            self.assertFileJsonContents([dir, 'dynamic', 'scenes', 'space',
+                                         'actors.json'],
+                                        {'actors': {'foo': ['baz', 'bar']}})
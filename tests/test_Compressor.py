@@ -0,0 +1,90 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import gzip
+import os
+import sys
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium.Compressor import Compressor
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+
+class CompressorTest(BasicTestCase):
+    def test_negotiate_encoding_none(self):
+        compressor = Compressor()
+
+        self.assertIsNone(compressor.negotiate_encoding(None))
+        self.assertIsNone(compressor.negotiate_encoding(''))
+        self.assertIsNone(compressor.negotiate_encoding('identity'))
+
+    def test_negotiate_encoding_gzip(self):
+        compressor = Compressor()
+
+        self.assertEqual(compressor.negotiate_encoding('gzip'), 'gzip')
+        self.assertEqual(compressor.negotiate_encoding('deflate, GZIP;q=0.5'),
+                         'gzip')
+        self.assertIsNone(compressor.negotiate_encoding('gzip;q=0'))
+        self.assertIsNone(compressor.negotiate_encoding('*;q=0'))
+
+    def test_negotiate_encoding_preference(self):
+        compressor = Compressor()
+        preferred = compressor.get_encodings()[0]
+
+        self.assertEqual(compressor.negotiate_encoding('gzip, deflate, br'),
+                         preferred)
+        self.assertEqual(compressor.negotiate_encoding('*'), preferred)
+        self.assertEqual(compressor.negotiate_encoding('gzip, br;q=0.5'),
+                         'gzip')
+
+    def test_precompress_file(self):
+        with self.prepared_environment() as dir:
+            file = os.path.join(dir, 'foo.js')
+            self.setFile(file, 'foo' * 100)
+            compressor = Compressor()
+
+            compressor.precompress_file(file, 'gzip')
+
+            target = os.path.join(dir, 'foo.js.gz')
+            with open(target, 'rb') as f:
+                self.assertEqual(gzip.decompress(f.read()), b'foo' * 100)
+
+    def test_find_precompressed_file(self):
+        with self.prepared_environment() as dir:
+            file = os.path.join(dir, 'foo.js')
+            target = os.path.join(dir, 'foo.js.gz')
+            self.setFile(file, 'foo', mtime=100)
+            compressor = Compressor()
+
+            self.assertIsNone(
+                compressor.find_precompressed_file(file, 'gzip', 100))
+
+            self.setFile(target, 'bar', mtime=200)
+            self.assertEqual(
+                compressor.find_precompressed_file(file, 'gzip', 100), target)
+            self.assertIsNone(
+                compressor.find_precompressed_file(file, 'gzip', 300))
+
+    def test_compress_cached(self):
+        compressor = Compressor(1000)
+
+        first = compressor.compress_cached('foo', b'foo' * 100, 'gzip')
+        self.assertEqual(gzip.decompress(first), b'foo' * 100)
+
+        # Same key gives cached data, even if data differs
+        second = compressor.compress_cached('foo', b'bar' * 100, 'gzip')
+        self.assertIs(second, first)
+
+    def test_compress_cached_eviction(self):
+        compressor = Compressor(100)
+
+        first = compressor.compress_cached('foo', os.urandom(60), 'gzip')
+        compressor.compress_cached('bar', os.urandom(60), 'gzip')
+
+        self.assertIsNot(
+            compressor.compress_cached('foo', os.urandom(60), 'gzip'), first)
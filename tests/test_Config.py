@@ -0,0 +1,179 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import json
+import os
+import sys
+import tempfile
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium import Config
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+DEFAULTS = '''
+[debug]
+enable_debug_config_override_command_line_argument = True
+
+[foo]
+string = bar
+empty =
+boolean = yes
+int = 42
+float = 2.5
+list = quux, ,quuux ,
+'''
+
+
+class ConfigTest(BasicTestCase):
+    def setUp(self):
+        self.argv = sys.argv
+        sys.argv = ['']
+
+    def tearDown(self):
+        sys.argv = self.argv
+
+    def new_Config(self, dir, defaults=DEFAULTS, config=None):
+        self.setFile([dir, 'scanarium.conf.defaults'], defaults)
+        if config is not None:
+            self.setFile([dir, 'scanarium.conf'], config)
+        return Config(dir)
+
+    def test_get_kinds(self):
+        with tempfile.TemporaryDirectory(prefix='scanarium-test-') as dir:
+            config = self.new_Config(dir)
+
+            self.assertEqual(config.get('foo', 'string'), 'bar')
+            self.assertEqual(config.get('foo', 'boolean', 'boolean'), True)
+            self.assertEqual(config.get('foo', 'int', 'int'), 42)
+            self.assertEqual(config.get('foo', 'float', 'float'), 2.5)
+            self.assertEqual(config.get('foo', 'list', 'list'),
+                             ('quux', 'quuux'))
+            self.assertEqual(config.get('foo', 'string', 'list'), ('bar',))
+
+            with self.assertRaises(ValueError):
+                config.get('foo', 'string', 'boolean')
+            with self.assertRaises(ValueError):
+                config.get('foo', 'string', 'int')
+
+    def test_get_empty(self):
+        with tempfile.TemporaryDirectory(prefix='scanarium-test-') as dir:
+            config = self.new_Config(dir)
+
+            with self.assertRaisesScanariumError('SE_CONFIG_EMPTY'):
+                config.get('foo', 'empty', 'int')
+            self.assertEqual(config.get('foo', 'empty', 'int',
+                                        allow_empty=True, default=7), 7)
+
+    def test_get_missing(self):
+        with tempfile.TemporaryDirectory(prefix='scanarium-test-') as dir:
+            config = self.new_Config(dir)
+
+            with self.assertRaisesScanariumError('SE_CONFIG_MISSING'):
+                config.get('foo', 'missing')
+            with self.assertRaisesScanariumError('SE_CONFIG_MISSING'):
+                config.get('missing', 'missing')
+            self.assertEqual(config.get('foo', 'missing', 'boolean',
+                                        allow_missing=True, default=True),
+                             True)
+
+    def test_set(self):
+        with tempfile.TemporaryDirectory(prefix='scanarium-test-') as dir:
+            config = self.new_Config(dir)
+            self.assertEqual(config.get('foo', 'int', 'int'), 42)
+
+            config.set('foo', 'int', '43')
+
+            self.assertEqual(config.get('foo', 'int', 'int'), 43)
+
+    def test_config_overrides_defaults(self):
+        with tempfile.TemporaryDirectory(prefix='scanarium-test-') as dir:
+            config = self.new_Config(dir, config='[foo]\nint = 43\n')
+
+            self.assertEqual(config.get('foo', 'int', 'int'), 43)
+            self.assertEqual(config.get('foo', 'string'), 'bar')
+
+    def test_dump_string(self):
+        with tempfile.TemporaryDirectory(prefix='scanarium-test-') as dir:
+            config = self.new_Config(dir)
+            config.set('foo', 'string', 'baz')
+
+            dumped = Config(None, config.dump_string())
+
+            self.assertEqual(dumped.get('foo', 'string'), 'baz')
+            self.assertEqual(dumped.get('foo', 'int', 'int'), 42)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory(prefix='scanarium-test-') as dir:
+            self.new_Config(dir)
+            cache_file = os.path.join(dir, 'scanarium.conf.cache')
+            self.assertRegularFileExists(cache_file)
+
+            # Unchanged config files get read from the cache
+            with open(cache_file, 'r') as f:
+                cache = json.load(f)
+            cache['snapshot']['foo']['string'] = 'cached'
+            with open(cache_file, 'w') as f:
+                json.dump(cache, f)
+            self.assertEqual(Config(dir).get('foo', 'string'), 'cached')
+
+            # Changed config files invalidate the cache
+            config = self.new_Config(dir, config='[foo]\nint = 43\n')
+            self.assertEqual(config.get('foo', 'string'), 'bar')
+            self.assertEqual(config.get('foo', 'int', 'int'), 43)
+
+    def test_cache_override(self):
+        with tempfile.TemporaryDirectory(prefix='scanarium-test-') as dir:
+            override_file = os.path.join(dir, 'override.conf')
+            self.setFile(override_file, '[foo]\nint = 43\n')
+            self.setFile([dir, 'scanarium.conf.defaults'], DEFAULTS)
+
+            # Once for filling the cache, once for reading from it
+            for i in range(2):
+                sys.argv = ['', '--debug-config-override', override_file,
+                            'baz']
+                config = Config(dir)
+
+                self.assertEqual(config.get('foo', 'int', 'int'), 43)
+                self.assertEqual(sys.argv, ['', 'baz'])
+
+            sys.argv = ['']
+            config = Config(dir)
+            self.assertEqual(config.get('foo', 'int', 'int'), 42)
+
+    def test_cache_override_forbidden(self):
+        with tempfile.TemporaryDirectory(prefix='scanarium-test-') as dir:
+            override_file = os.path.join(dir, 'override.conf')
+            self.setFile(override_file, '[foo]\nint = 43\n')
+            defaults = DEFAULTS.replace('= True', '= False')
+            self.new_Config(dir, defaults=defaults)
+
+            sys.argv = ['', '--debug-config-override', override_file]
+            with self.assertRaisesScanariumError(
+                    'SE_CONFIG_USED_BUT_FORBIDDEN'):
+                Config(dir)
+
+    def test_cache_override_missing_file(self):
+        with tempfile.TemporaryDirectory(prefix='scanarium-test-') as dir:
+            self.new_Config(dir)
+
+            sys.argv = ['', '--debug-config-override',
+                        os.path.join(dir, 'missing.conf')]
+            with self.assertRaisesScanariumError(
+                    'SE_OVERRIDE_FILE_DOES_NOT_EXIST'):
+                Config(dir)
+
+    def test_unwritable_cache(self):
+        with tempfile.TemporaryDirectory(prefix='scanarium-test-') as dir:
+            os.mkdir(os.path.join(dir, 'scanarium.conf.cache'))
+
+            config = self.new_Config(dir)
+
+            self.assertEqual(config.get('foo', 'string'), 'bar')
+            self.assertEqual(sorted(os.listdir(dir)),
+                             ['scanarium.conf.cache',
+                              'scanarium.conf.defaults'])
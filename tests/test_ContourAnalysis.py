@@ -0,0 +1,107 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium.ContourAnalysis import ContourAnalysis
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+
+class ContourAnalysisTest(BasicTestCase):
+    # A white image with two black rects side by side, a smaller one within
+    # the left one, and a rect too small to be considered.
+    def new_image(self):
+        image = np.full((400, 800), 255, dtype=np.uint8)
+        cv2.rectangle(image, (20, 20), (380, 380), 0, 4)
+        cv2.rectangle(image, (100, 100), (300, 300), 0, 4)
+        cv2.rectangle(image, (420, 60), (760, 340), 0, 4)
+        cv2.rectangle(image, (500, 150), (540, 190), 0, 4)
+        return image
+
+    def assertRectAround(self, points, left, top, right, bottom):
+        self.assertIsNotNone(points)
+        x, y, w, h = cv2.boundingRect(points)
+        self.assertRoughlyEqual(x, left, scale=10, allowed_deviation=1)
+        self.assertRoughlyEqual(y, top, scale=10, allowed_deviation=1)
+        self.assertRoughlyEqual(x + w, right, scale=10, allowed_deviation=1)
+        self.assertRoughlyEqual(y + h, bottom, scale=10, allowed_deviation=1)
+
+    def test_biggest_rect(self):
+        with self.prepared_environment() as dir:
+            scanarium = self.new_Scanarium(dir)
+            analysis = ContourAnalysis(scanarium, self.new_image())
+
+            points = analysis.find_rect_points()
+
+            self.assertRectAround(points, 20, 20, 380, 380)
+
+    def test_smallest_rects_containing_points(self):
+        with self.prepared_environment() as dir:
+            scanarium = self.new_Scanarium(dir)
+            analysis = ContourAnalysis(scanarium, self.new_image())
+
+            # Answering many queries from the same analysis
+            inner = analysis.find_rect_points(
+                decreasingArea=False, required_points=[(200, 200)])
+            outer = analysis.find_rect_points(
+                decreasingArea=False, required_points=[(50, 200)])
+            right = analysis.find_rect_points(
+                decreasingArea=False, required_points=[(520, 170)])
+            inner_again = analysis.find_rect_points(
+                decreasingArea=False, required_points=[(200, 200)])
+
+            self.assertRectAround(inner, 100, 100, 300, 300)
+            self.assertRectAround(outer, 20, 20, 380, 380)
+            # The small rect around the point is too small to count
+            self.assertRectAround(right, 420, 60, 760, 340)
+            self.assertEqual(inner_again.tolist(), inner.tolist())
+
+    def test_no_rect_containing_points(self):
+        with self.prepared_environment() as dir:
+            scanarium = self.new_Scanarium(dir)
+            analysis = ContourAnalysis(scanarium, self.new_image())
+
+            points = analysis.find_rect_points(
+                decreasingArea=False, required_points=[(400, 390)])
+
+            self.assertIsNone(points)
+
+    def test_noisy_image(self):
+        image = self.new_image()
+        # Speckles yield many tiny contours
+        rng = np.random.default_rng(0)
+        for (x, y) in rng.integers(0, 400, size=(2000, 2)):
+            cv2.circle(image, (int(x) * 2, int(y)), 1, 0, -1)
+
+        with self.prepared_environment() as dir:
+            scanarium = self.new_Scanarium(dir)
+            analysis = ContourAnalysis(scanarium, image)
+
+            points = analysis.find_rect_points()
+
+            self.assertRectAround(points, 20, 20, 380, 380)
+
+    def test_bounding_box_prefilter(self):
+        with self.prepared_environment() as dir:
+            scanarium = self.new_Scanarium(dir)
+            analysis = ContourAnalysis(scanarium, self.new_image())
+
+            points = analysis.find_rect_points(
+                decreasingArea=False, required_points=[(600, 100)])
+
+            self.assertRectAround(points, 420, 60, 760, 340)
+            # Contours of the left rects cannot contain the point, so they
+            # did not need approximating.
+            for i in analysis._approximations:
+                x, y, w, h = cv2.boundingRect(analysis._contours[i])
+                self.assertGreater(x, 400)
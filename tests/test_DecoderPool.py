@@ -0,0 +1,150 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium.DecoderPool import DecoderPool
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+# Mimics the decoder helper: "Decodes" each file to a 2x3 image whose pixels
+# hold the page number and their position, and sleeps/exits/fails for the
+# corresponding file names.
+FAKE_HELPER = '''
+import argparse
+import json
+import mmap
+import os
+import sys
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('helper')
+parser.add_argument('--buffer')
+parser.add_argument('--max-pixels', type=int)
+parser.add_argument('--memory-limit', type=int)
+args = parser.parse_args()
+
+with open(args.buffer, 'r+b') as f:
+    buffer = mmap.mmap(f.fileno(), args.max_pixels * 3)
+
+print(json.dumps({'formats': ['fake']}), flush=True)
+for line in sys.stdin:
+    request = json.loads(line)
+    name = os.path.basename(request['file'])
+    if name == 'sleep':
+        time.sleep(10)
+    elif name == 'exit':
+        sys.exit(1)
+    elif name == 'fail':
+        print(json.dumps({'error': 'failed'}), flush=True)
+        continue
+    buffer[:18] = bytes(request['page'] * 20 + i for i in range(18))
+    print(json.dumps({'height': 2, 'width': 3, 'pages': 4}), flush=True)
+'''
+
+
+class DecoderPoolTest(BasicTestCase):
+    def run_pool(self, func, timeout=5, size=1):
+        with tempfile.TemporaryDirectory(prefix='scanarium-test-') as dir:
+            script = os.path.join(dir, 'fake-helper.py')
+            with open(script, 'w') as file:
+                file.write(FAKE_HELPER)
+            pool = DecoderPool([sys.executable, script], size, timeout, 100,
+                               buffer_dir=dir)
+            try:
+                func(pool)
+            finally:
+                pool.close()
+
+    def assertDecoded(self, pool, file, page=0):
+        image, pages = pool.decode(file, 'fake', page=page)
+        self.assertEqual(image.shape, (2, 3, 3))
+        self.assertEqual(image[1][2].tolist(),
+                         [page * 20 + 15, page * 20 + 16, page * 20 + 17])
+        self.assertEqual(pages, 4)
+
+    def test_decode(self):
+        def func(pool):
+            self.assertTrue(pool.supports('fake'))
+            self.assertFalse(pool.supports('pdf'))
+            self.assertDecoded(pool, 'foo')
+            self.assertDecoded(pool, 'foo', page=2)
+
+        self.run_pool(func)
+
+    def test_decode_failed(self):
+        def func(pool):
+            with self.assertRaisesScanariumError('SE_DECODER_FAILED'):
+                pool.decode('fail', 'fake')
+
+            # The helper survives failed decodings
+            self.assertDecoded(pool, 'foo')
+
+        self.run_pool(func)
+
+    def test_timeout(self):
+        def func(pool):
+            pool.supports('fake')  # Starting the helper
+            start = time.time()
+            with self.assertRaisesScanariumError('SE_TIMEOUT'):
+                pool.decode('sleep', 'fake')
+
+            # The hung helper got killed without waiting for it to exit
+            self.assertLess(time.time() - start, 1.5)
+
+            # A fresh helper replaces the killed one
+            self.assertDecoded(pool, 'foo')
+
+        self.run_pool(func, timeout=1)
+
+    def test_helper_exits(self):
+        def func(pool):
+            with self.assertRaisesScanariumError('SE_RETURN_VALUE'):
+                pool.decode('exit', 'fake')
+
+            # A fresh helper replaces the exited one
+            self.assertDecoded(pool, 'foo')
+
+        self.run_pool(func)
+
+    def test_parallel(self):
+        def func(pool):
+            errors = []
+
+            def decode(page):
+                try:
+                    for i in range(5):
+                        self.assertDecoded(pool, 'foo', page=page)
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=decode, args=(page,))
+                       for page in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(errors, [])
+
+        self.run_pool(func, size=2)
+
+    def test_real_helper_unsupported_format(self):
+        with tempfile.TemporaryDirectory(prefix='scanarium-test-') as dir:
+            pool = DecoderPool([sys.executable], 1, 10, 100, buffer_dir=dir)
+            try:
+                self.assertFalse(pool.supports('foo'))
+                with self.assertRaisesScanariumError('SE_DECODER_FAILED'):
+                    pool.decode(os.path.join(dir, 'foo.foo'), 'foo')
+            finally:
+                pool.close()
@@ -0,0 +1,105 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import io
+import os
+import sys
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium import FormParser, UploadedFile
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+MULTIPART_CONTENT_TYPE = 'multipart/form-data; boundary=XyZ'
+FILE_CONTENT = bytes(range(256)) * 100 + b'\r\n--X'
+MULTIPART_BODY = (
+    b'preamble\r\n'
+    b'--XyZ\r\n'
+    b'Content-Disposition: form-data; name="message"\r\n'
+    b'\r\n'
+    b'h\xc3\xa9llo\r\n'
+    b'--XyZ\r\n'
+    b'Content-Disposition: form-data; name="data"; filename="foo.png"\r\n'
+    b'Content-Type: image/png\r\n'
+    b'\r\n' + FILE_CONTENT + b'\r\n'
+    b'--XyZ\r\n'
+    b'Content-Disposition: form-data; name="data"; filename="bar.png"\r\n'
+    b'\r\n'
+    b'\r\n'
+    b'--XyZ--\r\n'
+    b'epilogue')
+
+
+class FormParserTest(BasicTestCase):
+    def parse(self, dir, content_type, body, chunk_size=65536,
+              max_size=1000000, content_length=None, query=''):
+        parser = FormParser(content_type, content_length, max_size, dir)
+        parser.read_from(io.BytesIO(body), chunk_size)
+        parser.add_query(query)
+        return parser
+
+    def test_multipart(self):
+        for chunk_size in [1, 3, 7, 64, 65536]:
+            with self.prepared_environment() as dir:
+                parser = self.parse(dir, MULTIPART_CONTENT_TYPE,
+                                    MULTIPART_BODY, chunk_size=chunk_size,
+                                    content_length=len(MULTIPART_BODY))
+
+                self.assertEqual(parser.getfirst('message'), 'héllo')
+                uploads = parser.getlist('data')
+                self.assertEqual(len(uploads), 2)
+                self.assertIsInstance(uploads[0], UploadedFile)
+                self.assertEqual(uploads[0].filename, 'foo.png')
+                self.assertEqual(uploads[0].read(), FILE_CONTENT)
+                self.assertEqual(os.path.dirname(uploads[0].path), dir)
+                self.assertEqual(uploads[1].filename, 'bar.png')
+                self.assertEqual(uploads[1].read(), b'')
+
+    def test_multipart_and_query(self):
+        with self.prepared_environment() as dir:
+            parser = self.parse(dir, MULTIPART_CONTENT_TYPE, MULTIPART_BODY,
+                                query='message=quux&foo=bar')
+
+            fields = parser.get_fields()
+
+            self.assertEqual(fields['message'], ['héllo', 'quux'])
+            self.assertEqual(fields['foo'], 'bar')
+            self.assertEqual(len(fields['data']), 2)
+
+    def test_urlencoded(self):
+        with self.prepared_environment() as dir:
+            parser = self.parse(dir, 'application/x-www-form-urlencoded',
+                                b'foo=bar&baz=%20', query='foo=quux')
+
+            self.assertEqual(parser.getfirst('foo'), 'bar')
+            self.assertEqual(parser.getlist('foo'), ['bar', 'quux'])
+            self.assertEqual(parser.getfirst('baz'), ' ')
+            self.assertEqual(parser.getfirst('missing', 'default'), 'default')
+            self.assertEqual(parser.getlist('missing'), [])
+
+    def test_too_large_content_length(self):
+        with self.prepared_environment() as dir:
+            with self.assertRaisesScanariumError('SE_UPLOAD_TOO_LARGE'):
+                FormParser(MULTIPART_CONTENT_TYPE, 11, 10, dir)
+
+    def test_too_large_body(self):
+        with self.prepared_environment() as dir:
+            parser = FormParser(MULTIPART_CONTENT_TYPE, None, 10, dir)
+            parser.feed(b'0123456789')
+            with self.assertRaisesScanariumError('SE_UPLOAD_TOO_LARGE'):
+                parser.feed(b'0')
+
+    def test_truncated(self):
+        with self.prepared_environment() as dir:
+            with self.assertRaisesScanariumError('SE_UPLOAD_MALFORMED'):
+                self.parse(dir, MULTIPART_CONTENT_TYPE,
+                           MULTIPART_BODY[:-20])
+
+    def test_missing_boundary(self):
+        with self.prepared_environment() as dir:
+            with self.assertRaisesScanariumError('SE_UPLOAD_MALFORMED'):
+                FormParser('multipart/form-data', None, 10, dir)
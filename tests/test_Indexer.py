@@ -0,0 +1,84 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import sys
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium import Dumper, Indexer
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+
+class IndexerTest(BasicTestCase):
+    def new_Indexer(self, dir):
+        return Indexer(os.path.join(dir, 'dynamic'), Dumper())
+
+    def actors_json(self, dir, scene):
+        return os.path.join(dir, 'dynamic', 'scenes', scene, 'actors.json')
+
+    def test_reindex(self):
+        with self.prepared_environment() as dir:
+            self.setFile([dir, 'dynamic', 'scenes', 'space', 'actors', 'foo',
+                          'bar.png'], mtime=100)
+            self.setFile([dir, 'dynamic', 'scenes', 'space', 'actors', 'foo',
+                          'baz.png'], mtime=200)
+            self.setFile([dir, 'dynamic', 'scenes', 'space', 'actors', 'foo',
+                          'tmp-quux.png'], mtime=300)
+            indexer = self.new_Indexer(dir)
+
+            indexer.reindex_actors_for_scene('space')
+
+            self.assertFileJsonContents(self.actors_json(dir, 'space'),
+                                        {'actors': {'foo': ['baz', 'bar']}})
+
+    def test_deferred_reindex(self):
+        with self.prepared_environment() as dir:
+            self.setFile([dir, 'dynamic', 'scenes', 'space', 'actors', 'foo',
+                          'bar.png'])
+            self.setFile([dir, 'dynamic', 'scenes', 'fairies', 'actors',
+                          'baz', 'quux.png'])
+            indexer = self.new_Indexer(dir)
+
+            self.assertTrue(indexer.defer_reindexing())
+            self.assertFalse(indexer.defer_reindexing())
+            indexer.reindex_actors_for_scene('space')
+            indexer.reindex_actors_for_scene('fairies')
+            indexer.reindex_actors_for_scene('space')
+
+            self.assertPathMissing(self.actors_json(dir, 'space'))
+            self.assertPathMissing(self.actors_json(dir, 'fairies'))
+
+            scenes = indexer.end_deferred_reindexing()
+
+            self.assertEqual(scenes, {'space', 'fairies'})
+            self.assertFileJsonContents(self.actors_json(dir, 'space'),
+                                        {'actors': {'foo': ['bar']}})
+            self.assertFileJsonContents(self.actors_json(dir, 'fairies'),
+                                        {'actors': {'baz': ['quux']}})
+
+            # Deferring ended, so reindexing is immediate again
+            self.setFile([dir, 'dynamic', 'scenes', 'space', 'actors', 'foo',
+                          'quuux.png'])
+            indexer.reindex_actors_for_scene('space')
+            self.assertEqual(
+                sorted(self.get_json_file_contents(
+                    self.actors_json(dir, 'space'))['actors']['foo']),
+                ['bar', 'quuux'])
+
+    def test_deferred_reindex_without_reindexing(self):
+        with self.prepared_environment() as dir:
+            self.setFile([dir, 'dynamic', 'scenes', 'space', 'actors', 'foo',
+                          'bar.png'])
+            indexer = self.new_Indexer(dir)
+
+            indexer.defer_reindexing()
+            indexer.reindex_actors_for_scene('space')
+            scenes = indexer.end_deferred_reindexing(reindex=False)
+
+            self.assertEqual(scenes, {'space'})
+            self.assertPathMissing(self.actors_json(dir, 'space'))
@@ -0,0 +1,96 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import sys
+import tempfile
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium.InkscapeShell import InkscapeShell
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+# Mimics Inkscape 0.92's shell mode: Echoes the arguments of each line, and
+# sleeps/exits for the corresponding commands.
+FAKE_SHELL = '''
+import shlex
+import sys
+import time
+
+sys.stdout.write('Fake interactive shell mode.\\n>')
+sys.stdout.flush()
+for line in sys.stdin:
+    arguments = shlex.split(line)
+    if arguments == ['quit']:
+        break
+    elif arguments == ['sleep']:
+        time.sleep(10)
+    elif arguments == ['exit']:
+        sys.exit(1)
+    sys.stderr.write('stderr:' + str(len(arguments)))
+    sys.stderr.flush()
+    sys.stdout.write(''.join(argument + '\\n' for argument in arguments))
+    sys.stdout.write('>')
+    sys.stdout.flush()
+'''
+
+
+class InkscapeShellTest(BasicTestCase):
+    def run_shell(self, func, timeout=5):
+        with tempfile.TemporaryDirectory(prefix='scanarium-test-') as dir:
+            script = os.path.join(dir, 'fake-inkscape.py')
+            with open(script, 'w') as file:
+                file.write(FAKE_SHELL)
+            shell = InkscapeShell([sys.executable, script], timeout)
+            try:
+                func(shell)
+            finally:
+                shell.close()
+
+    def test_run_single(self):
+        def func(shell):
+            ret = shell.run(['--query-all', 'foo.svg'])
+            self.assertEqual(ret['stdout'], '--query-all\nfoo.svg\n')
+            self.assertEqual(ret['stderr'], 'stderr:2')
+
+        self.run_shell(func)
+
+    def test_run_multiple(self):
+        def func(shell):
+            self.assertEqual(shell.run(['a'])['stdout'], 'a\n')
+            self.assertEqual(shell.run(['b', 'c'])['stdout'], 'b\nc\n')
+            self.assertEqual(shell.run(['d'])['stderr'], 'stderr:1')
+
+        self.run_shell(func)
+
+    def test_run_quoting(self):
+        def func(shell):
+            ret = shell.run(['--export-png=foo bar\'s.png', 'a"b'])
+            self.assertEqual(ret['stdout'],
+                             '--export-png=foo bar\'s.png\na"b\n')
+
+        self.run_shell(func)
+
+    def test_run_timeout(self):
+        def func(shell):
+            with self.assertRaisesScanariumError('SE_TIMEOUT'):
+                shell.run(['sleep'])
+
+            # After a timeout, the shell gets restarted
+            self.assertEqual(shell.run(['a'])['stdout'], 'a\n')
+
+        self.run_shell(func, timeout=1)
+
+    def test_run_exit(self):
+        def func(shell):
+            with self.assertRaisesScanariumError('SE_RETURN_VALUE'):
+                shell.run(['exit'])
+
+            # After the shell died, it gets restarted
+            self.assertEqual(shell.run(['a'])['stdout'], 'a\n')
+
+        self.run_shell(func)
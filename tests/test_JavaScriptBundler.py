@@ -0,0 +1,91 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import sys
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium.JavaScriptBundler import JavaScriptBundler
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+
+class JavaScriptBundlerTest(BasicTestCase):
+    def bundle(self, *sources, header=''):
+        bundler = JavaScriptBundler(header)
+        for i, source in enumerate(sources):
+            bundler.add_source(source, f'file-{i}.js')
+        return bundler
+
+    def assertMinified(self, source, expected):
+        self.assertEqual(self.bundle(source).get_source(), expected + ';\n')
+
+    def test_comments_and_indentation(self):
+        self.assertMinified(
+            '// foo\n'
+            'function foo() {\n'
+            '    /* bar\n'
+            '       baz */\n'
+            '    return 1; // quux\n'
+            '\n'
+            '}\n',
+            'function foo() {\n'
+            'return 1;\n'
+            '}\n')
+
+    def test_strings(self):
+        self.assertMinified(
+            'var a = "// foo";\n'
+            "var b = '/* bar */';\n"
+            "var c = 'it\\'s // ok';\n",
+            'var a = "// foo";\n'
+            "var b = '/* bar */';\n"
+            "var c = 'it\\'s // ok';\n")
+
+    def test_template_literal(self):
+        self.assertMinified(
+            'var a = `foo\n'
+            '    // bar\n'
+            '${ {b: `baz`}.b } quux`; // comment\n',
+            'var a = `foo\n'
+            '    // bar\n'
+            '${ {b: `baz`}.b } quux`;\n')
+
+    def test_regexp(self):
+        self.assertMinified(
+            "a = b.replace(/[/'\"]/g, '.'); // foo\n"
+            'c = d / 2; // bar\n'
+            'return /\\/\\//;\n',
+            "a = b.replace(/[/'\"]/g, '.');\n"
+            'c = d / 2;\n'
+            'return /\\/\\//;\n')
+
+    def test_comment_closing_line_comment(self):
+        self.assertMinified(
+            'a = {\n'
+            '/*  b: 1,\n'
+            '// */\n'
+            '};\n',
+            'a = {\n'
+            '};\n')
+
+    def test_header_and_separators(self):
+        bundler = self.bundle('a()', 'b()', header='// header')
+
+        self.assertEqual(bundler.get_source(), '// header\na()\n;\nb()\n;\n')
+
+    def test_source_map(self):
+        bundler = self.bundle('a();\n  b();\n', '\n\nc();\n',
+                              header='// header')
+
+        source_map = bundler.get_source_map('bundle.js')
+
+        self.assertEqual(source_map['file'], 'bundle.js')
+        self.assertEqual(source_map['sources'], ['file-0.js', 'file-1.js'])
+        # Header line, `a();` at 0:0, `b();` at 1:2, separator, `c();` at 2:0
+        # of the second file, separator.
+        self.assertEqual(source_map['mappings'], ';AAAA;AACE;;ACCF;')
@@ -0,0 +1,103 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import sys
+import threading
+import time
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium import ScanariumError
+from scanarium.JobRunner import JobRunner
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+
+class JobRunnerTest(BasicTestCase):
+    def test_serial_order(self):
+        calls = []
+        runner = JobRunner()
+        runner.add('a', calls.append, 'a')
+        runner.add('b', calls.append, 'b')
+        runner.add('c', calls.append, 'c')
+
+        runner.run()
+
+        self.assertEqual(calls, ['a', 'b', 'c'])
+
+    def test_results(self):
+        runner = JobRunner(4)
+        runner.add('a', lambda x: x + 1, 41)
+        runner.add('b', lambda: runner.get_result('a') * 2,
+                   dependencies=['a'])
+
+        runner.run()
+
+        self.assertEqual(runner.get_result('a'), 42)
+        self.assertEqual(runner.get_result('b'), 84)
+
+    def test_parallel_dependencies(self):
+        lock = threading.Lock()
+        finished = []
+
+        def job(name, duration):
+            time.sleep(duration)
+            with lock:
+                finished.append(name)
+
+        runner = JobRunner(4)
+        runner.add('slow', job, 'slow', 0.2)
+        runner.add('fast', job, 'fast', 0)
+        runner.add('after-slow', job, 'after-slow', 0, dependencies=['slow'])
+
+        runner.run()
+
+        self.assertEqual(finished, ['fast', 'slow', 'after-slow'])
+
+    def test_unknown_dependency(self):
+        runner = JobRunner()
+        with self.assertRaisesScanariumError('SE_JOB_UNKNOWN_DEPENDENCY'):
+            runner.add('a', print, dependencies=['b'])
+
+    def test_duplicate_key(self):
+        runner = JobRunner()
+        runner.add('a', print)
+        with self.assertRaisesScanariumError('SE_JOB_DUPLICATE'):
+            runner.add('a', print)
+
+    def test_parallel_error_is_first_added_failure(self):
+        def fail(code, duration):
+            time.sleep(duration)
+            raise ScanariumError(code, 'failure')
+
+        calls = []
+        runner = JobRunner(4)
+        runner.add('a', fail, 'SE_FIRST', 0.2)
+        runner.add('b', fail, 'SE_SECOND', 0)
+        runner.add('c', calls.append, 'c')
+        runner.add('d', calls.append, 'd', dependencies=['a'])
+
+        with self.assertRaisesScanariumError('SE_FIRST'):
+            runner.run()
+
+        # `c` is independent of the failures, so it still got run. But `d`
+        # depends on a failed job, so it got skipped.
+        self.assertEqual(calls, ['c'])
+
+    def test_serial_error_stops(self):
+        def fail():
+            raise ScanariumError('SE_FAIL', 'failure')
+
+        calls = []
+        runner = JobRunner()
+        runner.add('a', fail)
+        runner.add('b', calls.append, 'b')
+
+        with self.assertRaisesScanariumError('SE_FAIL'):
+            runner.run()
+
+        self.assertEqual(calls, [])
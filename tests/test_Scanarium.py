@@ -54,3 +54,16 @@ class ScanariumTest(BasicTestCase):
     def test_get_versioned_filename(self):
         actual = Scanarium().get_versioned_filename('foo', 'bar', 'baz', 42)
         self.assertEqual(actual, os.path.join('foo', 'bar-d-42.baz'))
+
+    def test_get_max_upload_size(self):
+        test_config = {
+            'cgi': {'max_upload_size': '100'},
+            'cgi:scan-data-batch': {'max_upload_size': '200'},
+            }
+        with self.prepared_environment(test_config=test_config) as dir:
+            scanarium = self.new_Scanarium(dir)
+
+            self.assertEqual(scanarium.get_max_upload_size('scan-data'), 100)
+            self.assertEqual(
+                scanarium.get_max_upload_size('scan-data-batch'), 200)
+            self.assertEqual(scanarium.get_max_upload_size('foo'), 100)
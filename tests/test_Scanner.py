@@ -5,6 +5,8 @@
 import os
 import sys
 
+import numpy as np
+
 SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, SCANARIUM_DIR_ABS)
 from scanarium.Scanner import parse_qr
@@ -130,3 +132,57 @@ class ScannerTest(BasicTestCase):
                     'parameter': 'Bus',
                     'd': '1',
                     })
+
+    def test_debug_show_image_disabled(self):
+        def produce():
+            raise RuntimeError('Image got produced')
+
+        with self.prepared_environment() as dir:
+            scanarium = self.new_Scanarium(dir)
+            scanarium.debug_show_image('Raw image', produce)
+
+    def test_debug_show_image_enabled_by_set_config(self):
+        with self.prepared_environment() as dir:
+            scanarium = self.new_Scanarium(dir)
+            self.assertFalse(scanarium.are_debug_images_enabled())
+            self.assertFalse(scanarium.is_debug_image_shown('Raw image'))
+
+            scanarium.set_config('general', 'debug', 'True')
+            scanarium.set_config('debug', 'image_directory',
+                                 os.path.join(dir, 'debug'))
+            self.assertTrue(scanarium.are_debug_images_enabled())
+            self.assertTrue(scanarium.is_debug_image_shown('Raw image'))
+            # Hidden by default configuration
+            self.assertFalse(scanarium.is_debug_image_shown(
+                'Prepared for detection (contrast: 1.0)'))
+
+            scanarium.debug_show_image(
+                'Raw image', lambda: np.full((2, 3, 3), 255, np.uint8))
+            self.assertLenIs(os.listdir(os.path.join(dir, 'debug')), 1)
+
+            scanarium.set_config('debug', 'hide_images', 'True')
+            self.assertFalse(scanarium.are_debug_images_enabled())
+
+    def test_debug_show_image_directory(self):
+        test_config = {
+            'general': {
+                'debug': 'True',
+                },
+            'debug': {
+                'image_directory': '%TEST_DIR%/debug',
+                },
+            }
+        with self.prepared_environment(test_config=test_config) as dir:
+            scanarium = self.new_Scanarium(dir)
+            image = np.full((2, 3, 3), 255, np.uint8)
+
+            scanarium.debug_show_image('Raw image', lambda: image)
+            # Hidden by default configuration
+            scanarium.debug_show_image(
+                'Prepared for detection (contrast: 1.0)', image)
+
+            files = os.listdir(os.path.join(dir, 'debug'))
+            self.assertLenIs(files, 1)
+            self.assertFullMatch(r'[0-9.]*-raw_image\.png', files[0])
+            written = self.readImage(os.path.join(dir, 'debug', files[0]))
+            self.assertEqual(written.shape, (2, 3, 3))
@@ -0,0 +1,94 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import sys
+
+from .environment import CanaryTestCase
+
+# Modules that lightweight backends must not import.
+FORBIDDEN_MODULES = ['cv2', 'numpy', 'pyzbar']
+
+# Budgets for the cumulative import time (in milliseconds) of lightweight
+# backends. Locally, each of them imports in well below 100 ms. The budgets
+# leave ample slack for slow CI machines, while importing the scanning stack
+# alone would typically exceed them.
+IMPORT_TIME_BUDGETS = {
+    'dump-dynamic-config': 500,
+    'reindex': 500,
+    'report-feedback': 500,
+    'reset-dynamic-content': 500,
+    'update-password': 500,
+}
+
+
+class BackendImportTimeCanaryTestCase(CanaryTestCase):
+    # Runs the backend `cgi` and returns a dict from the names of the
+    # imported modules to their cumulative import times (in microseconds).
+    def run_cgi_importtime(self, dir, cgi, arguments=[],
+                           expected_returncode=0):
+        cgi_file = os.path.join('.', 'backend', f'{cgi}.py')
+        command = [sys.executable, '-X', 'importtime', cgi_file,
+                   '--debug-config-override',
+                   os.path.join(dir, 'override.conf')] + arguments
+
+        stderr = self.run_command(command, expected_returncode)['stderr']
+
+        ret = {}
+        for line in stderr.split('\n'):
+            if line.startswith('import time:'):
+                _, cumulative, module = line.split('|')
+                if cumulative.strip().isdigit():
+                    # Dropping the separating space keeps the indentation
+                    # of nested imports.
+                    ret[module[1:].rstrip()] = int(cumulative)
+        return ret
+
+    def assertCheapImports(self, cgi, arguments=[], expected_returncode=0):
+        with self.prepared_environment() as dir:
+            self.setFile([dir, 'dynamic', 'config.json'], '{}')
+
+            # The first run may have to compile modules, which would count
+            # towards the import time. And as import times are noisy, we
+            # take the quicker of two further runs.
+            self.run_cgi_importtime(dir, cgi, arguments, expected_returncode)
+            runs = [self.run_cgi_importtime(dir, cgi, arguments,
+                                            expected_returncode)
+                    for _ in range(2)]
+
+        imports = runs[0]
+        modules = set(module.strip().split('.')[0] for module in imports)
+        for module in FORBIDDEN_MODULES:
+            self.assertFalse(module in modules, f'{cgi} imported {module}')
+
+        # Nested imports are indented and already accounted for in the
+        # cumulative time of their top-level import.
+        import_time = min(
+            sum(cumulative for module, cumulative in run.items()
+                if not module.startswith(' ')) / 1000
+            for run in runs)
+        budget = IMPORT_TIME_BUDGETS[cgi]
+        self.assertLessEqual(
+            import_time, budget,
+            f'{cgi} took {import_time:.0f} ms to import, but its budget is '
+            f'{budget} ms')
+
+    def test_dump_dynamic_config(self):
+        self.assertCheapImports('dump-dynamic-config',
+                                ['dynamic/config.json'])
+
+    def test_reindex(self):
+        self.assertCheapImports('reindex')
+
+    def test_report_feedback(self):
+        self.assertCheapImports('report-feedback', ['foo'])
+
+    def test_reset_dynamic_content(self):
+        self.assertCheapImports('reset-dynamic-content', ['space'])
+
+    def test_update_password(self):
+        # Without a password backend, updating fails, but only after all
+        # imports happened.
+        self.assertCheapImports('update-password', ['foo', 'bar'],
+                                expected_returncode=1)
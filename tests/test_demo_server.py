@@ -0,0 +1,314 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import asyncio
+import gzip
+import http.client
+import importlib.util
+import json
+import os
+import re
+import threading
+
+from .environment import BasicTestCase
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEMO_SERVER_FILE = os.path.join(SCANARIUM_DIR_ABS, 'services',
+                                'demo-server.py')
+
+
+class DemoServerTest(BasicTestCase):
+    # Loads a fresh copy of the demo server module. If `dir` is not None, the
+    # module uses the configuration of the prepared environment `dir`.
+    def load_demo_server(self, dir=None):
+        spec = importlib.util.spec_from_file_location('demo_server',
+                                                      DEMO_SERVER_FILE)
+        ret = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(ret)
+        if dir is not None:
+            ret.scanarium = self.new_Scanarium(dir)
+        ret.LOG_REQUESTS = 'none'
+        return ret
+
+    # Starts an `AsyncServer` on an ephemeral port in a separate thread.
+    # Returns the port.
+    def start_async_server(self, demo_server, cgi_pool=None):
+        server = demo_server.AsyncServer(cgi_pool)
+        loop = asyncio.new_event_loop()
+        async_server = loop.run_until_complete(asyncio.start_server(
+            server.handle_connection, host='127.0.0.1', port=0))
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+
+        def stop():
+            async def close():
+                async_server.close()
+                await async_server.wait_closed()
+
+            asyncio.run_coroutine_threadsafe(close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+        self.addCleanup(stop)
+        return async_server.sockets[0].getsockname()[1]
+
+    # Starts the threaded server on an ephemeral port in a separate thread.
+    # Returns the port.
+    def start_threaded_server(self, demo_server):
+        # The threaded server serves from the current directory.
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(demo_server.scanarium.get_frontend_dir_abs())
+
+        httpd = demo_server.ThreadPoolHTTPServer(('127.0.0.1', 0),
+                                                 demo_server.RequestHandler)
+        httpd.init_thread_pool(1)
+        thread = threading.Thread(target=httpd.serve_forever)
+        thread.start()
+
+        def stop():
+            httpd.shutdown()
+            thread.join()
+            httpd.server_close()
+            httpd.pool.shutdown()
+
+        self.addCleanup(stop)
+        return httpd.server_address[1]
+
+    def enable_compression(self, demo_server):
+        demo_server.COMPRESSOR = demo_server.Compressor()
+        demo_server.COMPRESSION_SUFFIXES = ('.json',)
+        demo_server.COMPRESSION_MAX_SIZE = 1048576
+
+    def new_connection(self, port):
+        ret = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        self.addCleanup(ret.close)
+        return ret
+
+    def get(self, connection, path, headers={}):
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        return (response, response.read())
+
+    def test_is_not_modified_etag(self):
+        demo_server = self.load_demo_server()
+        is_not_modified = demo_server.is_not_modified
+
+        self.assertTrue(is_not_modified('"foo"', None, '"foo"', 100))
+        self.assertTrue(is_not_modified('"bar", "foo"', None, '"foo"', 100))
+        self.assertFalse(is_not_modified('"bar"', None, '"foo"', 100))
+        self.assertFalse(is_not_modified('"foo-gzip"', None, '"foo"', 100))
+
+    def test_is_not_modified_etag_any(self):
+        demo_server = self.load_demo_server()
+        is_not_modified = demo_server.is_not_modified
+
+        self.assertTrue(is_not_modified('*', None, '"foo"', 100))
+
+    def test_is_not_modified_etag_weak(self):
+        demo_server = self.load_demo_server()
+        is_not_modified = demo_server.is_not_modified
+
+        self.assertTrue(is_not_modified('W/"foo"', None, '"foo"', 100))
+        self.assertTrue(is_not_modified('"bar", W/"foo"', None, '"foo"',
+                                        100))
+        self.assertFalse(is_not_modified('W/"bar"', None, '"foo"', 100))
+
+    def test_is_not_modified_since(self):
+        demo_server = self.load_demo_server()
+        is_not_modified = demo_server.is_not_modified
+        date = 'Thu, 01 Jan 1970 00:01:40 GMT'  # 100 seconds after epoch
+
+        self.assertTrue(is_not_modified(None, date, '"foo"', 100))
+        self.assertTrue(is_not_modified(None, date, '"foo"', 99.5))
+        self.assertTrue(is_not_modified(None, date, '"foo"', 100.5))
+        self.assertFalse(is_not_modified(None, date, '"foo"', 101))
+        self.assertFalse(is_not_modified(None, 'garbage', '"foo"', 100))
+        self.assertFalse(is_not_modified(None, None, '"foo"', 100))
+
+    def test_is_not_modified_etag_precedence(self):
+        demo_server = self.load_demo_server()
+        is_not_modified = demo_server.is_not_modified
+        date = 'Thu, 01 Jan 1970 00:01:40 GMT'  # 100 seconds after epoch
+
+        # If-None-Match wins over If-Modified-Since in both directions
+        self.assertFalse(is_not_modified('"bar"', date, '"foo"', 100))
+        self.assertTrue(is_not_modified('"foo"', date, '"foo"', 200))
+
+    def test_get_cache_control(self):
+        demo_server = self.load_demo_server()
+        demo_server.CACHE_IMMUTABLE_PATHS = re.compile(r'^/bundles/')
+        demo_server.CACHE_REVALIDATE_PATHS = re.compile(r'\.json$')
+        demo_server.CACHE_CONTROL_STATIC = 'max-age=60'
+        demo_server.CACHE_IMMUTABLE_MAX_AGE = 1000
+        get_cache_control = demo_server.get_cache_control
+
+        self.assertEqual(get_cache_control('/cgi-bin/scan-data'),
+                         'no-store')
+        self.assertEqual(get_cache_control('/cgi-bin/foo.json'), 'no-store')
+        self.assertEqual(get_cache_control('/bundles/0123.js'),
+                         'public, max-age=1000, immutable')
+        self.assertEqual(get_cache_control('/bundles/0123.json'),
+                         'public, max-age=1000, immutable')
+        self.assertEqual(get_cache_control('/dynamic/config.json'),
+                         'no-cache')
+        self.assertEqual(get_cache_control('/index.html'), 'max-age=60')
+
+    def test_get_cache_control_unconfigured(self):
+        demo_server = self.load_demo_server()
+
+        self.assertEqual(demo_server.get_cache_control('/bundles/0123.js'),
+                         'no-cache')
+        self.assertEqual(demo_server.get_cache_control('/cgi-bin/reindex'),
+                         'no-store')
+
+    def test_static(self):
+        with self.prepared_environment() as dir:
+            self.setFile([dir, 'dynamic', 'config.json'], '{"foo": "bar"}')
+            demo_server = self.load_demo_server(dir)
+            port = self.start_async_server(demo_server)
+            connection = self.new_connection(port)
+
+            response, body = self.get(connection, '/dynamic/config.json')
+
+            self.assertEqual(response.status, 200)
+            self.assertEqual(body, b'{"foo": "bar"}')
+            self.assertEqual(response.getheader('Content-Type'),
+                             'application/json')
+            self.assertIsNotNone(response.getheader('ETag'))
+
+    def test_keep_alive(self):
+        with self.prepared_environment() as dir:
+            self.setFile([dir, 'dynamic', 'config.json'], '{"foo": "bar"}')
+            self.setFile([dir, 'dynamic', 'other.json'], '{"baz": 42}')
+            demo_server = self.load_demo_server(dir)
+            port = self.start_async_server(demo_server)
+            connection = self.new_connection(port)
+
+            response1, body1 = self.get(connection, '/dynamic/config.json')
+            sock = connection.sock
+            response2, body2 = self.get(connection, '/dynamic/other.json')
+
+            self.assertEqual(response1.status, 200)
+            self.assertEqual(body1, b'{"foo": "bar"}')
+            self.assertEqual(response2.status, 200)
+            self.assertEqual(body2, b'{"baz": 42}')
+            # Both requests went over the same connection
+            self.assertIs(connection.sock, sock)
+
+    def test_not_found(self):
+        with self.prepared_environment() as dir:
+            demo_server = self.load_demo_server(dir)
+            port = self.start_async_server(demo_server)
+            connection = self.new_connection(port)
+
+            response, _ = self.get(connection, '/dynamic/missing.json')
+
+            self.assertEqual(response.status, 404)
+
+    def test_cgi_in_process(self):
+        test_config = {'cgi:dump-dynamic-config': {'allow': 'True'}}
+        with self.prepared_environment(test_config=test_config) as dir:
+            self.setFile([dir, 'dynamic', 'config.json'], '{"foo": "bar"}')
+            demo_server = self.load_demo_server(dir)
+            cgi_pool = demo_server.CgiWorkerPool(
+                demo_server.scanarium, ['dump-dynamic-config'], 1)
+            self.addCleanup(cgi_pool.shutdown)
+            port = self.start_async_server(demo_server, cgi_pool)
+            connection = self.new_connection(port)
+
+            response, body = self.get(
+                connection,
+                '/cgi-bin/dump-dynamic-config?file=dynamic/config.json')
+
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.getheader('Cache-Control'), 'no-store')
+            result = json.loads(body)
+            self.assertTrue(result['is_ok'])
+            self.assertEqual(result['payload'], {'foo': 'bar'})
+
+    def test_cgi_in_process_failure(self):
+        class FailingPool(object):
+            def serves(self, cgi):
+                return True
+
+            def submit(self, cgi, fields):
+                raise ValueError('Failing on purpose')
+
+        with self.prepared_environment() as dir:
+            demo_server = self.load_demo_server(dir)
+            port = self.start_async_server(demo_server, FailingPool())
+            connection = self.new_connection(port)
+
+            with self.assertLogs(demo_server.logger, 'ERROR'):
+                response, _ = self.get(connection,
+                                       '/cgi-bin/dump-dynamic-config')
+
+            self.assertEqual(response.status, 500)
+
+    def test_cgi_script_timeout(self):
+        with self.prepared_environment() as dir:
+            demo_server = self.load_demo_server(dir)
+            demo_server.CGI_SCRIPT_TIMEOUT = 0.001
+            port = self.start_async_server(demo_server)
+            connection = self.new_connection(port)
+
+            with self.assertLogs(demo_server.logger, 'ERROR'):
+                response, _ = self.get(connection, '/cgi-bin/reindex')
+
+            self.assertEqual(response.status, 504)
+
+    def assertCompressedAndConditional(self, start_server):
+        content = '{"foo": "%s"}' % ('bar' * 1000)
+        with self.prepared_environment() as dir:
+            self.setFile([dir, 'dynamic', 'config.json'], content,
+                         mtime=100000)
+            demo_server = self.load_demo_server(dir)
+            self.enable_compression(demo_server)
+            port = start_server(demo_server)
+            connection = self.new_connection(port)
+
+            # Negotiating the encoding
+            response, body = self.get(connection, '/dynamic/config.json', {
+                'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.getheader('Content-Encoding'), 'gzip')
+            self.assertEqual(response.getheader('Vary'), 'Accept-Encoding')
+            self.assertEqual(gzip.decompress(body).decode(), content)
+            etag = response.getheader('ETag')
+            last_modified = response.getheader('Last-Modified')
+
+            response, body = self.get(connection, '/dynamic/config.json')
+            self.assertEqual(response.status, 200)
+            self.assertIsNone(response.getheader('Content-Encoding'))
+            self.assertEqual(body.decode(), content)
+            self.assertNotEqual(response.getheader('ETag'), etag)
+
+            # Conditional requests for the compressed response
+            response, body = self.get(connection, '/dynamic/config.json', {
+                'Accept-Encoding': 'gzip',
+                'If-None-Match': etag})
+            self.assertEqual(response.status, 304)
+            self.assertEqual(body, b'')
+
+            response, body = self.get(connection, '/dynamic/config.json', {
+                'Accept-Encoding': 'gzip',
+                'If-Modified-Since': last_modified})
+            self.assertEqual(response.status, 304)
+            self.assertEqual(body, b'')
+
+            # Modified file
+            self.setFile([dir, 'dynamic', 'config.json'], content,
+                         mtime=200000)
+            response, body = self.get(connection, '/dynamic/config.json', {
+                'Accept-Encoding': 'gzip',
+                'If-Modified-Since': last_modified})
+            self.assertEqual(response.status, 200)
+            self.assertEqual(gzip.decompress(body).decode(), content)
+
+    def test_compressed_and_conditional_async(self):
+        self.assertCompressedAndConditional(self.start_async_server)
+
+    def test_compressed_and_conditional_threaded(self):
+        self.assertCompressedAndConditional(self.start_threaded_server)
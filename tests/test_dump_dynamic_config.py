@@ -0,0 +1,51 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import json
+
+from .environment import CanaryTestCase
+
+
+class DumpDynamicConfigCanaryTestCase(CanaryTestCase):
+    def run_dump_dynamic_config(self, dir, file, version=None):
+        arguments = [file]
+        if version is not None:
+            arguments.append(version)
+
+        ret = self.run_cgi(dir, 'dump-dynamic-config', arguments)
+        return json.loads(ret['stdout'])
+
+    def test_ok(self):
+        with self.prepared_environment() as dir:
+            self.setFile([dir, 'dynamic', 'config.json'], '{"foo": "bar"}',
+                         mtime=100)
+
+            payload = self.run_dump_dynamic_config(dir, 'dynamic/config.json')
+
+            self.assertEqual(payload, {'foo': 'bar'})
+
+    def test_conditional(self):
+        with self.prepared_environment() as dir:
+            self.setFile([dir, 'dynamic', 'config.json'], '{"foo": "bar"}',
+                         mtime=100)
+
+            payload = self.run_dump_dynamic_config(
+                dir, 'dynamic/config.json', 'none')
+            self.assertTrue(payload['modified'])
+            self.assertEqual(payload['content'], '{"foo": "bar"}')
+            version = payload['version']
+
+            # Unchanged file
+            payload = self.run_dump_dynamic_config(
+                dir, 'dynamic/config.json', version)
+            self.assertEqual(payload, {'version': version, 'modified': False})
+
+            # Changed file
+            self.setFile([dir, 'dynamic', 'config.json'], '{"foo": "baz"}',
+                         mtime=200)
+            payload = self.run_dump_dynamic_config(
+                dir, 'dynamic/config.json', version)
+            self.assertTrue(payload['modified'])
+            self.assertEqual(payload['content'], '{"foo": "baz"}')
+            self.assertNotEqual(payload['version'], version)
@@ -0,0 +1,88 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import base64
+import json
+import os
+
+from .environment import CanaryTestCase
+
+
+class ScanDataBatchCanaryTestCase(CanaryTestCase):
+    def run_scan_data_batch(self, dir, files, expected_returncode=0):
+        arguments = []
+        for file in files:
+            with open(os.path.join(dir, file), 'rb') as f:
+                arguments.append(base64.standard_b64encode(f.read()).decode())
+
+        return self.run_cgi(dir, 'scan-data-batch', arguments,
+                            expected_returncode=expected_returncode)
+
+    def get_flavors(self, dir, scene='space', actor='SimpleRocket'):
+        actors_file = os.path.join(dir, 'dynamic', 'scenes', scene,
+                                   'actors.json')
+        return self.get_json_file_contents(actors_file)['actors'][actor]
+
+    def test_ok_multiple(self):
+        fixture1 = 'space-SimpleRocket-optimal.png'
+        fixture2 = 'space-SimpleRocket-90.png'
+        test_config = {'cgi:scan-data-batch': {'jobs': '2'}}
+        with self.prepared_environment(fixture1,
+                                       test_config=test_config) as dir:
+            self.add_fixture(fixture2, dir)
+
+            ret = self.run_scan_data_batch(dir, [fixture1, fixture2])
+
+            results = json.loads(ret['stdout'])
+            self.assertEqual(len(results), 2)
+            for result in results:
+                self.assertTrue(result['is_ok'])
+                self.assertEqual(result['command'], 'space')
+                self.assertEqual(result['parameters'], ['SimpleRocket'])
+
+            flavors = [result['payload']['flavor'] for result in results]
+            self.assertEqual(len(set(flavors)), 2)
+            self.assertEqual(sorted(self.get_flavors(dir)), sorted(flavors))
+
+    def test_ok_pdf(self):
+        fixture = 'space-SimpleRocket-optimal.pdf'
+        test_config = {'scan': {'permit_file_type_pdf': 'True'}}
+        with self.prepared_environment(fixture,
+                                       test_config=test_config) as dir:
+            ret = self.run_scan_data_batch(dir, [fixture])
+
+            results = json.loads(ret['stdout'])
+            self.assertEqual(len(results), 1)
+            self.assertTrue(results[0]['is_ok'])
+            self.assertEqual(self.get_flavors(dir),
+                             [results[0]['payload']['flavor']])
+
+    def test_partial_failure(self):
+        fixture1 = 'space-SimpleRocket-optimal.png'
+        fixture2 = 'space-SimpleRocket-optimal.pdf'
+        with self.prepared_environment(fixture1) as dir:
+            self.add_fixture(fixture2, dir)
+
+            ret = self.run_scan_data_batch(dir, [fixture1, fixture2])
+
+            results = json.loads(ret['stdout'])
+            self.assertEqual(len(results), 2)
+            self.assertTrue(results[0]['is_ok'])
+            self.assertFalse(results[1]['is_ok'])
+            self.assertEqual(results[1]['error_code'],
+                             'SE_SCAN_STATIC_UNREADABLE_IMAGE_TYPE')
+            self.assertEqual(self.get_flavors(dir),
+                             [results[0]['payload']['flavor']])
+
+    def test_fail_too_many_images(self):
+        fixture = 'space-SimpleRocket-optimal.png'
+        test_config = {'cgi:scan-data-batch': {'max_images': '1'}}
+        with self.prepared_environment(fixture,
+                                       test_config=test_config) as dir:
+            ret = self.run_scan_data_batch(dir, [fixture, fixture],
+                                           expected_returncode=1)
+
+            self.assertIn('SE_SCAN_BATCH_TOO_MANY_IMAGES', ret['stdout'])
+            self.assertFalse(os.path.exists(os.path.join(
+                dir, 'dynamic', 'scenes', 'space', 'actors', 'SimpleRocket')))
@@ -0,0 +1,95 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import sys
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium.scanner_camera import get_conversion_dpi, get_jpg_size, \
+    get_pdf_page_sizes, read_image
+from scanarium.scanner_util import get_scale_factor
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+FIXTURE_DIR = os.path.join(SCANARIUM_DIR_ABS, 'tests', 'fixtures')
+JPG_FILE = os.path.join(FIXTURE_DIR, 'space-SimpleRocket-optimal.jpg')
+PDF_FILE = os.path.join(FIXTURE_DIR, 'space-SimpleRocket-optimal.pdf')
+PNG_FILE = os.path.join(FIXTURE_DIR, 'space-SimpleRocket-optimal.png')
+
+
+class ScannerCameraTest(BasicTestCase):
+    def test_get_scale_factor_no_limits(self):
+        self.assertEqual(get_scale_factor(100, 200), 1)
+
+    def test_get_scale_factor_below_trip(self):
+        self.assertEqual(get_scale_factor(
+            100, 200, scaled_width=50, trip_width=300), 1)
+
+    def test_get_scale_factor_above_trip(self):
+        self.assertEqual(get_scale_factor(
+            100, 200, scaled_height=20, scaled_width=100), 0.2)
+
+    def test_get_jpg_size(self):
+        self.assertEqual(get_jpg_size(JPG_FILE), (595, 842))
+
+    def test_get_jpg_size_no_jpg(self):
+        self.assertIsNone(get_jpg_size(PNG_FILE))
+
+    def test_read_image_unscaled(self):
+        # The fixture is below the test environment's trip points
+        with self.prepared_environment() as dir:
+            scanarium = self.new_Scanarium(dir)
+
+            image = read_image(scanarium, JPG_FILE)
+
+            self.assertEqual(image.shape, (595, 842, 3))
+
+    def test_read_image_reduced(self):
+        test_config = {'scan': {
+                    'max_raw_width': '200',
+                    'max_raw_width_trip': '',
+                    }}
+        with self.prepared_environment(test_config=test_config) as dir:
+            scanarium = self.new_Scanarium(dir)
+
+            image = read_image(scanarium, JPG_FILE)
+
+            self.assertEqual(image.shape, (141, 200, 3))
+
+    def test_get_pdf_page_sizes(self):
+        sizes = get_pdf_page_sizes(PDF_FILE)
+
+        self.assertEqual(len(sizes), 1)
+        self.assertAlmostEqual(sizes[0][0], 594.917)
+        self.assertAlmostEqual(sizes[0][1], 841.883)
+
+    def test_get_conversion_dpi_unlimited(self):
+        test_config = {'scan': {
+                    'max_raw_width': '',
+                    'max_raw_height': '',
+                    'max_raw_width_trip': '',
+                    'max_raw_height_trip': '',
+                    }}
+        with self.prepared_environment(test_config=test_config) as dir:
+            scanarium = self.new_Scanarium(dir)
+
+            self.assertEqual(get_conversion_dpi(scanarium, PDF_FILE), 150)
+
+    def test_get_conversion_dpi_scaled(self):
+        with self.prepared_environment() as dir:
+            scanarium = self.new_Scanarium(dir)
+
+            # The page is 841.883pt wide, which is 1754 pixels at 150dpi.
+            # This is above the trip point, so it gets scaled to 1000 pixels.
+            self.assertEqual(get_conversion_dpi(scanarium, PDF_FILE), 86)
+
+    def test_get_conversion_dpi_no_pdf(self):
+        test_config = {'scan': {'max_raw_width': '100'}}
+        with self.prepared_environment(test_config=test_config) as dir:
+            scanarium = self.new_Scanarium(dir)
+
+            self.assertEqual(get_conversion_dpi(scanarium, JPG_FILE), 150)
@@ -0,0 +1,107 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import sys
+
+import cv2
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium.scanner_qr import decode_qr_codes, get_qr_variant_state, \
+    set_qr_variant_state
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+
+class ScannerQrDecodersTest(BasicTestCase):
+    def read_fixture(self, name):
+        return cv2.imread(self.get_fixture_file_name(name))
+
+    def assertDecodes(self, decoders, fixture, expected):
+        test_config = {'scan': {'qr_decoders': decoders}}
+        with self.prepared_environment(test_config=test_config) as dir:
+            scanarium = self.new_Scanarium(dir)
+            image = self.read_fixture(fixture)
+
+            qrs = scanarium.extract_qrs(image)
+
+        self.assertEqual([data for (rect, data) in qrs], expected)
+        return [rect for (rect, data) in qrs]
+
+    def test_opencv(self):
+        [rect] = self.assertDecodes('opencv', 'qr-foo.png', ['foo'])
+
+        self.assertRoughlyEqual(rect.left, 32, scale=5,
+                                allowed_deviation=1)
+        self.assertRoughlyEqual(rect.top, 420, scale=5,
+                                allowed_deviation=1)
+        self.assertRoughlyEqual(rect.width, 150, scale=5,
+                                allowed_deviation=1)
+        self.assertRoughlyEqual(rect.height, 150, scale=5,
+                                allowed_deviation=1)
+
+    def test_opencv_aruco(self):
+        self.assertDecodes('opencv-aruco', 'qr-foo.png', ['foo'])
+
+    def test_wechat(self):
+        self.assertDecodes('wechat', 'qr-foo.png', ['foo'])
+
+    def test_multiple_codes(self):
+        rects = self.assertDecodes('opencv-aruco', 'too-many-qrs.png',
+                                   ['space:SimpleRocket'] * 2)
+
+        self.assertLess(rects[0].top, rects[1].top)
+
+    def test_chain_falls_back(self):
+        with self.assertRaisesScanariumError('SE_SCAN_NO_QR_CODE'):
+            self.assertDecodes('opencv', 'space-SimpleRocket-10.png', [])
+
+        self.assertDecodes('opencv, opencv-aruco',
+                           'space-SimpleRocket-10.png',
+                           ['space:SimpleRocket'])
+
+    def test_adaptive_order(self):
+        set_qr_variant_state([])
+        self.assertDecodes('opencv, opencv-aruco',
+                           'space-SimpleRocket-10.png',
+                           ['space:SimpleRocket'])
+
+        self.assertEqual(get_qr_variant_state(),
+                         [[['opencv-aruco', 1.0], 1.0]])
+
+        # The successful decoder now gets tried first, even for images the
+        # first decoder in the chain could have decoded.
+        self.assertDecodes('opencv, opencv-aruco', 'qr-foo.png', ['foo'])
+        self.assertEqual(get_qr_variant_state(),
+                         [[['opencv-aruco', 1.0], 1.8]])
+
+    def test_adaptive_order_disabled(self):
+        set_qr_variant_state([])
+        test_config = {'scan': {'qr_decoders': 'opencv, opencv-aruco',
+                                'qr_variant_decay': ''}}
+        with self.prepared_environment(test_config=test_config) as dir:
+            scanarium = self.new_Scanarium(dir)
+            image = self.read_fixture('space-SimpleRocket-10.png')
+
+            scanarium.extract_qr(image)
+
+        self.assertEqual(get_qr_variant_state(), [])
+
+    def test_unknown_decoder(self):
+        with self.assertRaisesScanariumError('SE_QR_DECODER_UNKNOWN'):
+            self.assertDecodes('opencv, foo', 'qr-foo.png', ['foo'])
+
+    def test_explicit_decoders(self):
+        with self.prepared_environment() as dir:
+            scanarium = self.new_Scanarium(dir)
+            image = self.read_fixture('qr-foo.png')
+
+            (codes, scale_factor) = decode_qr_codes(
+                scanarium, image, ['opencv-aruco'])
+
+        self.assertEqual([code.data for code in codes], [b'foo'])
+        self.assertEqual(scale_factor, 1)
@@ -0,0 +1,73 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium.scanner_quality import check_image_quality
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+
+class ScannerQualityTest(BasicTestCase):
+    def read_fixture(self, name='space-SimpleRocket-optimal.png'):
+        return cv2.imread(self.get_fixture_file_name(name))
+
+    def check(self, image, test_config={}):
+        with self.prepared_environment(test_config=test_config) as dir:
+            scanarium = self.new_Scanarium(dir)
+            check_image_quality(scanarium, image)
+
+    def test_ok(self):
+        for fixture in ['space-SimpleRocket-optimal.png',
+                        'space-SimpleRocket-skew.png', 'only-qr.png',
+                        'too-many-qrs.png']:
+            self.check(self.read_fixture(fixture))
+
+    def test_ok_slightly_dark_and_blurry(self):
+        image = cv2.GaussianBlur(self.read_fixture(), (9, 9), 0)
+        image = (image * 0.3).astype(np.uint8)
+
+        self.check(image)
+
+    def test_too_dark(self):
+        image = (self.read_fixture() * 0.1).astype(np.uint8)
+
+        with self.assertRaisesScanariumError('SE_SCAN_IMAGE_TOO_DARK'):
+            self.check(image)
+
+    def test_too_dark_disabled(self):
+        image = (self.read_fixture() * 0.1).astype(np.uint8)
+
+        self.check(image, {'scan': {'quality_min_brightness': ''}})
+
+    def test_blank(self):
+        with self.assertRaisesScanariumError('SE_SCAN_NO_QR_CODE'):
+            self.check(self.read_fixture('blank-white.png'))
+
+    def test_too_blurry(self):
+        image = cv2.GaussianBlur(self.read_fixture(), (25, 25), 0)
+
+        with self.assertRaisesScanariumError('SE_SCAN_IMAGE_TOO_BLURRY'):
+            self.check(image)
+
+    def test_sheet_too_small(self):
+        image = np.full((2000, 3000, 3), 40, dtype=np.uint8)
+        image[:250, :350] = cv2.resize(self.read_fixture(), (350, 250))
+
+        with self.assertRaisesScanariumError('SE_SCAN_SHEET_TOO_SMALL'):
+            self.check(image)
+
+    def test_sheet_small_but_ok(self):
+        image = np.full((1800, 2400, 3), 40, dtype=np.uint8)
+        image[:595, :842] = self.read_fixture()
+
+        self.check(image)
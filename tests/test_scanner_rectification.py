@@ -0,0 +1,177 @@
+# This file is part of Scanarium https://scanarium.com/ and licensed under the
+# GNU Affero General Public License v3.0 (See LICENSE.md)
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+SCANARIUM_DIR_ABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCANARIUM_DIR_ABS)
+from scanarium.scanner_rectification import prepare_rectification, rectify, \
+    refine_corners
+del sys.path[0]
+
+
+from .environment import BasicTestCase
+
+FIXTURE_DIR = os.path.join(SCANARIUM_DIR_ABS, 'tests', 'fixtures')
+
+
+class ScannerRectificationTest(BasicTestCase):
+    # A big image (bigger than the size contours get found on) of a white
+    # sheet with a black frame on a dark background. Corners are at sub-pixel
+    # positions.
+    def new_sheet_image(self, corners):
+        image = np.full((2400, 3200, 3), 60, dtype=np.uint8)
+        center = corners.mean(axis=0)
+
+        def fill(factor, color):
+            points = center + (corners - center) * factor
+            cv2.fillPoly(image, [np.round(points * 16).astype(np.int32)],
+                         color, cv2.LINE_AA, shift=4)
+
+        fill(1, (255, 255, 255))
+        fill(0.9, (0, 0, 0))
+        fill(0.85, (255, 255, 255))
+        return image
+
+    def assertPointsClose(self, actual, expected, allowed_deviation):
+        def key(point):
+            return [round(coordinate / 100) for coordinate in point]
+
+        actual = sorted(actual.tolist(), key=key)
+        expected = sorted(expected.tolist(), key=key)
+        for (actual_point, expected_point) in zip(actual, expected):
+            for (a, e) in zip(actual_point, expected_point):
+                self.assertLessEqual(abs(a - e), allowed_deviation,
+                                     f'{actual} vs. {expected}')
+
+    def test_rectify_refines_on_full_resolution(self):
+        corners = np.array([[400.3, 300.6], [2800.7, 350.2],
+                            [2750.4, 2100.8], [450.9, 2050.3]])
+        image = self.new_sheet_image(corners)
+        with self.prepared_environment() as dir:
+            scanarium = self.new_Scanarium(dir)
+
+            points = rectify(scanarium, image, yield_only_points=True)
+
+        self.assertPointsClose(points, corners, 1)
+
+    def test_rectify_pyramid(self):
+        corners = np.array([[400.3, 300.6], [2800.7, 350.2],
+                            [2750.4, 2100.8], [450.9, 2050.3]])
+        image = self.new_sheet_image(corners)
+        test_config = {'scan': {'rectification_pyramid_heights': '300, 500'}}
+        with self.prepared_environment(test_config=test_config) as dir:
+            scanarium = self.new_Scanarium(dir)
+            prepared = prepare_rectification(scanarium, image)
+
+            points = rectify(scanarium, image, yield_only_points=True,
+                             prepared=prepared)
+
+        self.assertPointsClose(points, corners, 1)
+
+        # The coarsest level sufficed, so finer levels did not get analyzed
+        self.assertEqual([level['image'].shape[0]
+                          for level in prepared['levels']], [300, 500, 1000])
+        self.assertEqual(['analyses' in level for level in prepared['levels']],
+                         [True, False, False])
+
+    def test_rectify_pyramid_escalates(self):
+        image = cv2.imread(os.path.join(FIXTURE_DIR,
+                                        'space-SimpleRocket-skew.png'))
+        test_config = {'scan': {'rectification_pyramid_heights': '300'}}
+        with self.prepared_environment(test_config=test_config) as dir:
+            scanarium = self.new_Scanarium(dir)
+            prepared = prepare_rectification(scanarium, image)
+            # A point far outside of the sheet
+            required_points = [(image.shape[1] * 2, image.shape[0] * 2)]
+
+            with self.assertRaisesScanariumError('SE_SCAN_NO_APPROX'):
+                rectify(scanarium, image, decreasingArea=False,
+                        required_points=required_points, prepared=prepared)
+
+        self.assertEqual(['analyses' in level for level in prepared['levels']],
+                         [True, True])
+
+    def test_rectify_pyramid_escalates_if_contrasts_disagree(self):
+        corners = np.array([[400.3, 300.6], [2800.7, 350.2],
+                            [2750.4, 2100.8], [450.9, 2050.3]])
+        image = self.new_sheet_image(corners)
+        # At contrast 0.01, the image is too dark to find any rect.
+        test_config = {'scan': {
+            'rectification_pyramid_heights': '300, 500',
+            'contrasts': '1, 0.01',
+        }}
+        with self.prepared_environment(test_config=test_config) as dir:
+            scanarium = self.new_Scanarium(dir)
+            prepared = prepare_rectification(scanarium, image)
+
+            points = rectify(scanarium, image, yield_only_points=True,
+                             prepared=prepared)
+
+        self.assertPointsClose(points, corners, 1)
+        self.assertEqual(['analyses' in level for level in prepared['levels']],
+                         [True, True, True])
+
+    def test_rectify_pyramid_escalates_for_small_rects(self):
+        # The sheet covers only about 6% of the image
+        corners = np.array([[400.3, 300.6], [1200.7, 310.2],
+                            [1190.4, 880.8], [410.9, 870.3]])
+        image = self.new_sheet_image(corners)
+        test_config = {'scan': {'rectification_pyramid_heights': '300, 500'}}
+        with self.prepared_environment(test_config=test_config) as dir:
+            scanarium = self.new_Scanarium(dir)
+            prepared = prepare_rectification(scanarium, image)
+
+            points = rectify(scanarium, image, yield_only_points=True,
+                             prepared=prepared)
+
+        self.assertPointsClose(points, corners, 1)
+        self.assertEqual(['analyses' in level for level in prepared['levels']],
+                         [True, True, True])
+
+    def test_refine_corners_at_border(self):
+        # A black rect whose corners are only 1.5 pixels off the image's
+        # border.
+        image = np.full((2400, 3200), 255, dtype=np.uint8)
+        image[2:-2, 2:-2] = 0
+        corners = np.array([[1.5, 1.5], [3197.5, 1.5], [3197.5, 2397.5],
+                            [1.5, 2397.5]], dtype='float32')
+        with self.prepared_environment() as dir:
+            scanarium = self.new_Scanarium(dir)
+
+            points = refine_corners(scanarium, image, corners + 2,
+                                    scale_factor=0.5)
+
+        self.assertPointsClose(points, corners, 0.5)
+
+    def test_rectify_prepared(self):
+        image = cv2.imread(os.path.join(FIXTURE_DIR,
+                                        'space-SimpleRocket-skew.png'))
+        with self.prepared_environment() as dir:
+            scanarium = self.new_Scanarium(dir)
+
+            expected = rectify(scanarium, image, yield_only_points=True)
+
+            prepared = prepare_rectification(scanarium, image)
+            for i in range(2):
+                actual = rectify(scanarium, image, yield_only_points=True,
+                                 prepared=prepared)
+                self.assertEqual(actual.tolist(), expected.tolist())
+
+    def test_rectify_prepared_required_points(self):
+        image = cv2.imread(os.path.join(FIXTURE_DIR,
+                                        'space-SimpleRocket-skew.png'))
+        with self.prepared_environment() as dir:
+            scanarium = self.new_Scanarium(dir)
+            prepared = prepare_rectification(scanarium, image)
+            # A point far outside of the sheet
+            required_points = [(image.shape[1] * 2, image.shape[0] * 2)]
+
+            with self.assertRaisesScanariumError('SE_SCAN_NO_APPROX'):
+                rectify(scanarium, image, decreasingArea=False,
+                        required_points=required_points, prepared=prepared)